@@ -0,0 +1,318 @@
+import argparse
+import glob
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from run_report import cpu_time, max_rss_mb, peak_rss_mb, reset_peak_rss
+from synthetic_collection import generate_collection, tool_profiles
+
+report_columns = [
+    "n_genomes", "n_tools", "stage", "status", "items", "repeats", "seconds_min", "seconds_median",
+    "cpu_seconds", "peak_rss_mb", "peak_worker_rss_mb"
+    ]
+
+#parquet caches written by load_cached beside the project tables
+def remove_caches(project_path, pattern = "*.parquet"):
+    for directory in ["prophage_regions", "refseq_masher"]:
+        for path in glob.glob(os.path.join(project_path, directory, pattern)):
+            os.remove(path)
+
+##setup of each stage, run untimed before every repeat; returns the inputs of the timed step
+def setup_csv(project_path, options):
+    remove_caches(project_path)
+    return project_path
+
+def setup_cached(project_path, options):
+    from load_predictions import load_predictions
+    load_predictions(project_path)
+    return project_path
+
+def setup_metadata(project_path, options):
+    remove_caches(project_path, "*_genome_metadata.parquet")
+    return project_path
+
+def setup_predictions(project_path, options):
+    from load_predictions import load_predictions
+    return load_predictions(project_path)
+
+def setup_annotation(project_path, options):
+    from genome_metadata import load_genome_metadata
+    return setup_predictions(project_path, options), load_genome_metadata(project_path)
+
+def setup_figures(project_path, options):
+    setup_annotation(project_path, options)
+    outdir = os.path.join(options["scratch"], "figures")
+    shutil.rmtree(outdir, ignore_errors = True)
+    return project_path, outdir
+
+#raw tool outputs are only present in collections generated with --raw, None skips the stage
+def setup_parse(project_path, options):
+    predictions_dir = os.path.join(project_path, "prophage_predictions")
+    if not os.path.isdir(predictions_dir):
+        return None
+    regions_dir = os.path.join(options["scratch"], "prophage_regions")
+    shutil.rmtree(regions_dir, ignore_errors = True)
+    return predictions_dir, regions_dir
+
+##timed step of each stage, returning the number of rows, figures or genomes it produced
+def load_csv(project_path, options):
+    from load_predictions import load_predictions
+    return len(load_predictions(project_path))
+
+def load_metadata(project_path, options):
+    from genome_metadata import load_genome_metadata
+    return len(load_genome_metadata(project_path))
+
+def zero_fill_count(phage_predictions, options):
+    from count_predictions import count_predictions
+    return len(count_predictions(phage_predictions))
+
+def length_filter(phage_predictions, options):
+    from prediction_stats import log_length_bounds, log_length_bounds_by_tool, within_length_bounds
+    bounds = log_length_bounds(phage_predictions["length"], options["n_sigma"])
+    log_length_bounds_by_tool(phage_predictions, options["n_sigma"])
+    return len(within_length_bounds(phage_predictions, bounds))
+
+def annotate(inputs, options):
+    from prediction_stats import prediction_stats
+    return sum(len(table) for table in prediction_stats(*inputs).values())
+
+def correlate(phage_predictions, options):
+    from tool_correlation import count_matrix, mean_length_matrix, tool_correlations
+    n = 0
+    for wide in [count_matrix(phage_predictions), mean_length_matrix(phage_predictions)]:
+        n += len(tool_correlations(wide, n_boot = options["n_boot"])[0])
+    return n
+
+def render(inputs, options):
+    from render_figures import render_figures
+    project_path, outdir = inputs
+    return len(render_figures(project_path, outdir, options["format"], options["dpi"], options["workers"]))
+
+def parse(inputs, options):
+    from parse_predictions import parse_predictions
+    predictions_dir, regions_dir = inputs
+    return len(parse_predictions(predictions_dir, regions_dir, options["workers"], rebuild = True))
+
+#benchmark stages in the order they run in an analysis, as (setup, timed step)
+stages = {
+    "parse": (setup_parse, parse),
+    "load_csv": (setup_csv, load_csv),
+    "load_cached": (setup_cached, load_csv),
+    "load_metadata": (setup_metadata, load_metadata),
+    "count": (setup_predictions, zero_fill_count),
+    "length_filter": (setup_predictions, length_filter),
+    "annotate": (setup_annotation, annotate),
+    "correlation": (setup_predictions, correlate),
+    "figures": (setup_figures, render)
+    }
+
+#run one stage repeats times in a fresh process, so that its peak memory is its own
+#the peak of the timed step includes its inputs held in memory, which is the memory needed to run it
+def run_stage(stage, project_path, options, repeats):
+    warnings.simplefilter("ignore")
+    setup, step = stages[stage]
+    seconds, cpu_seconds, peaks, items = [], [], [], None
+    for _ in range(repeats):
+        inputs = setup(project_path, options)
+        if inputs is None:
+            return {"status": "skipped"}
+        reset_peak_rss()
+        start, start_cpu = time.perf_counter(), cpu_time()
+        items = step(inputs, options)
+        seconds.append(time.perf_counter() - start)
+        cpu_seconds.append(cpu_time() - start_cpu)
+        peaks.append(peak_rss_mb())
+        del inputs
+    return {
+        "status": "ok",
+        "items": items,
+        "repeats": repeats,
+        "seconds_min": min(seconds),
+        "seconds_median": statistics.median(seconds),
+        "cpu_seconds": statistics.median(cpu_seconds),
+        "peak_rss_mb": max(peaks),
+        "peak_worker_rss_mb": max_rss_mb(resource.RUSAGE_CHILDREN)
+        }
+
+#a stage that runs out of memory kills its process, which is recorded rather than ending the benchmark
+def benchmark_stage(stage, project_path, options, repeats):
+    with ProcessPoolExecutor(max_workers = 1, mp_context = multiprocessing.get_context("spawn")) as executor:
+        try:
+            return executor.submit(run_stage, stage, project_path, options, repeats).result()
+        except BrokenProcessPool:
+            return {"status": "killed"}
+        except Exception as error:
+            return {"status": f"failed: {error!r}"}
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "-C", os.path.dirname(os.path.abspath(__file__)), "describe", "--always", "--dirty"],
+            capture_output = True, text = True, check = True
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+#versions, machine and options that the timings depend on
+def report_metadata(options):
+    from run_predictions import total_memory_gb
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "packages": {
+            package: importlib.import_module(package).__version__
+            for package in ["numpy", "pandas", "pyarrow", "scipy", "matplotlib", "seaborn"]
+            },
+        "host": {
+            "machine": platform.machine(),
+            "system": platform.system(),
+            "cpus": os.cpu_count(),
+            "memory_gb": round(total_memory_gb(), 1)
+            },
+        "options": {key: value for key, value in options.items() if key != "scratch"}
+        }
+
+#generate a collection of each size and time every stage on it, writing the report after each stage
+#so that a run that is stopped at a large size still leaves the smaller results
+def run_benchmark(sizes, workdir, report_path, selected = list(stages), tools = list(tool_profiles),
+        repeats = 3, raw = False, seed = 0, options = None):
+    options = {"n_boot": 200, "n_sigma": 2, "format": "png", "dpi": 100, "workers": None, **(options or {})}
+    report = {**report_metadata(options), "results": []}
+    for n_genomes in sizes:
+        project_path = os.path.join(workdir, f"collection_{n_genomes}")
+        start = time.perf_counter()
+        generate_collection(project_path, n_genomes, tools, seed, raw)
+        print(f"collection of {n_genomes} genomes ready in {time.perf_counter() - start:.1f} s")
+        options["scratch"] = os.path.join(workdir, f"scratch_{n_genomes}")
+        for stage in [stage for stage in stages if stage in selected]:
+            result = {
+                "n_genomes": n_genomes,
+                "n_tools": len(tools),
+                "stage": stage,
+                **benchmark_stage(stage, project_path, options, repeats)
+                }
+            report["results"].append(result)
+            write_report(report, report_path)
+            if result["status"] == "ok":
+                print(
+                    f"{n_genomes}\t{stage}\t{result['seconds_min']:.3f} s\t{result['cpu_seconds']:.3f} s cpu\t"
+                    f"{result['peak_rss_mb']:.0f} MB"
+                    )
+            else:
+                print(f"{n_genomes}\t{stage}\t{result['status']}")
+        shutil.rmtree(options["scratch"], ignore_errors = True)
+    return report
+
+#json report with the metadata and a tsv of the same results for spreadsheets and R
+def write_report(report, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+    with open(path + ".temp", "w") as handle:
+        json.dump(report, handle, indent = 1)
+    os.replace(path + ".temp", path)
+    pd.DataFrame(report["results"]).reindex(columns = report_columns)\
+        .to_csv(os.path.splitext(path)[0] + ".tsv", sep = "\t", index = False, float_format = "%.6g")
+
+def read_results(path):
+    with open(path) as handle:
+        return pd.DataFrame(json.load(handle)["results"]).reindex(columns = report_columns)
+
+#time and peak memory of each stage and size relative to a baseline report
+#a stage has regressed when it fails, or is slower or needs more memory by more than tolerance and by more than
+#min_seconds or min_mb, which ignore timer noise and interpreter overhead
+def compare_reports(baseline_path, current_path, tolerance = 0.2, min_seconds = 0.05, min_mb = 50):
+    keys = ["n_genomes", "stage"]
+    baseline = read_results(baseline_path).query("status == 'ok'")
+    current = read_results(current_path)
+    comparison = current[keys + ["status", "seconds_min", "peak_rss_mb"]]\
+        .merge(
+            baseline[keys + ["seconds_min", "peak_rss_mb"]],
+            on = keys, how = "left", suffixes = ("", "_baseline")
+            )
+    comparison["time_ratio"] = comparison["seconds_min"] / comparison["seconds_min_baseline"]
+    comparison["memory_ratio"] = comparison["peak_rss_mb"] / comparison["peak_rss_mb_baseline"]
+    failed = (comparison["status"] != "ok") & comparison["seconds_min_baseline"].notna()
+    slower = (comparison["time_ratio"] > 1 + tolerance) \
+        & (comparison["seconds_min"] - comparison["seconds_min_baseline"] > min_seconds)
+    larger = (comparison["memory_ratio"] > 1 + tolerance) \
+        & (comparison["peak_rss_mb"] - comparison["peak_rss_mb_baseline"] > min_mb)
+    comparison["regressed"] = failed | slower | larger
+    return comparison
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description = "Time the analysis stages on synthetic collections of increasing size and compare reports"
+        )
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+
+    run_parser = subparsers.add_parser("run", help = "generate collections and time every stage on each")
+    run_parser.add_argument(
+        "-n", "--sizes", nargs = "+", type = int, default = [1000, 10000],
+        help = "numbers of genomes, e.g. 1000 10000 100000 1000000 (default 1000 10000)"
+        )
+    run_parser.add_argument(
+        "-w", "--workdir", default = "benchmark",
+        help = "directory for the collections, which are reused while their parameters are unchanged (default benchmark/)"
+        )
+    run_parser.add_argument(
+        "-o", "--output", default = None,
+        help = "json report to write, with a tsv of the results beside it (default <workdir>/benchmark_report.json)"
+        )
+    run_parser.add_argument(
+        "-s", "--stages", nargs = "+", choices = list(stages), default = list(stages), help = "stages to time (default all)"
+        )
+    run_parser.add_argument(
+        "-t", "--tools", nargs = "+", choices = list(tool_profiles), default = list(tool_profiles),
+        help = "prediction tools in the collections (default all)"
+        )
+    run_parser.add_argument("-r", "--repeats", type = int, default = 3, help = "timed runs per stage (default 3)")
+    run_parser.add_argument(
+        "--raw", action = "store_true", help = "also generate raw tool outputs, needed for the parse stage"
+        )
+    run_parser.add_argument("--seed", type = int, default = 0, help = "random seed of the collections (default 0)")
+    run_parser.add_argument("-b", "--n-boot", type = int, default = 200, help = "correlation bootstrap resamples (default 200)")
+    run_parser.add_argument("-d", "--dpi", type = int, default = 100, help = "figure resolution (default 100)")
+    run_parser.add_argument("--workers", type = int, default = None, help = "worker processes for parsing and figures")
+
+    compare_parser = subparsers.add_parser("compare", help = "compare a report against a baseline report")
+    compare_parser.add_argument("baseline", help = "baseline json report")
+    compare_parser.add_argument("current", help = "json report to check")
+    compare_parser.add_argument(
+        "--tolerance", type = float, default = 0.2, help = "fraction slower or larger that counts as a regression (default 0.2)"
+        )
+    compare_parser.add_argument(
+        "--min-seconds", type = float, default = 0.05, help = "smallest slowdown in seconds that counts (default 0.05)"
+        )
+    compare_parser.add_argument(
+        "--min-mb", type = float, default = 50, help = "smallest growth of peak memory in MB that counts (default 50)"
+        )
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report_path = args.output or os.path.join(args.workdir, "benchmark_report.json")
+        run_benchmark(
+            args.sizes, args.workdir, report_path, args.stages, args.tools, args.repeats, args.raw, args.seed,
+            {"n_boot": args.n_boot, "dpi": args.dpi, "workers": args.workers}
+            )
+        print(f"report written to {report_path}")
+    else:
+        comparison = compare_reports(args.baseline, args.current, args.tolerance, args.min_seconds, args.min_mb)
+        print(comparison.to_string(index = False, float_format = "%.3f"))
+        regressed = comparison[comparison["regressed"]]
+        if len(regressed):
+            raise SystemExit(f"ERROR: {len(regressed)} stages regressed against {args.baseline}")
+        print(f"no regressions against {args.baseline}")
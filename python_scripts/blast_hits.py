@@ -0,0 +1,147 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from load_predictions import load_cached
+
+#columns of the blastn -outfmt "10 ..." tables written by prophage_blast.sh, with compact dtypes
+blast_dtypes = {
+    "qseqid": "category",
+    "sseqid": "category",
+    "pident": "float32",
+    "length": "int32",
+    "mismatch": "int32",
+    "gapopen": "int32",
+    "qstart": "int32",
+    "qend": "int32",
+    "sstart": "int32",
+    "send": "int32",
+    "evalue": "float64",
+    "bitscore": "float32",
+    "gaps": "int32"
+    }
+
+pair_columns = [
+    "qseqid", "sseqid", "n_hits", "aligned_length", "identity", "bitscore", "max_bitscore", "evalue",
+    "qcov_bases", "scov_bases", "qlen", "slen", "qcov", "scov"
+    ]
+
+#blastn writes an empty table for queries without hits
+def read_hits(path):
+    if os.path.getsize(path) == 0:
+        return pd.DataFrame({column: pd.Series(dtype = dtype) for column, dtype in blast_dtypes.items()})
+    return pd.read_csv(path, header = None, names = list(blast_dtypes), dtype = blast_dtypes, engine = "pyarrow")
+
+#hits of every alignment table in one frame, through a parquet cache per table
+#categories are unioned so that query and subject codes are shared across tables
+def load_hits(paths):
+    frames = [load_cached(path, read_hits).astype(blast_dtypes) for path in paths]
+    if not frames:
+        return read_hits(os.devnull)
+    for column in ["qseqid", "sseqid"]:
+        categories = pd.api.types.union_categoricals([frame[column] for frame in frames]).categories
+        for frame in frames:
+            frame[column] = frame[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index = True)
+
+#sequence lengths from _count.tsv files, name and length per line
+#headers written by the earlier awk version (">name description") are reduced to the name
+def read_lengths(paths):
+    lengths = {}
+    for path in paths:
+        table = pd.read_csv(path, sep = "\t", header = None, names = ["name", "length"], dtype = {"name": str})
+        names = table["name"].str.lstrip(">").str.split(n = 1).str[0]
+        lengths.update(zip(names, table["length"].astype(np.int64)))
+    return pd.Series(lengths, dtype = np.int64)
+
+#bases covered by the union of the intervals of each group
+#starts and ends are 1-based inclusive and sorted by group then start, group_starts are the first row of each group
+#a running maximum of end, offset by group so that it resets at every group, gives the furthest base covered so far
+def union_lengths(groups, starts, ends, group_starts):
+    span = np.int64(ends.max()) + 1
+    covered = np.maximum.accumulate(groups * span + ends) - groups * span
+    previous = np.empty_like(covered)
+    previous[0] = 0
+    previous[1:] = covered[:-1]
+    previous[group_starts] = 0
+    added = np.maximum(0, ends - np.maximum(starts - 1, previous))
+    return np.add.reduceat(added, group_starts)
+
+#one row per query and subject pair: hit count, aligned length, identity weighted by alignment length,
+#summed and best bitscore, best evalue, and bases of query and subject covered by the union of all hits
+#coverage fractions are filled in where lengths are given
+def pair_coverage(hits, lengths = None):
+    if hits.empty:
+        return pd.DataFrame(columns = pair_columns)
+    n_subjects = len(hits["sseqid"].cat.categories)
+    pair = hits["qseqid"].cat.codes.to_numpy().astype(np.int64) * n_subjects \
+        + hits["sseqid"].cat.codes.to_numpy()
+    qstart, qend = hits["qstart"].to_numpy(np.int64), hits["qend"].to_numpy(np.int64)
+    sstart, send = hits["sstart"].to_numpy(np.int64), hits["send"].to_numpy(np.int64)
+    qlow, qhigh = np.minimum(qstart, qend), np.maximum(qstart, qend)
+    slow, shigh = np.minimum(sstart, send), np.maximum(sstart, send)
+
+    #sorts on one int64 key of pair then start, which is several times faster than lexsort
+    order = np.argsort(pair * (qhigh.max() + 1) + qlow)
+    pair_sorted = pair[order]
+    group_starts = np.flatnonzero(np.diff(pair_sorted, prepend = -1))
+    groups = np.cumsum(np.diff(pair_sorted, prepend = -1) != 0) - 1
+    qcov_bases = union_lengths(groups, qlow[order], qhigh[order], group_starts)
+    subject_order = order[np.argsort(groups * (shigh.max() + 1) + slow[order])]
+    scov_bases = union_lengths(groups, slow[subject_order], shigh[subject_order], group_starts)
+
+    length = hits["length"].to_numpy(np.int64)[order]
+    identity = hits["pident"].to_numpy(np.float64)[order] * length
+    bitscore = hits["bitscore"].to_numpy(np.float64)[order]
+    query_codes, subject_codes = np.divmod(pair_sorted[group_starts], n_subjects)
+    queries, subjects = hits["qseqid"].cat.categories, hits["sseqid"].cat.categories
+    pairs = pd.DataFrame({
+        "qseqid": pd.Categorical.from_codes(query_codes, queries),
+        "sseqid": pd.Categorical.from_codes(subject_codes, subjects),
+        "n_hits": np.diff(np.append(group_starts, len(order))).astype(np.int32),
+        "aligned_length": np.add.reduceat(length, group_starts),
+        "identity": np.add.reduceat(identity, group_starts) / np.add.reduceat(length, group_starts),
+        "bitscore": np.add.reduceat(bitscore, group_starts),
+        "max_bitscore": np.maximum.reduceat(bitscore, group_starts),
+        "evalue": np.minimum.reduceat(hits["evalue"].to_numpy()[order], group_starts),
+        "qcov_bases": qcov_bases,
+        "scov_bases": scov_bases
+        })
+    #lengths are looked up once per category rather than once per pair
+    lengths = (lengths if lengths is not None else pd.Series(dtype = np.int64)).astype("Int64")
+    pairs["qlen"] = lengths.reindex(queries).array.take(query_codes)
+    pairs["slen"] = lengths.reindex(subjects).array.take(subject_codes)
+    pairs["qcov"] = (pairs["qcov_bases"] / pairs["qlen"]).astype("Float64")
+    pairs["scov"] = (pairs["scov_bases"] / pairs["slen"]).astype("Float64")
+    return pairs[pair_columns]
+
+#best subject of each query by summed bitscore, then query coverage
+def best_hits(pairs):
+    return pairs\
+        .sort_values(["bitscore", "qcov_bases"], ascending = False, kind = "stable")\
+        .drop_duplicates("qseqid")\
+        .sort_values("qseqid")\
+        .reset_index(drop = True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description = "Load blastn alignment tables and summarise coverage and identity per query and subject"
+        )
+    parser.add_argument("alignments", nargs = "+", help = "<query>_align.csv tables written by prophage_blast.sh")
+    parser.add_argument(
+        "-l", "--lengths", nargs = "+", default = [],
+        help = "_count.tsv sequence length tables of the queries and subjects"
+        )
+    parser.add_argument("-o", "--output", default = "blast_pairs.tsv", help = "per pair table to write (default blast_pairs.tsv)")
+    parser.add_argument("-b", "--best", default = None, help = "also write the best subject of each query to this tsv")
+    args = parser.parse_args()
+
+    hits = load_hits(args.alignments)
+    pairs = pair_coverage(hits, read_lengths(args.lengths))
+    pairs.to_csv(args.output, sep = "\t", index = False, float_format = "%.6g")
+    print(f"{len(hits)} hits summarised into {len(pairs)} query subject pairs in {args.output}")
+    if args.best:
+        best_hits(pairs).to_csv(args.best, sep = "\t", index = False, float_format = "%.6g")
+        print(f"best hit of each query written to {args.best}")
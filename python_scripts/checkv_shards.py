@@ -0,0 +1,205 @@
+import argparse
+import glob
+import heapq
+import os
+import re
+import shlex
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from fasta_index import load_index, open_fasta, record_name, record_spans
+from load_predictions import load_predictions
+
+#headers written by extract_regions.py, which give the coordinates to join quality back onto predictions
+region_header = re.compile(r"^(?P<genome>[^:]+):(?P<contig>.+):(?P<start>\d+)-(?P<end>\d+)$")
+merged_name = re.compile(r"^merged_(?P<genome>.+)_prophage_regions\.fna$")
+
+#columns of checkv quality_summary.tsv added to the predictions
+quality_columns = ["checkv_quality", "miuvig_quality", "completeness", "contamination", "provirus", "warnings"]
+
+#region fastas of a project: the extracted regions if present, otherwise every genome's merged tool predictions
+def find_region_fastas(regions_dir):
+    extracted = os.path.join(regions_dir, "prophage_sequences.fna")
+    if os.path.exists(extracted):
+        return [extracted]
+    return sorted(glob.glob(os.path.join(regions_dir, "*", "merged_*_prophage_regions.fna")))
+
+#genome of a record, from an extracted region header or the merged fasta it came from
+def record_genome(name, path):
+    match = region_header.match(name) or merged_name.match(os.path.basename(path))
+    return match.group("genome") if match else None
+
+#every record of the inputs as (length, name, genome, path, byte span), lengths from the fasta index
+def pool_records(paths):
+    records = []
+    for path in paths:
+        index = load_index(path)
+        data = open_fasta(path)
+        if data is None:
+            continue
+        try:
+            for header, start, end in record_spans(data):
+                name = record_name(data, header, start)
+                records.append((index[name][0], name, record_genome(name, path), path, header, end))
+        finally:
+            data.close()
+    return records
+
+#longest processing time first: each record, longest first, goes to the shard with the least sequence so far
+def balance_shards(records, n_shards):
+    heap = [(0, shard) for shard in range(n_shards)]
+    shards = [[] for _ in range(n_shards)]
+    for record in sorted(records, key = lambda record: (-record[0], record[1])):
+        total, shard = heapq.heappop(heap)
+        shards[shard].append(record)
+        heapq.heappush(heap, (total + record[0], shard))
+    return [shard for shard in shards if shard]
+
+def shard_dir(work_dir, shard):
+    return os.path.join(work_dir, f"shard_{shard}")
+
+#write a shard fasta, leaving an unchanged one untouched so that its finished checkv run is reused
+def write_shard(path, records):
+    maps = {}
+    chunks = []
+    try:
+        for length, name, genome, source, header, end in sorted(records, key = lambda record: (record[3], record[4])):
+            if source not in maps:
+                maps[source] = open_fasta(source)
+            record = maps[source][header:end]
+            chunks.append(record if record.endswith(b"\n") else record + b"\n")
+    finally:
+        for data in maps.values():
+            data.close()
+    content = b"".join(chunks)
+    if os.path.exists(path):
+        with open(path, "rb") as handle:
+            if handle.read() == content:
+                return False
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path + ".temp", "wb") as handle:
+        handle.write(content)
+    os.replace(path + ".temp", path)
+    return True
+
+def quality_path(work_dir, shard):
+    return os.path.join(shard_dir(work_dir, shard), "checkv", "quality_summary.tsv")
+
+def shard_is_done(work_dir, shard):
+    fasta = os.path.join(shard_dir(work_dir, shard), "shard.fna")
+    summary = quality_path(work_dir, shard)
+    return os.path.exists(summary) and os.path.getmtime(summary) >= os.path.getmtime(fasta)
+
+def checkv_command(work_dir, shard, database, threads, conda = False):
+    command = [
+        "checkv", "end_to_end",
+        os.path.join(shard_dir(work_dir, shard), "shard.fna"),
+        os.path.join(shard_dir(work_dir, shard), "checkv"),
+        "-t", str(threads),
+        "-d", database
+        ]
+    if conda:
+        command = ["conda", "run", "--no-capture-output", "-n", "checkv"] + command
+    return command
+
+def run_shard(work_dir, shard, database, threads, conda = False):
+    log = os.path.join(shard_dir(work_dir, shard), "checkv.log")
+    command = checkv_command(work_dir, shard, database, threads, conda)
+    with open(log, "w") as handle:
+        handle.write(f"#{shlex.join(command)}\n")
+        handle.flush()
+        returncode = subprocess.run(command, stdout = handle, stderr = subprocess.STDOUT).returncode
+    return shard, returncode
+
+#pool the region fastas into balanced shards, one per concurrent checkv run within the core budget, and run
+#the shards that are new or changed; returns the records and the shards that failed
+def run_checkv_shards(paths, work_dir, database, cores, threads = 4, conda = False):
+    records = pool_records(paths)
+    n_shards = max(1, min(len(records), cores // threads))
+    shards = balance_shards(records, n_shards)
+    for shard, shard_records in enumerate(shards):
+        write_shard(os.path.join(shard_dir(work_dir, shard), "shard.fna"), shard_records)
+    pending = [shard for shard in range(len(shards)) if not shard_is_done(work_dir, shard)]
+    print(f"{len(records)} regions in {len(shards)} shards, {len(pending)} to run with {cores // len(shards)} threads each")
+    failed = []
+    with ThreadPoolExecutor(max_workers = len(shards) or 1) as executor:
+        for shard, returncode in executor.map(
+                lambda shard: run_shard(work_dir, shard, database, max(1, cores // len(shards)), conda), pending
+                ):
+            if returncode == 0:
+                print(f"finished checkv shard {shard}")
+            else:
+                print(f"ERROR: checkv shard {shard} exited with {returncode}, see {shard_dir(work_dir, shard)}/checkv.log")
+                failed.append(shard)
+    return records, range(len(shards)), failed
+
+#quality summaries of all shards, with the genome of each region
+def read_quality(work_dir, shards, records):
+    genomes = {name: genome for length, name, genome, path, header, end in records}
+    frames = [
+        pd.read_csv(quality_path(work_dir, shard), sep = "\t")
+        for shard in shards if os.path.exists(quality_path(work_dir, shard))
+        ]
+    if not frames:
+        return pd.DataFrame(columns = ["genome", "contig_id"])
+    quality = pd.concat(frames, ignore_index = True)
+    quality.insert(0, "genome", quality["contig_id"].map(genomes))
+    return quality.sort_values(["genome", "contig_id"], kind = "stable").reset_index(drop = True)
+
+#per genome quality_summary.tsv in prophage_regions/<genome>/merged_<genome>_checkv/, as the per genome runs wrote
+def write_genome_quality(quality, regions_dir):
+    for genome, table in quality.groupby("genome", sort = True):
+        outdir = os.path.join(regions_dir, genome, f"merged_{genome}_checkv")
+        os.makedirs(outdir, exist_ok = True)
+        table.drop(columns = "genome").to_csv(os.path.join(outdir, "quality_summary.tsv"), sep = "\t", index = False)
+
+#checkv columns on each prediction, by the coordinates in the extracted region headers
+#predictions of regions that were not extracted or not assessed are left empty
+def join_quality(phage_predictions, quality):
+    coordinates = quality["contig_id"].astype(str).str.extract(region_header)
+    #load_predictions removes the _contigs suffix that the extracted headers keep
+    coordinates["genome"] = coordinates["genome"].str.replace("_contigs", "", regex = False)
+    quality = pd.concat([coordinates, quality.reindex(columns = quality_columns)], axis = 1)\
+        .dropna(subset = ["contig"])\
+        .astype({"start": "int32", "end": "int32"})\
+        .rename(columns = {"start": "prophage_start", "end": "prophage_end"})
+    keys = ["genome", "contig", "prophage_start", "prophage_end"]
+    joined = phage_predictions.astype({"genome": str, "contig": str})\
+        .merge(quality, on = keys, how = "left")
+    return joined.astype({"genome": "category", "contig": "category"})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description = "Run CheckV on prophage regions pooled from all genomes in balanced concurrent shards"
+        )
+    parser.add_argument("project_path", help = "project directory containing prophage_regions/")
+    parser.add_argument("-d", "--db", required = True, help = "CheckV database directory")
+    parser.add_argument(
+        "-i", "--input", nargs = "+", default = None,
+        help = "region fastas (default prophage_regions/prophage_sequences.fna, else every merged_*_prophage_regions.fna)"
+        )
+    parser.add_argument("-c", "--cores", type = int, default = os.cpu_count(), help = "total cores to use (default all)")
+    parser.add_argument("-t", "--threads", type = int, default = 4, help = "threads per shard, sets the number of shards (default 4)")
+    parser.add_argument("--conda", action = "store_true", help = "run checkv in its conda env with conda run")
+    args = parser.parse_args()
+
+    regions_dir = os.path.join(os.path.expanduser(args.project_path), "prophage_regions")
+    work_dir = os.path.join(regions_dir, "checkv_shards")
+    paths = args.input or find_region_fastas(regions_dir)
+    if not paths:
+        parser.error(f"no region fastas found in {regions_dir}")
+    records, shards, failed = run_checkv_shards(paths, work_dir, args.db, args.cores, args.threads, args.conda)
+
+    quality = read_quality(work_dir, shards, records)
+    quality.to_csv(os.path.join(regions_dir, "checkv_quality_summary.tsv"), sep = "\t", index = False)
+    write_genome_quality(quality, regions_dir)
+    joined = join_quality(load_predictions(args.project_path), quality)
+    joined.to_csv(os.path.join(regions_dir, "checkv_predictions_summary.csv"), index = False)
+    print(
+        f"checkv quality of {len(quality)} regions joined onto {joined['checkv_quality'].notna().sum()} of "
+        f"{len(joined)} predictions in {regions_dir}/checkv_predictions_summary.csv"
+        )
+    if failed:
+        raise SystemExit(f"ERROR: {len(failed)} checkv shards failed")
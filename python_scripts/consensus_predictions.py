@@ -0,0 +1,102 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+from load_predictions import load_predictions
+
+consensus_columns = [
+    "contig", "prophage_start", "prophage_end", "genome", "length",
+    "prophage_start_max", "prophage_end_min",
+    "supporting_tools", "support_count", "n_predictions"
+    ]
+
+#reciprocal overlap of two 1-based inclusive intervals, as a fraction of the longer one
+def reciprocal_overlap(start_a, end_a, start_b, end_b):
+    overlap = min(end_a, end_b) - max(start_a, start_b) + 1
+    return overlap / max(end_a - start_a + 1, end_b - start_b + 1)
+
+#assign a cluster id to each interval, sorted by contig key then start
+#clusters first split wherever an interval does not overlap anything before it on the contig, then
+#overlapping runs are swept greedily against the running cluster bounds when min_overlap > 0
+def assign_clusters(contig_codes, starts, ends, min_overlap = 0.5):
+    n = len(starts)
+    breaks = np.ones(n, dtype = bool)
+    if n == 0:
+        return np.zeros(0, dtype = np.int64)
+    reach = pd.Series(ends).groupby(contig_codes).cummax().to_numpy()
+    breaks[1:] = (contig_codes[1:] != contig_codes[:-1]) | (starts[1:] > reach[:-1])
+    if min_overlap > 0:
+        component_starts = np.flatnonzero(breaks)
+        sizes = np.diff(np.append(component_starts, n))
+        start_list, end_list = starts.tolist(), ends.tolist()
+        for first, size in zip(component_starts[sizes > 1].tolist(), sizes[sizes > 1].tolist()):
+            cluster_start, cluster_end = start_list[first], end_list[first]
+            for i in range(first + 1, first + size):
+                if reciprocal_overlap(cluster_start, cluster_end, start_list[i], end_list[i]) >= min_overlap:
+                    cluster_end = max(cluster_end, end_list[i])
+                else:
+                    breaks[i] = True
+                    cluster_start, cluster_end = start_list[i], end_list[i]
+    return np.cumsum(breaks) - 1
+
+#merge overlapping predictions across tools into consensus regions per genome and contig
+def consensus_predictions(phage_predictions, min_overlap = 0.5):
+    phage_predictions = phage_predictions.sort_values(
+        ["genome", "contig", "prophage_start", "prophage_end"]
+        )
+    genome = phage_predictions["genome"].astype("category")
+    contig = phage_predictions["contig"].astype("category")
+    tool = phage_predictions["prediction_tool"].astype("category")
+    contig_codes = genome.cat.codes.to_numpy().astype(np.int64) * len(contig.cat.categories) \
+        + contig.cat.codes.to_numpy()
+    starts = phage_predictions["prophage_start"].to_numpy(dtype = np.int64)
+    ends = phage_predictions["prophage_end"].to_numpy(dtype = np.int64)
+
+    clusters = assign_clusters(contig_codes, starts, ends, min_overlap)
+    first = np.flatnonzero(np.diff(clusters, prepend = -1))
+    #an empty table has no clusters, and so no last rows
+    last = np.append(first[1:], len(clusters)) - 1 if len(first) else first
+
+    #supporting tools as a bitmask of tool category codes, decoded once per distinct combination
+    tool_mask = np.left_shift(1, tool.cat.codes.to_numpy().astype(np.int64))
+    cluster_mask = np.bitwise_or.reduceat(tool_mask, first) if len(first) else tool_mask
+    tool_names = np.asarray(tool.cat.categories)
+    mask_values, mask_index = np.unique(cluster_mask, return_inverse = True)
+    mask_tools = [
+        ";".join(sorted(tool_names[(mask >> np.arange(len(tool_names))) & 1 == 1], key = str.lower))
+        for mask in mask_values
+        ]
+    mask_counts = [bin(mask).count("1") for mask in mask_values]
+
+    consensus_start = starts[first]
+    consensus_end = np.maximum.reduceat(ends, first) if len(first) else ends
+    return pd.DataFrame({
+        "contig": contig.iloc[first].to_numpy(),
+        "prophage_start": consensus_start.astype(np.int32),
+        "prophage_end": consensus_end.astype(np.int32),
+        "genome": genome.iloc[first].to_numpy(),
+        "length": (consensus_end - consensus_start + 1).astype(np.int32),
+        "prophage_start_max": starts[last].astype(np.int32),
+        "prophage_end_min": (np.minimum.reduceat(ends, first) if len(first) else ends).astype(np.int32),
+        "supporting_tools": pd.Categorical(np.asarray(mask_tools, dtype = object)[mask_index]),
+        "support_count": np.asarray(mask_counts, dtype = np.int8)[mask_index],
+        "n_predictions": (last - first + 1).astype(np.int32)
+        }, columns = consensus_columns)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description = "Merge overlapping prophage predictions across tools into consensus regions"
+        )
+    parser.add_argument("project_path", help = "project directory containing prophage_regions/")
+    parser.add_argument(
+        "-m", "--min-overlap", type = float, default = 0.5,
+        help = "minimum reciprocal overlap for predictions to be merged, 0 merges any overlap (default 0.5)"
+        )
+    args = parser.parse_args()
+    consensus = consensus_predictions(load_predictions(args.project_path), args.min_overlap)
+    output_path = os.path.join(
+        os.path.expanduser(args.project_path), "prophage_regions", "consensus_predictions_summary.csv"
+        )
+    consensus.to_csv(output_path, index = False)
+    print(f"{len(consensus)} consensus prophage regions written to {output_path}")
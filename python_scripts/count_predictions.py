@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+#count predictions for every genome x prediction tool combination, including those with n = 0
+#genomes and tools are taken from the categories of the predictions frame unless given explicitly
+def count_predictions(phage_predictions, genomes = None, tools = None):
+    genome = phage_predictions["genome"].astype("category")
+    tool = phage_predictions["prediction_tool"].astype("category")
+    if genomes is not None:
+        genome = genome.cat.set_categories(genomes)
+    if tools is not None:
+        tool = tool.cat.set_categories(tools)
+    genomes = genome.cat.categories
+    tools = tool.cat.categories
+
+    #single bincount over the flattened genome x tool code, dropping rows outside the given sets
+    genome_codes = genome.cat.codes.to_numpy()
+    tool_codes = tool.cat.codes.to_numpy()
+    keep = (genome_codes >= 0) & (tool_codes >= 0)
+    cell = genome_codes[keep].astype(np.int64) * len(tools) + tool_codes[keep]
+    count_matrix = np.bincount(cell, minlength = len(genomes) * len(tools))\
+        .reshape(len(genomes), len(tools))
+
+    return pd.DataFrame({
+        "genome": pd.Categorical.from_codes(
+            np.repeat(np.arange(len(genomes)), len(tools)),
+            categories = genomes
+            ),
+        "prediction_tool": pd.Categorical.from_codes(
+            np.tile(np.arange(len(tools)), len(genomes)),
+            categories = tools
+            ),
+        "count_phage_predictions": count_matrix.ravel(),
+        "mean_count": np.repeat(count_matrix.mean(axis = 1), len(tools))
+        })
+
+#per tool number of genomes with predictions, total predictions, mean count per genome and median length
+def tool_summary(phage_predictions):
+    counts = count_predictions(phage_predictions)
+    counts["has_predictions"] = counts["count_phage_predictions"] > 0
+    summary = counts\
+        .groupby("prediction_tool", observed = True)\
+        .agg(
+            genomes_with_predictions = ("has_predictions", "sum"),
+            predictions = ("count_phage_predictions", "sum"),
+            mean_count = ("count_phage_predictions", "mean")
+            )
+    summary["median_length"] = phage_predictions\
+        .groupby("prediction_tool", observed = True)["length"]\
+        .median()
+    return summary.reset_index()
@@ -0,0 +1,135 @@
+import argparse
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from fasta_index import find_assemblies, load_index, open_fasta
+
+line_width = 60
+
+#prophage regions of a coordinate table, one row per distinct genome, contig, start and end
+#with the tools that predicted it, from prediction_tool in the predictions summary or supporting_tools in a consensus table
+def read_regions(path):
+    table = pd.read_csv(path, dtype = {"contig": str, "genome": str})
+    if "supporting_tools" in table:
+        tools = table["supporting_tools"].astype(str)
+    elif "prediction_tool" in table:
+        tools = table["prediction_tool"].astype(str)
+    else:
+        tools = pd.Series("", index = table.index)
+    return table.assign(tools = tools)\
+        .groupby(["genome", "contig", "prophage_start", "prophage_end"], sort = True)["tools"]\
+        .agg(lambda values: ";".join(sorted(set(";".join(values).split(";")) - {""}, key = str.lower)))\
+        .reset_index()
+
+#assembly of each genome, also matching genome names with the _contigs suffix removed by load_predictions
+def match_assemblies(genomes, assemblies):
+    stripped = {name.replace("_contigs", ""): path for name, path in assemblies.items()}
+    return {genome: assemblies.get(genome, stripped.get(genome)) for genome in genomes}
+
+#byte position of 0-based base i of an indexed contig
+def base_offset(entry, i):
+    length, offset, line_bases, line_bytes = entry
+    return offset + (i // line_bases) * line_bytes + i % line_bases
+
+#bases start to end (1-based, inclusive) of a contig, slicing just those lines where line lengths are regular
+def region_sequence(data, entry, start, end):
+    length, offset, line_bases, line_bytes = entry
+    if line_bases:
+        sequence = data[base_offset(entry, start - 1):base_offset(entry, end - 1) + 1]
+        return sequence.translate(None, b"\r\n")
+    record_end = data.find(b"\n>", offset)
+    sequence = data[offset:len(data) if record_end == -1 else record_end].translate(None, b"\r\n")
+    return sequence[start - 1:end]
+
+def wrap(sequence, width = line_width):
+    return b"".join(sequence[i:i + width] + b"\n" for i in range(0, len(sequence), width))
+
+#all regions of one genome from a single memory map of its assembly, read in file order
+#returns the fasta records and any warnings, so that workers do not interleave output
+def extract_genome(genome, fasta, regions):
+    index = load_index(fasta)
+    warnings = []
+    records = []
+    data = open_fasta(fasta)
+    if data is None:
+        return b"", [f"WARNING: {fasta} is empty, skipping {len(regions)} regions of {genome}"]
+    if hasattr(mmap, "MADV_SEQUENTIAL"):
+        data.madvise(mmap.MADV_SEQUENTIAL)
+    try:
+        #single contig PHASTEST submissions report regions on a contig named "contig"
+        only_contig = next(iter(index)) if len(index) == 1 else None
+        located = []
+        for contig, start, end, tools in regions:
+            name = contig if contig in index else (only_contig if contig == "contig" else None)
+            if name is None:
+                warnings.append(f"WARNING: contig {contig} not found in {fasta}, skipping {genome}:{contig}:{start}-{end}")
+                continue
+            located.append((index[name][1], start, end, contig, name, tools))
+        for offset, start, end, contig, name, tools in sorted(located):
+            entry = index[name]
+            #the record name keeps the predicted coordinates that quality is joined back on, the clipped ones are noted
+            header = f">{genome}:{contig}:{start}-{end}" + (f" tools={tools}" if tools else "")
+            if start < 1 or end > entry[0] or start > end:
+                warnings.append(
+                    f"WARNING: {genome}:{contig}:{start}-{end} outside contig of length {entry[0]}, clipping"
+                    )
+                start, end = max(start, 1), min(end, entry[0])
+                if start > end:
+                    continue
+                header += f" clipped={start}-{end}"
+            records.append(header.encode() + b"\n" + wrap(region_sequence(data, entry, start, end)))
+    finally:
+        data.close()
+    return b"".join(records), warnings
+
+#regions of every genome sliced from its assembly and written to one fasta, one worker per assembly
+def extract_regions(regions, assemblies, output, threads = None):
+    matched = match_assemblies(regions["genome"].unique(), assemblies)
+    missing = sorted(genome for genome, path in matched.items() if path is None)
+    for genome in missing:
+        print(f"WARNING: no assembly found for {genome}, skipping")
+    groups = [
+        (genome, matched[genome], list(group[["contig", "prophage_start", "prophage_end", "tools"]]\
+            .itertuples(index = False, name = None)))
+        for genome, group in regions.groupby("genome", sort = True)
+        if matched[genome] is not None
+        ]
+    n = 0
+    os.makedirs(os.path.dirname(output) or ".", exist_ok = True)
+    with open(output + ".temp", "wb") as handle, ProcessPoolExecutor(max_workers = threads) as executor:
+        results = executor.map(
+            extract_genome,
+            *zip(*groups) if groups else ([], [], []),
+            chunksize = max(1, len(groups) // (4 * (threads or os.cpu_count() or 1)))
+            )
+        for records, warnings in results:
+            for warning in warnings:
+                print(warning)
+            handle.write(records)
+            n += records.count(b">")
+    os.replace(output + ".temp", output)
+    return n
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description = "Extract prophage sequences from the original assemblies by their coordinates"
+        )
+    parser.add_argument(
+        "table",
+        help = "coordinate table with genome, contig, prophage_start and prophage_end columns, e.g. "
+            "concatenated_predictions_summary.csv or consensus_predictions_summary.csv"
+        )
+    parser.add_argument("assembly_dir", help = "directory containing the assembled contigs the predictions were made on")
+    parser.add_argument("-o", "--output", default = "prophage_sequences.fna", help = "fasta to write (default prophage_sequences.fna)")
+    parser.add_argument("-t", "--threads", type = int, default = None, help = "number of worker processes")
+    args = parser.parse_args()
+
+    assemblies = find_assemblies(args.assembly_dir)
+    if not assemblies:
+        parser.error(f"no fasta files detected in {args.assembly_dir}")
+    regions = read_regions(args.table)
+    n = extract_regions(regions, assemblies, args.output, args.threads)
+    print(f"{n} of {len(regions)} prophage regions written to {args.output}")
@@ -0,0 +1,192 @@
+import argparse
+import glob
+import mmap
+import os
+import sys
+
+#columns of a samtools style .fai index: contig name, length, byte offset of the sequence, bases and bytes per line
+#line geometry is 0 where lines within a contig differ in length, such contigs are read whole rather than sliced
+index_columns = ["name", "length", "offset", "line_bases", "line_width"]
+
+#indices are kept in a hidden .fai/ directory next to the fasta so that *.f* globs over assemblies do not match them
+def index_path(path):
+    return os.path.join(os.path.dirname(path), ".fai", os.path.basename(path) + ".fai")
+
+#read only memory map of a fasta file, None for empty files which cannot be mapped
+def open_fasta(path):
+    with open(path, "rb") as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(handle.fileno(), 0, access = mmap.ACCESS_READ)
+
+#byte spans of each record in one pass over the mapped file: (header start, sequence start, sequence end)
+def record_spans(data):
+    if data is None:
+        return
+    header = data.find(b">")
+    while header != -1:
+        header_end = data.find(b"\n", header)
+        if header_end == -1:
+            yield header, len(data), len(data)
+            return
+        next_header = data.find(b"\n>", header_end)
+        end = len(data) if next_header == -1 else next_header + 1
+        yield header, header_end + 1, end
+        header = -1 if next_header == -1 else next_header + 1
+
+#contig name, the first word of the header as in samtools faidx
+def record_name(data, header, start):
+    words = data[header + 1:start].split()
+    return words[0].decode() if words else ""
+
+#length and line geometry of one record from its sequence bytes
+def record_entry(sequence, offset):
+    sequence = sequence.rstrip(b"\r\n")
+    length = len(sequence) - sequence.count(b"\n") - sequence.count(b"\r")
+    first_line = sequence.find(b"\n")
+    if first_line == -1:
+        return length, offset, length, len(sequence) + 1
+    line_width = first_line + 1
+    line_bases = first_line - (sequence[first_line - 1:first_line] == b"\r")
+    full_lines, remainder = divmod(length, line_bases) if line_bases else (0, 0)
+    expected = full_lines * line_width + remainder - (remainder == 0) * (line_width - line_bases)
+    line_ends = sequence[line_width - 1::line_width]
+    if line_bases == 0 or expected != len(sequence) or sequence.count(b"\n") != line_ends.count(b"\n") \
+            or line_ends.count(b"\n") != len(line_ends):
+        return length, offset, 0, 0
+    return length, offset, line_bases, line_width
+
+def build_index(path):
+    index = {}
+    data = open_fasta(path)
+    try:
+        for header, start, end in record_spans(data):
+            name = record_name(data, header, start)
+            if name in index:
+                print(f"WARNING: duplicate contig {name} in {path}, indexing the first")
+                continue
+            index[name] = record_entry(data[start:end], start)
+    finally:
+        if data is not None:
+            data.close()
+    return index
+
+def read_index(path):
+    index = {}
+    with open(path) as handle:
+        for line in handle:
+            name, *values = line.rstrip("\n").split("\t")
+            index[name] = tuple(int(value) for value in values[:4])
+    return index
+
+def write_index(path, index):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path + ".temp", "w") as handle:
+        for name, values in index.items():
+            handle.write("\t".join([name, *map(str, values)]) + "\n")
+    os.replace(path + ".temp", path)
+
+#index of a fasta file, built on first use and kept next to it until the fasta is modified
+#directories that cannot be written to get an index in memory only
+def load_index(path):
+    fai = index_path(path)
+    if os.path.exists(fai) and os.path.getmtime(fai) >= os.path.getmtime(path):
+        return read_index(fai)
+    index = build_index(path)
+    try:
+        write_index(fai, index)
+    except OSError:
+        pass
+    return index
+
+#assemblies named <genome>.f*, as in prophage_prediction.sh
+def find_assemblies(assembly_dir):
+    return {
+        os.path.basename(path).split(".")[0]: path
+        for path in sorted(glob.glob(os.path.join(assembly_dir, "*.f*")))
+        }
+
+def count_contigs(path):
+    return len(load_index(path))
+
+def contig_lengths(path):
+    return {name: values[0] for name, values in load_index(path).items()}
+
+#write the records of one or more fasta files to each handle with headers replaced by <prefix><n>, numbered
+#across the files, returning the number of records written
+def write_renamed(handles, paths, prefix):
+    n = 0
+    for path in paths:
+        data = open_fasta(path)
+        try:
+            for header, start, end in record_spans(data):
+                n += 1
+                sequence = data[start:end]
+                if sequence and not sequence.endswith(b"\n"):
+                    sequence += b"\n"
+                for handle in handles:
+                    handle.write(f">{prefix}{n}\n".encode())
+                    handle.write(sequence)
+        finally:
+            if data is not None:
+                data.close()
+    return n
+
+#merge the renamed records of each source into one fasta, reading each input once, where each source is
+#(prefix, copy path or None, input paths) and the renamed records of a source are also written to its copy path
+#missing inputs are reported and skipped, leaving an empty copy as cp followed by awk did
+def merge_fasta(sources, output):
+    with open(output + ".temp", "wb") as merged:
+        for prefix, copy, paths in sources:
+            missing = [path for path in paths if not os.path.exists(path)]
+            for path in missing:
+                print(f"WARNING: {path} not found, skipping")
+            paths = [path for path in paths if path not in missing]
+            if copy is None:
+                write_renamed([merged], paths, prefix)
+                continue
+            with open(copy + ".temp", "wb") as handle:
+                write_renamed([merged, handle], paths, prefix)
+            os.replace(copy + ".temp", copy)
+    os.replace(output + ".temp", output)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Index, count, measure and merge fasta files in single passes")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+
+    index_parser = subparsers.add_parser("index", help = "build or refresh the index of each file in .fai/")
+    index_parser.add_argument("fasta", nargs = "+")
+
+    count_parser = subparsers.add_parser("count", help = "print the number of contigs of each file")
+    count_parser.add_argument("fasta", nargs = "+")
+
+    length_parser = subparsers.add_parser("lengths", help = "print contig name and length of each contig as tsv")
+    length_parser.add_argument("fasta", nargs = "+")
+
+    merge_parser = subparsers.add_parser("merge", help = "rename headers to <prefix><n> and concatenate")
+    merge_parser.add_argument("-o", "--output", required = True, help = "merged fasta to write")
+    merge_parser.add_argument(
+        "-s", "--source", nargs = "+", action = "append", required = True, metavar = "PREFIX COPY FASTA",
+        help = "header prefix, path to also write the renamed records to ('-' for none) and input files, "
+            "repeat for each source"
+        )
+    args = parser.parse_args()
+
+    if args.command == "index":
+        for path in args.fasta:
+            write_index(index_path(path), build_index(path))
+    elif args.command == "count":
+        for path in args.fasta:
+            print(f"{path}\t{count_contigs(path)}" if len(args.fasta) > 1 else count_contigs(path))
+    elif args.command == "lengths":
+        for path in args.fasta:
+            for name, length in contig_lengths(path).items():
+                sys.stdout.write(f"{name}\t{length}\n")
+    else:
+        sources = []
+        for source in args.source:
+            if len(source) < 2:
+                parser.error("--source needs a prefix and a copy path ('-' for none) before the input files")
+            prefix, copy, *paths = source
+            sources.append((prefix, None if copy == "-" else copy, paths))
+        merge_fasta(sources, args.output)
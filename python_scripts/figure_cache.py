@@ -0,0 +1,140 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import sys
+import time
+
+import matplotlib
+import pandas as pd
+import seaborn as sns
+
+#dict of prepared data that records which entries a figure function reads
+class TrackedData(dict):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.accessed = set()
+
+    def __getitem__(self, key):
+        self.accessed.add(key)
+        return super().__getitem__(key)
+
+#hash of a dataframe's values, index, column names and dtypes, or of any other prepared value
+def data_hash(value):
+    digest = hashlib.sha256()
+    if isinstance(value, pd.DataFrame):
+        digest.update(repr(list(zip(value.columns, value.dtypes.astype(str)))).encode())
+        digest.update(pd.util.hash_pandas_object(value, index = True).to_numpy().tobytes())
+    else:
+        digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+#modules of this repo that a module uses, imported whole or through names imported from them
+def repo_imports(module):
+    names = set()
+    for value in vars(module).values():
+        name = value.__name__ if inspect.ismodule(value) else getattr(value, "__module__", None)
+        imported = sys.modules.get(name) if isinstance(name, str) else None
+        path = getattr(imported, "__file__", None)
+        if path and os.path.dirname(os.path.abspath(path)) == repo_dir:
+            names.add(imported.__name__)
+    return names
+
+#hash of the source of a module and every module of this repo it uses, directly or indirectly, so that editing
+#a helper or constant a figure relies on, e.g. in tool_correlation.py, changes the figure's key
+@functools.lru_cache(maxsize = None)
+def code_hash(module_name):
+    modules, stack = set(), [module_name]
+    while stack:
+        name = stack.pop()
+        if name not in modules:
+            modules.add(name)
+            stack.extend(repo_imports(sys.modules[name]))
+    digest = hashlib.sha256()
+    for name in sorted(modules):
+        digest.update(name.encode())
+        digest.update(inspect.getsource(sys.modules[name]).encode())
+    return digest.hexdigest()
+
+#figure key from the source of the plot function's module and the repo modules it uses, the data it reads,
+#output format, dpi and plotting library versions
+def figure_key(function, data, data_keys, fmt, dpi):
+    digest = hashlib.sha256()
+    digest.update(f"{function.__module__}.{function.__qualname__}".encode())
+    digest.update(code_hash(function.__module__).encode())
+    for key in sorted(data_keys):
+        digest.update(key.encode())
+        digest.update(data_hash(data[key]).encode())
+    digest.update(f"{fmt}:{dpi}:{matplotlib.__version__}:{sns.__version__}".encode())
+    return digest.hexdigest()
+
+#rendered figures stored by key, evicted least recently used first once over max_bytes
+class FigureCache:
+    def __init__(self, cache_dir, max_bytes = 2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, "index.json")
+        os.makedirs(cache_dir, exist_ok = True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as handle:
+                self.index = json.load(handle)
+        else:
+            self.index = {"figures": {}, "entries": {}}
+
+    #key for a figure from the data entries it read when last rendered, None if never rendered
+    def lookup_key(self, figure_id, function, data, fmt, dpi):
+        data_keys = self.index["figures"].get(figure_id)
+        if data_keys is None or not set(data_keys) <= set(data):
+            return None
+        return figure_key(function, data, data_keys, fmt, dpi)
+
+    #copy a cached figure to path, returning False on a miss
+    def fetch(self, key, path):
+        entry = self.index["entries"].get(key)
+        if entry is None:
+            return False
+        cached = os.path.join(self.cache_dir, entry["file"])
+        if not os.path.exists(cached):
+            del self.index["entries"][key]
+            return False
+        if os.path.exists(path):
+            os.remove(path)
+        try:
+            os.link(cached, path)
+        except OSError:
+            shutil.copyfile(cached, path)
+        entry["last_used"] = time.time()
+        return True
+
+    def store(self, key, figure_id, data_keys, path):
+        file = key + os.path.splitext(path)[1]
+        shutil.copyfile(path, os.path.join(self.cache_dir, file))
+        self.index["figures"][figure_id] = sorted(data_keys)
+        self.index["entries"][key] = {
+            "file": file,
+            "figure": figure_id,
+            "size": os.path.getsize(path),
+            "last_used": time.time()
+            }
+
+    def evict(self):
+        entries = self.index["entries"]
+        total = sum(entry["size"] for entry in entries.values())
+        for key in sorted(entries, key = lambda key: entries[key]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= entries[key]["size"]
+            cached = os.path.join(self.cache_dir, entries.pop(key)["file"])
+            if os.path.exists(cached):
+                os.remove(cached)
+
+    def save(self):
+        self.evict()
+        temp = self.index_path + ".temp"
+        with open(temp, "w") as handle:
+            json.dump(self.index, handle, indent = 1)
+        os.replace(temp, self.index_path)
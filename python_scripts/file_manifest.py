@@ -0,0 +1,50 @@
+import hashlib
+import json
+import os
+
+#sha256 of a file, read in 1 MB chunks
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def file_stat(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+def file_entry(path):
+    return {**file_stat(path), "sha256": file_hash(path)}
+
+#cheap check: path, mtime and size unchanged since the entry was recorded
+def stat_matches(entry, path):
+    try:
+        stat = file_stat(path)
+    except FileNotFoundError:
+        return False
+    return all(entry.get(key) == value for key, value in stat.items())
+
+#content check for files whose mtime or size changed, returning a refreshed entry if the content did not
+def refresh_entry(entry, path):
+    if stat_matches(entry, path):
+        return entry
+    try:
+        current = file_entry(path)
+    except FileNotFoundError:
+        return None
+    if current["sha256"] == entry.get("sha256"):
+        return current
+    return None
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as handle:
+        return json.load(handle)
+
+def save_manifest(path, manifest):
+    temp = path + ".temp"
+    with open(temp, "w") as handle:
+        json.dump(manifest, handle, indent = 1, sort_keys = True)
+    os.replace(temp, path)
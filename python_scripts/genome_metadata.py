@@ -0,0 +1,96 @@
+import argparse
+import os
+import re
+import pandas as pd
+
+from load_predictions import load_cached, read_refseq_tsv
+
+#isolate source by genome name prefix
+isolate_sources = {
+    'CH' : 'Chicken',
+    'PK' : 'Pork',
+    'SM' : 'Salmon',
+    'PR' : 'Prawns',
+    'LG' : 'Leafy Greens',
+    'LB' : 'Lamb',
+    'BF' : 'Beef',
+    'PA' : 'Reference',
+    'SBW' : 'Reference'
+    }
+
+#one anchored pattern for all prefixes, longest first so that no prefix shadows a longer one
+source_pattern = re.compile(
+    "^(" + "|".join(map(re.escape, sorted(isolate_sources, key = len, reverse = True))) + ")"
+    )
+
+#species making up <= this fraction of the collection are grouped into "Other"
+other_species_fraction = 0.02
+
+metadata_columns = ["genome", "source", "closest_match", "species_group"]
+
+#source for each genome name, genomes without a known prefix keep their name as source
+def genome_sources(genomes):
+    genomes = pd.Series(genomes, dtype = str)
+    prefix = genomes.str.extract(source_pattern, expand = False)
+    return prefix.map(isolate_sources).fillna(genomes)
+
+#one row per genome with its source, closest species match and species grouped for the pie charts
+#all columns are categorical and row i is the genome with code i
+def build_genome_metadata(refseq_predictions, min_fraction = other_species_fraction):
+    refseq_predictions = refseq_predictions.drop_duplicates("genome")
+    genome = refseq_predictions["genome"].astype(str).to_numpy()
+    species = refseq_predictions["closest_match"].astype(str)
+    species_fraction = species.map(species.value_counts(normalize = True))
+    return pd.DataFrame({
+        "genome": genome,
+        "source": genome_sources(genome).to_numpy(),
+        "closest_match": species.to_numpy(),
+        "species_group": species.where(species_fraction > min_fraction, "Other").to_numpy()
+        })\
+        .astype("category")\
+        [metadata_columns]
+
+def read_genome_metadata(path):
+    return build_genome_metadata(read_refseq_tsv(path))
+
+#genome metadata for a project, cached beside refseq_concatenated.tsv and rebuilt only when it changes
+def load_genome_metadata(project_path):
+    return load_cached(
+        os.path.join(project_path, "refseq_masher", "refseq_concatenated.tsv"),
+        read_genome_metadata,
+        suffix = "_genome_metadata"
+        )
+
+#add metadata columns to any frame with a genome column, joining on integer genome codes
+#rows for genomes without metadata are dropped, as with an inner merge
+def join_genome_metadata(frame, genome_metadata, columns = ("source", "closest_match", "species_group")):
+    codes = pd.Categorical(frame["genome"], categories = genome_metadata["genome"].astype(str)).codes
+    matched = codes >= 0
+    frame = frame[matched].copy()
+    codes = codes[matched]
+    for column in columns:
+        values = genome_metadata[column]
+        frame[column] = pd.Categorical.from_codes(
+            values.cat.codes.to_numpy()[codes],
+            dtype = values.dtype
+            )
+        frame[column] = frame[column].cat.remove_unused_categories()
+    return frame
+
+#genome counts per category of one metadata column, largest first
+def count_genomes(genome_metadata, column):
+    return genome_metadata\
+        .groupby(column, observed = True)["genome"]\
+        .count()\
+        .sort_values(ascending = False)\
+        .reset_index()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Build the genome metadata table of source and species per genome")
+    parser.add_argument("project_path", help = "project directory containing refseq_masher/")
+    parser.add_argument("-o", "--output", default = None, help = "also write the table to this tsv")
+    args = parser.parse_args()
+    genome_metadata = load_genome_metadata(args.project_path)
+    if args.output:
+        genome_metadata.to_csv(args.output, sep = "\t", index = False)
+    print(f"metadata for {len(genome_metadata)} genomes from {genome_metadata['source'].nunique()} sources")
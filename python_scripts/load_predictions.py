@@ -0,0 +1,84 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+#compact dtypes for the concatenated prediction summary and refseq_masher matches
+predictions_dtypes = {
+    "contig": "category",
+    "prophage_start": "int32",
+    "prophage_end": "int32",
+    "genome": "category",
+    "prediction_tool": "category",
+    "length": "int32"
+    }
+
+refseq_dtypes = {
+    "genome": "category",
+    "closest_match": "category"
+    }
+
+#remove _contigs suffix from genome names by rewriting categories rather than every row
+def strip_contigs_suffix(genome):
+    stripped = genome.cat.categories.str.replace("_contigs", "", regex = False)
+    if stripped.is_unique:
+        return genome.cat.rename_categories(stripped)
+    return genome.astype(str).str.replace("_contigs", "", regex = False).astype("category")
+
+def read_predictions_csv(path):
+    phage_predictions = pd.read_csv(path, dtype = predictions_dtypes)
+    phage_predictions["genome"] = strip_contigs_suffix(phage_predictions["genome"])
+    return phage_predictions
+
+def read_refseq_tsv(path):
+    refseq_predictions = pd.read_csv(path, sep = "\t", header = 0, dtype = refseq_dtypes)
+    refseq_predictions["genome"] = strip_contigs_suffix(refseq_predictions["genome"])
+    return refseq_predictions
+
+#mtime and size of the source file, stored in the cache schema metadata
+def source_stamp(path):
+    stat = os.stat(path)
+    return {
+        b"source_mtime_ns": str(stat.st_mtime_ns).encode(),
+        b"source_size": str(stat.st_size).encode()
+        }
+
+def cache_path(path, suffix = ""):
+    return os.path.splitext(path)[0] + suffix + ".parquet"
+
+def cache_is_valid(path, cache):
+    if not os.path.exists(cache):
+        return False
+    try:
+        metadata = pq.read_schema(cache).metadata or {}
+    except (pa.ArrowInvalid, OSError):
+        return False
+    stamp = source_stamp(path)
+    return all(metadata.get(key) == value for key, value in stamp.items())
+
+#read a table through its parquet cache, re-parsing only if the source has changed
+#suffix distinguishes caches of different tables derived from the same source file
+def load_cached(path, reader, suffix = ""):
+    path = os.path.expanduser(path)
+    cache = cache_path(path, suffix)
+    if cache_is_valid(path, cache):
+        return pq.read_table(cache).to_pandas()
+    table_df = reader(path)
+    table = pa.Table.from_pandas(table_df, preserve_index = False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), **source_stamp(path)})
+    temp = cache + ".temp"
+    pq.write_table(table, temp)
+    os.replace(temp, cache)
+    return table_df
+
+def load_predictions(project_path):
+    return load_cached(
+        os.path.join(project_path, "prophage_regions", "concatenated_predictions_summary.csv"),
+        read_predictions_csv
+        )
+
+def load_refseq(project_path):
+    return load_cached(
+        os.path.join(project_path, "refseq_masher", "refseq_concatenated.tsv"),
+        read_refseq_tsv
+        )
@@ -0,0 +1,305 @@
+import argparse
+import csv
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from file_manifest import file_entry, load_manifest, refresh_entry, save_manifest, stat_matches
+
+summary_header = ["contig", "prophage_start", "prophage_end", "genome", "prediction_tool", "length"]
+min_length = 1000
+
+#emulate `cut -d <delim> -f <fields>`: lines without the delimiter are passed through whole
+def cut(line, delim, fields):
+    if delim not in line:
+        return line
+    parts = line.split(delim)
+    return delim.join(parts[i - 1] for i in fields if i <= len(parts))
+
+##GeNomad
+#gene names are <contig>|provirus_<start>_<end>_<gene>, one row per gene so regions are deduplicated
+def parse_genomad(virus_genes_path):
+    seen = set()
+    with open(virus_genes_path) as handle:
+        next(handle, None)
+        for line in handle:
+            gene = line.split("\t", 1)[0].rstrip("\n")
+            region = gene.rsplit("_", 1)[0].rsplit("_", 2)
+            if len(region) != 3:
+                continue
+            contig, start, end = region
+            contig = contig.replace("|provirus", "")
+            if (contig, start, end) in seen:
+                continue
+            seen.add((contig, start, end))
+            yield contig, start, end
+
+##PHASTEST
+#region table follows the REGION header and its dashed underline, columns separated by 2+ spaces
+def parse_phastest(summary_path):
+    with open(summary_path) as handle:
+        for line in handle:
+            if "REGIO" in line:
+                break
+        next(handle, None)
+        for line in handle:
+            fields = re.sub(r"  +", "\t", line.lstrip(" \t").rstrip("\n")).split("\t")
+            if len(fields) < 5:
+                continue
+            position = cut(fields[4], ",", (1, 7))
+            position = re.sub(r",+", ",", position.replace(":", ","))
+            position = cut(position, ",", (1, 3))
+            region = re.sub(r",+", ",", position.replace("-", ",")).split(",")
+            #single contig submissions report only <start>-<end>
+            if len(region) == 2:
+                region = ["contig"] + region
+            if len(region) != 3:
+                continue
+            yield tuple(region)
+
+##VIBRANT
+#integrated prophages from the coordinates table, whole lytic scaffolds from the summary results
+def parse_vibrant(coordinates_path, results_path):
+    with open(coordinates_path) as handle:
+        next(handle, None)
+        for line in handle:
+            fields = re.split(r"\t+", line.replace(",", "").rstrip("\n"))
+            if len(fields) < 7:
+                continue
+            yield fields[0].split(" ", 1)[0], fields[5], fields[6]
+    with open(results_path) as handle:
+        next(handle, None)
+        for line in handle:
+            if "fragment" in line:
+                continue
+            fields = [field for field in line.replace(",", "").split(" ") if field]
+            scaffold_length = re.match(r"len=(\d+)", fields[1]) if len(fields) > 1 else None
+            if scaffold_length is None:
+                continue
+            yield fields[0], "1", scaffold_length.group(1)
+
+##VirSorter
+def parse_virsorter(boundary_path):
+    with open(boundary_path) as handle:
+        next(handle, None)
+        for line in handle:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 5:
+                continue
+            yield fields[0], fields[3], fields[4]
+
+##PhageBoost
+#second line of the gff is the column header
+def parse_phageboost(gff_path):
+    with open(gff_path) as handle:
+        for line_number, line in enumerate(handle, 1):
+            fields = line.split()
+            if line_number == 2 or line.startswith("#") or len(fields) < 5:
+                continue
+            yield fields[0], fields[3], fields[4]
+
+tool_parsers = {
+    "GeNomad": parse_genomad,
+    "PHASTEST": parse_phastest,
+    "VIBRANT": parse_vibrant,
+    "VirSorter": parse_virsorter,
+    "PhageBoost": parse_phageboost
+    }
+
+#summary files read by each parser, relative to prophage_predictions/output_<tool>/<genome>/
+tool_files = {
+    "GeNomad": ["{genome}_summary/{genome}_virus_genes.tsv"],
+    "PHASTEST": ["summary.txt"],
+    "VIBRANT": [
+        "VIBRANT_{genome}/VIBRANT_results_{genome}/VIBRANT_integrated_prophage_coordinates_{genome}.tsv",
+        "VIBRANT_{genome}/VIBRANT_results_{genome}/VIBRANT_summary_results_{genome}.tsv"
+        ],
+    "VirSorter": ["final-viral-boundary.tsv"],
+    "PhageBoost": ["phages_{genome}.gff"]
+    }
+
+def tool_file_paths(predictions_dir, genome, tool):
+    return [
+        os.path.join(predictions_dir, f"output_{tool}", genome, path.format(genome = genome))
+        for path in tool_files[tool]
+        ]
+
+#list tools with an output_<tool> directory in prophage_predictions/
+def find_tools(predictions_dir):
+    return sorted(
+        name[len("output_"):] for name in os.listdir(predictions_dir)
+        if name.startswith("output_") and name[len("output_"):] in tool_parsers
+        )
+
+def find_genomes(predictions_dir, tools):
+    genomes = set()
+    for tool in tools:
+        tool_dir = os.path.join(predictions_dir, f"output_{tool}")
+        genomes.update(
+            name for name in os.listdir(tool_dir) if os.path.isdir(os.path.join(tool_dir, name))
+            )
+    return sorted(genomes)
+
+#parse one tool's output for a genome into summary rows, keeping regions >1000 bp
+def parse_tool(predictions_dir, genome, tool):
+    rows = []
+    try:
+        for contig, start, end in tool_parsers[tool](*tool_file_paths(predictions_dir, genome, tool)):
+            try:
+                start, end = int(start), int(end)
+            except ValueError:
+                continue
+            length = end - start + 1
+            if length > min_length:
+                rows.append([contig, start, end, genome, tool, length])
+    except FileNotFoundError as error:
+        print(f"WARNING: {tool} output for {genome} not found: {error.filename}")
+    return rows
+
+def write_summary(path, rows):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+    temp = path + ".temp"
+    with open(temp, "w", newline = "") as handle:
+        writer = csv.writer(handle, lineterminator = "\n")
+        writer.writerow(summary_header)
+        writer.writerows(rows)
+    os.replace(temp, path)
+
+def genome_summary_path(regions_dir, genome):
+    return os.path.join(regions_dir, genome, f"{genome}_predictions_summary.csv")
+
+#parse all tools for one genome and write prophage_regions/<genome>/<genome>_predictions_summary.csv
+def parse_genome(predictions_dir, regions_dir, genome, tools):
+    rows = []
+    for tool in tools:
+        rows.extend(parse_tool(predictions_dir, genome, tool))
+    write_summary(genome_summary_path(regions_dir, genome), rows)
+    return rows
+
+#manifest entries for the summary files of every tool present for a genome
+def genome_sources(predictions_dir, genome, tools):
+    return {
+        tool: [path for path in tool_file_paths(predictions_dir, genome, tool) if os.path.exists(path)]
+        for tool in tools
+        }
+
+#cheap check that a genome's recorded outputs are unchanged on path, mtime and size
+def genome_is_current(previous, sources, summary_path):
+    if previous is None or set(previous) != set(sources) or not os.path.exists(summary_path):
+        return False
+    for tool, paths in sources.items():
+        entries = previous[tool]
+        if [entry["path"] for entry in entries] != [os.path.abspath(path) for path in paths]:
+            return False
+        if not all(stat_matches(entry, path) for entry, path in zip(entries, paths)):
+            return False
+    return True
+
+#hash a genome's outputs against the manifest and reparse only if their content changed
+def update_genome(predictions_dir, regions_dir, genome, tools, previous):
+    sources = genome_sources(predictions_dir, genome, tools)
+    unchanged = previous is not None and set(previous) == set(sources) \
+        and os.path.exists(genome_summary_path(regions_dir, genome))
+    entry = {}
+    for tool, paths in sources.items():
+        recorded = {item["path"]: item for item in (previous or {}).get(tool, [])}
+        entry[tool] = []
+        for path in paths:
+            refreshed = refresh_entry(recorded[os.path.abspath(path)], path) \
+                if os.path.abspath(path) in recorded else None
+            if refreshed is None:
+                unchanged = False
+                refreshed = file_entry(path)
+            entry[tool].append(refreshed)
+        if len(paths) != len(recorded):
+            unchanged = False
+    if unchanged:
+        return entry, None
+    return entry, parse_genome(predictions_dir, regions_dir, genome, tools)
+
+#drop rows of changed or removed genomes from the concatenated summary and append the new rows
+#returns whether the summary was only appended to, as when new genomes are added
+def patch_concatenated(path, changed, dropped):
+    new_rows = [row for genome in sorted(changed) for row in changed[genome]]
+    if not dropped:
+        with open(path, "a", newline = "") as handle:
+            csv.writer(handle, lineterminator = "\n").writerows(new_rows)
+        return True
+    temp = path + ".temp"
+    with open(path, newline = "") as source, open(temp, "w", newline = "") as handle:
+        reader = csv.reader(source)
+        writer = csv.writer(handle, lineterminator = "\n")
+        writer.writerow(next(reader))
+        writer.writerows(row for row in reader if row[3] not in dropped)
+        writer.writerows(new_rows)
+    os.replace(temp, path)
+    return False
+
+#parse tool outputs for new or changed genomes and update the per-genome and concatenated summaries
+def parse_predictions(predictions_dir, regions_dir, threads = None, rebuild = False):
+    tools = find_tools(predictions_dir)
+    genomes = find_genomes(predictions_dir, tools)
+    concatenated_path = os.path.join(regions_dir, "concatenated_predictions_summary.csv")
+    manifest_path = os.path.join(regions_dir, "predictions_manifest.json")
+    if rebuild or not os.path.exists(concatenated_path):
+        manifest = {}
+    else:
+        manifest = load_manifest(manifest_path)
+    previous = manifest.get("genomes", {})
+
+    pending = [
+        genome for genome in genomes
+        if not genome_is_current(
+            previous.get(genome),
+            genome_sources(predictions_dir, genome, tools),
+            genome_summary_path(regions_dir, genome)
+            )
+        ]
+    #genomes of the manifest as loaded, previous also gets the genomes added by this run
+    recorded = set(previous)
+    removed = recorded - set(genomes)
+    changed = {}
+    if pending:
+        with ProcessPoolExecutor(max_workers = threads) as executor:
+            results = executor.map(
+                update_genome,
+                [predictions_dir] * len(pending),
+                [regions_dir] * len(pending),
+                pending,
+                [tools] * len(pending),
+                [previous.get(genome) for genome in pending],
+                chunksize = max(1, len(pending) // (4 * (threads or os.cpu_count() or 1)))
+                )
+            for genome, (entry, rows) in zip(pending, results):
+                previous[genome] = entry
+                if rows is not None:
+                    changed[genome] = rows
+    for genome in removed:
+        del previous[genome]
+
+    appended = False
+    if not manifest:
+        write_summary(concatenated_path, [row for genome in sorted(changed) for row in changed[genome]])
+    elif changed or removed:
+        appended = patch_concatenated(concatenated_path, changed, (set(changed) & recorded) | removed)
+    save_manifest(manifest_path, {"tools": tools, "genomes": previous})
+    print(
+        f"{len(changed)} genomes parsed, {len(genomes) - len(changed)} unchanged, "
+        f"{len(removed)} removed, {'appended to' if appended else 'written to'} {concatenated_path}"
+        )
+    return sorted(changed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description = "Standardise prophage prediction tool outputs into per-genome and concatenated summaries"
+        )
+    parser.add_argument("predictions_dir", help = "prophage_predictions/ directory containing output_<tool>/ dirs")
+    parser.add_argument("regions_dir", help = "prophage_regions/ directory to write summaries to")
+    parser.add_argument("-t", "--threads", type = int, default = None, help = "number of worker processes")
+    parser.add_argument("-r", "--rebuild", action = "store_true", help = "ignore the manifest and reparse every genome")
+    parser.add_argument("-c", "--changed", default = None, help = "file to write names of reparsed genomes to")
+    args = parser.parse_args()
+    changed = parse_predictions(args.predictions_dir, args.regions_dir, args.threads, args.rebuild)
+    if args.changed:
+        with open(args.changed, "w") as handle:
+            handle.writelines(f"{genome}\n" for genome in changed)
@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import shutil
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zipfile
+
+from fasta_index import count_contigs, find_assemblies
+
+default_url = "https://phastest.ca"
+state_name = "phastest_submissions.json"
+chunk_size = 1024 ** 2
+
+#http status codes worth retrying, other client errors are reported straight away
+retry_codes = {408, 425, 429, 500, 502, 503, 504}
+
+def read_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as handle:
+        return json.load(handle)
+
+def write_state(path, state):
+    with open(path + ".temp", "w") as handle:
+        json.dump(state, handle, indent = 1, sort_keys = True)
+    os.replace(path + ".temp", path)
+
+#state carried over from the genome,submission_ID csv written by the shell submit step
+def import_submitted_csv(path):
+    state = {}
+    if os.path.exists(path):
+        with open(path) as handle:
+            for row in csv.DictReader(handle):
+                state[row["genome"]] = {"job_id": row["submission_ID"].strip(), "status": "submitted"}
+    return state
+
+def output_path(output_dir, genome):
+    return os.path.join(output_dir, "output_PHASTEST", genome)
+
+def is_complete(status):
+    return "complete" in str(status).lower()
+
+#statuses of jobs that will never complete: failed or errored runs and job IDs the server no longer knows
+failed_words = ("fail", "error", "not found", "unable", "invalid")
+
+def is_failed(status):
+    return any(word in str(status).lower() for word in failed_words)
+
+#blocking requests, run in worker threads by the client
+def post_fasta(url, path, timeout):
+    with open(path, "rb") as handle:
+        request = urllib.request.Request(url, data = handle.read(), method = "POST")
+    with urllib.request.urlopen(request, timeout = timeout) as response:
+        return json.loads(response.read())
+
+def get_json(url, timeout):
+    with urllib.request.urlopen(url, timeout = timeout) as response:
+        return json.loads(response.read())
+
+#stream a zip to disk in chunks and extract it, so that nothing is held in memory or left half written
+def download_zip(url, zip_path, outdir, timeout):
+    os.makedirs(os.path.dirname(zip_path), exist_ok = True)
+    with urllib.request.urlopen(url, timeout = timeout) as response, open(zip_path + ".part", "wb") as handle:
+        shutil.copyfileobj(response, handle, chunk_size)
+    os.replace(zip_path + ".part", zip_path)
+    if os.path.exists(outdir):
+        shutil.rmtree(outdir)
+    with zipfile.ZipFile(zip_path) as archive:
+        archive.extractall(outdir)
+    os.remove(zip_path)
+
+#asyncio client submitting genomes to the PHASTEST API and polling their status with at most concurrency
+#requests in flight, retrying failed requests with exponential backoff
+#submission state is written to <output_dir>/phastest_submissions.json after every change so runs can resume
+class PhastestClient:
+    def __init__(self, output_dir, url = default_url, concurrency = 8, retries = 5, backoff = 2, timeout = 300):
+        self.output_dir = output_dir
+        self.url = url.rstrip("/")
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.state_path = os.path.join(output_dir, state_name)
+        self.state = read_state(self.state_path)
+        if not self.state:
+            self.state = import_submitted_csv(os.path.join(output_dir, "submitted_genomes.csv"))
+
+    def save(self):
+        write_state(self.state_path, self.state)
+
+    def update(self, genome, **values):
+        self.state.setdefault(genome, {}).update(values)
+        self.save()
+
+    #run a blocking request in a thread once a slot is free, sleeping backoff * 2^attempt (with jitter) between tries
+    async def request(self, function, *args):
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.semaphore:
+                    return await asyncio.to_thread(function, *args, self.timeout)
+            except urllib.error.HTTPError as error:
+                if error.code not in retry_codes or attempt == self.retries:
+                    raise
+            except (urllib.error.URLError, OSError, ValueError):
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(1, 1.5))
+
+    async def submit_genome(self, genome, fasta):
+        #PHASTEST needs ?contigs=1 for multifasta assemblies
+        url = f"{self.url}/phastest_api"
+        if count_contigs(fasta) > 1:
+            url += "?contigs=1"
+        try:
+            response = await self.request(post_fasta, url, fasta)
+        except Exception as error:
+            print(f"ERROR: submitting {genome} failed: {error}")
+            return
+        if "job_id" not in response:
+            print(f"ERROR: no job ID returned for {genome}: {response.get('error', response)}")
+            return
+        print(f"submitted {genome} as {response['job_id']}")
+        self.update(genome, job_id = response["job_id"], status = response.get("status", "submitted"),
+            submitted = time.time(), failed = None, retrieved = None)
+
+    #check one job, downloading its results only once it is reported complete
+    async def check_genome(self, genome):
+        job = self.state[genome]
+        query = urllib.parse.urlencode({"acc": job["job_id"]})
+        try:
+            response = await self.request(get_json, f"{self.url}/phastest_api?{query}")
+        except Exception as error:
+            print(f"WARNING: status of {genome} unavailable: {error}")
+            return
+        status = response.get("status", response.get("error", "unknown"))
+        self.update(genome, status = status, checked = time.time())
+        if is_failed(status):
+            print(f"WARNING: PHASTEST job of {genome} ended with {status}, submit again to rerun it")
+            self.update(genome, failed = time.time())
+            return
+        if not is_complete(status):
+            print(f"{genome} {status}")
+            return
+        outdir = output_path(self.output_dir, genome)
+        try:
+            await self.request(
+                download_zip, f"{self.url}/submissions/{job['job_id']}.zip", outdir + ".zip", outdir
+                )
+        except Exception as error:
+            print(f"WARNING: download of {genome} failed: {error}")
+            return
+        print(f"Completed {genome} predictions downloaded to {outdir}")
+        self.update(genome, retrieved = time.time())
+
+    #submitted jobs neither retrieved nor failed
+    #a retrieval is final, --analyse moves output_PHASTEST/ away and resubmitting a genome clears it
+    def pending(self):
+        return [
+            genome for genome, job in self.state.items()
+            if job.get("job_id") and not job.get("failed") and not job.get("retrieved")
+            ]
+
+    def failed(self):
+        return [genome for genome, job in self.state.items() if job.get("job_id") and job.get("failed")]
+
+    #submit genomes without a job ID or whose job failed, or all genomes with resubmit
+    async def submit(self, assemblies, resubmit = False):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        todo = {
+            genome: fasta for genome, fasta in assemblies.items()
+            if resubmit or not self.state.get(genome, {}).get("job_id") or self.state[genome].get("failed")
+            }
+        print(f"submitting {len(todo)} of {len(assemblies)} genomes, the rest are already submitted")
+        await asyncio.gather(*(self.submit_genome(genome, fasta) for genome, fasta in todo.items()))
+
+    #poll unfinished jobs every interval seconds until all are retrieved or failed, or once if interval is None
+    async def retrieve(self, interval = None):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            pending = self.pending()
+            await asyncio.gather(*(self.check_genome(genome) for genome in pending))
+            self.write_queries()
+            pending, failed = self.pending(), self.failed()
+            print(f"{len(self.state) - len(pending) - len(failed)} of {len(self.state)} genomes retrieved, {len(failed)} failed")
+            if interval is None or not pending:
+                return pending
+            await asyncio.sleep(interval)
+
+    #finished and unfinished query lists, as written by the shell retrieve step, and the failed jobs
+    def write_queries(self):
+        pending, failed = set(self.pending()), set(self.failed())
+        groups = {
+            "finished": lambda genome: genome not in pending and genome not in failed,
+            "unfinished": lambda genome: genome in pending,
+            "failed": lambda genome: genome in failed
+            }
+        for name, member in groups.items():
+            with open(os.path.join(self.output_dir, f"{name}_queries.csv"), "w") as handle:
+                handle.write("genome,submission_ID\n")
+                for genome, job in sorted(self.state.items()):
+                    if job.get("job_id") and member(genome):
+                        handle.write(f"{genome},http://phastest.ca/phastest?acc={job['job_id']}\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description = "Submit genomes to the PHASTEST web service and retrieve completed predictions concurrently"
+        )
+    parser.add_argument(
+        "command", choices = ["submit", "retrieve", "wait"],
+        help = "submit genomes, retrieve completed jobs once, or submit and poll until all jobs are retrieved"
+        )
+    parser.add_argument("-i", "--input", default = None, help = "directory containing assembled contigs, for submit and wait")
+    parser.add_argument("-o", "--outdir", default = ".", help = f"directory to write {state_name} and output_PHASTEST/ to (default .)")
+    parser.add_argument("-c", "--concurrency", type = int, default = 8, help = "maximum requests in flight (default 8)")
+    parser.add_argument("-r", "--retries", type = int, default = 5, help = "retries per failed request (default 5)")
+    parser.add_argument("-b", "--backoff", type = float, default = 2, help = "initial retry delay in seconds (default 2)")
+    parser.add_argument("-p", "--poll-interval", type = float, default = 600, help = "seconds between status checks for wait (default 600)")
+    parser.add_argument("-t", "--timeout", type = float, default = 300, help = "request timeout in seconds (default 300)")
+    parser.add_argument("-u", "--url", default = default_url, help = f"PHASTEST server (default {default_url})")
+    parser.add_argument("--resubmit", action = "store_true", help = "submit genomes that already have a job ID again")
+    args = parser.parse_args()
+
+    os.makedirs(args.outdir, exist_ok = True)
+    client = PhastestClient(args.outdir, args.url, args.concurrency, args.retries, args.backoff, args.timeout)
+    try:
+        if args.command in ["submit", "wait"]:
+            if not args.input:
+                parser.error(f"{args.command} needs --input")
+            assemblies = find_assemblies(args.input)
+            if not assemblies:
+                parser.error(f"no fasta files detected in {args.input}")
+            asyncio.run(client.submit(assemblies, args.resubmit))
+        if args.command in ["retrieve", "wait"]:
+            asyncio.run(client.retrieve(args.poll_interval if args.command == "wait" else None))
+    except KeyboardInterrupt:
+        raise SystemExit(130)
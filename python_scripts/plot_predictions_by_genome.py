@@ -3,277 +3,318 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-#load files
+from load_predictions import load_predictions
+from count_predictions import count_predictions
+from prediction_stats import log_length_bounds, within_length_bounds, bounds_label
+from genome_metadata import load_genome_metadata, join_genome_metadata
+
 project_path = "~/whitchurch_group/PRO_Foodborne_Pseudomonas_Prophages/"
-phage_predictions = pd.read_csv(project_path+"prophage_regions/concatenated_predictions_summary.csv")
-refseq_predictions = pd.read_csv(
-    project_path+"refseq_masher/refseq_concatenated.tsv",
-    sep = "\t",
-    header = 0
-    )
-#remove _contigs suffix from genome names
-phage_predictions['genome'] = phage_predictions['genome'].str.replace(r'_contigs', '')
-refseq_predictions['genome'] = refseq_predictions['genome'].str.replace(r'_contigs', '')
 
-#create new dataframe containing all permutations of genome and prediction tool
-genome_array = phage_predictions["genome"]\
-    .unique()\
-    .repeat(5)
+#above this many genome x tool points the swarmplot is replaced by the aggregated heatmap
+#at 600 dpi both take about 3 s at 100 points, the swarmplot twice as long at 200 and minutes by a few thousand
+max_swarm_points = 200
+#genomes are averaged into at most this many heatmap columns
+max_heatmap_columns = 2000
 
-tool_array = np.tile(
-    ["GeNomad","PHASTEST","PhageBoost","VIBRANT","VirSorter"], 
-    194
-    )
+def prepare_data(project_path):
+    #load files
+    phage_predictions = load_predictions(project_path)
+    genome_metadata = load_genome_metadata(project_path)
 
-phage_predictions_filled = pd.DataFrame(
-    np.vstack([genome_array, tool_array])
-    )\
-    .transpose()\
-    .rename(columns = {0 : "genome", 1 : "prediction_tool"})
+    #count predictions per genome and tool, providing a value for n = 0 predictions
+    count_phage_predictions = count_predictions(phage_predictions)
 
-#outer join dataframes to provide a value for n = 0 predictions
-phage_predictions_filled = phage_predictions\
-    .merge(
-        phage_predictions_filled,
-        how = "outer",
-        on = ["genome", "prediction_tool"])\
-    .fillna(0)
+    #genome kept as plain strings so that each species facet only lists its own genomes
+    count_phage_predictions = join_genome_metadata(count_phage_predictions, genome_metadata, ["closest_match"])\
+        .astype({"genome": str})\
+        .sort_values(
+            ['closest_match', 'mean_count', 'prediction_tool'],
+            ascending = [True, False, True],
+            key = lambda x: x if pd.api.types.is_numeric_dtype(x) else x.str.lower()
+            )\
+        .reset_index()
 
-count_phage_predictions_non_zero = phage_predictions_filled[phage_predictions_filled["length"] > 0]\
-    .groupby(["genome", "prediction_tool"])\
-    .count()\
-    .rename(columns = {"contig": "count_phage_predictions"})\
-    .drop(columns = ["prophage_start", "prophage_end", "length"])\
-    .reset_index()
-    
-count_phage_predictions_eq_zero = phage_predictions_filled[phage_predictions_filled["length"] == 0]\
-    .rename(columns = {"length": "count_phage_predictions"})\
-    .drop(columns = ["prophage_start", "prophage_end", "contig"])\
-    .reset_index() 
+    length_bounds = log_length_bounds(phage_predictions["length"])
 
-count_phage_predictions = count_phage_predictions_non_zero._append(count_phage_predictions_eq_zero)
-    
-count_phage_predictions["mean_count"] = count_phage_predictions\
-    .groupby("genome")["count_phage_predictions"]\
-    .transform(lambda x: x.mean())
-    
-count_phage_predictions = count_phage_predictions\
-    .merge(refseq_predictions, on="genome")\
-    .sort_values(
-        ['closest_match', 'mean_count', 'prediction_tool'], 
-        ascending = [True, False, True],
-        key = lambda x: x if np.issubdtype(x.dtype, np.number) else x.str.lower()
+    phage_predictions_2sigma = join_genome_metadata(
+        within_length_bounds(phage_predictions, length_bounds),
+        genome_metadata,
+        ["closest_match"]
         )\
-    .reset_index()
+        .sort_values(
+            'prediction_tool',
+            ascending = True,
+            key=lambda col: col.str.lower()
+            )\
+        .reset_index()
 
-#plot swarmplot of number of predictions per genome
-sns.set_style(
-    rc={
-        'axes.grid': True,
-        'xtick.bottom': True,
-        'ytick.left': True
+    return {
+        "count_phage_predictions": count_phage_predictions,
+        "phage_predictions_2sigma": phage_predictions_2sigma,
+        "length_bounds": length_bounds,
+        "max_swarm_points": max_swarm_points
         }
-    )
-g = sns.FacetGrid(
-    count_phage_predictions, 
-    col = "closest_match", 
-    aspect = 0.6, 
-    height = 5,
-    sharex = False,
-    gridspec_kws = dict(
-        width_ratios = count_phage_predictions.groupby("closest_match")["genome"].count())
-    )
-g.map(
-    sns.scatterplot,
-    "genome", 
-    "mean_count", 
-    marker = 'x', 
-    color = 'black', 
-    s = 40,
-    zorder = 3, 
-    legend = False
-    )
-g.map_dataframe(
-    sns.swarmplot,
-    hue = "prediction_tool",
-    palette="deep",
-    x="genome",
-    y="count_phage_predictions",
-    )
-g.fig.suptitle("Number of Predicted Phage Regions > 1000 bp", y = 1.25)
-g.set_titles(
-    "{col_name}",
-    rotation = 45,
-    horizontalalignment = 'left') 
-g.set_axis_labels('', 'Number of Prophage Regions')
-g.add_legend(title = "Prediction Tool")
-for ax in g.axes.flat:
-    ax.set_xticklabels(
-        ax.get_xticklabels(), 
-        rotation = 45, 
-        horizontalalignment = 'right'
+
+#plot swarmplot of number of predictions per genome, or the aggregated heatmap for large collections
+def plot_genome_swarmplot(data):
+    count_phage_predictions = data["count_phage_predictions"]
+    if len(count_phage_predictions) > data["max_swarm_points"]:
+        return plot_genome_heatmap(data)
+    sns.set_style(
+        rc={
+            'axes.grid': True,
+            'xtick.bottom': True,
+            'ytick.left': True
+            }
+        )
+    g = sns.FacetGrid(
+        count_phage_predictions,
+        col = "closest_match",
+        aspect = 0.6,
+        height = 5,
+        sharex = False,
+        gridspec_kws = dict(
+            width_ratios = count_phage_predictions.groupby("closest_match", observed = True)["genome"].count())
+        )
+    g.map(
+        sns.scatterplot,
+        "genome",
+        "mean_count",
+        marker = 'x',
+        color = 'black',
+        s = 40,
+        zorder = 3,
+        legend = False
+        )
+    g.map_dataframe(
+        sns.swarmplot,
+        hue = "prediction_tool",
+        palette="deep",
+        x="genome",
+        y="count_phage_predictions",
         )
-for ax in g.axes.ravel():
-    ax.spines['right'].set_visible(True)
-    ax.spines['top'].set_visible(True)
-plt.ylim(0, 26)
-plt.subplots_adjust(wspace=0.05, hspace=0)
-# plt.show()
-plt.savefig('filename2.png', dpi=600, bbox_inches = "tight")
-sns.reset_defaults()
+    g.fig.suptitle("Number of Predicted Phage Regions > 1000 bp", y = 1.25)
+    g.set_titles(
+        "{col_name}",
+        rotation = 45,
+        horizontalalignment = 'left')
+    g.set_axis_labels('', 'Number of Prophage Regions')
+    g.add_legend(title = "Prediction Tool")
+    for ax in g.axes.flat:
+        ax.set_xticklabels(
+            ax.get_xticklabels(),
+            rotation = 45,
+            horizontalalignment = 'right'
+            )
+    for ax in g.axes.ravel():
+        ax.spines['right'].set_visible(True)
+        ax.spines['top'].set_visible(True)
+    plt.ylim(0, 26)
+    plt.subplots_adjust(wspace=0.05, hspace=0)
+    return g.fig
+
+#tool x genome count matrix in plotting order, with the species of each genome
+def genome_count_matrix(count_phage_predictions):
+    genome_codes, genomes = pd.factorize(count_phage_predictions["genome"])
+    tool_codes, tools = pd.factorize(count_phage_predictions["prediction_tool"], sort = True)
+    matrix = np.zeros((len(tools), len(genomes)))
+    matrix[tool_codes, genome_codes] = count_phage_predictions["count_phage_predictions"].to_numpy()
+    species = np.empty(len(genomes), dtype = object)
+    species[genome_codes] = count_phage_predictions["closest_match"].astype(str).to_numpy()
+    return matrix, tools.astype(str), species
+
+#mean of adjacent columns, so that at most n_columns reach matplotlib
+def bin_columns(matrix, n_columns):
+    edges = np.linspace(0, matrix.shape[1], min(n_columns, matrix.shape[1]) + 1).astype(int)
+    binned = np.add.reduceat(matrix, edges[:-1], axis = 1) / np.diff(edges)
+    return binned, (edges[:-1] + edges[1:] - 1) / 2
+
+#plot heatmap of predictions per genome and tool with stacked per genome counts, scaling to any number of genomes
+def plot_genome_heatmap(data):
+    matrix, tools, species = genome_count_matrix(data["count_phage_predictions"])
+    binned, centres = bin_columns(matrix, max_heatmap_columns)
+    n_genomes = matrix.shape[1]
+
+    fig, (ax_stack, ax_heat) = plt.subplots(
+        2, 1,
+        sharex = True,
+        figsize = (16, 8),
+        gridspec_kw = dict(height_ratios = [1, 2], hspace = 0.05)
+        )
+    ax_stack.stackplot(centres, binned, labels = tools, colors = sns.color_palette("deep", len(tools)))
+    ax_stack.set_ylabel('Number of Prophage\nRegions')
+    ax_stack.legend(title = "Prediction Tool", bbox_to_anchor = (0, 1.02), loc = "lower left", ncol = len(tools))
+    image = ax_heat.imshow(
+        binned,
+        aspect = "auto",
+        interpolation = "nearest",
+        cmap = "viridis",
+        extent = (-0.5, n_genomes - 0.5, len(tools) - 0.5, -0.5)
+        )
+    fig.colorbar(image, ax = (ax_stack, ax_heat), label = 'Number of Prophage Regions', pad = 0.01)
+    ax_heat.set_yticks(np.arange(len(tools)), labels = tools)
+
+    #species boundaries and labels at the centre of each species block
+    starts = np.flatnonzero(np.r_[True, species[1:] != species[:-1]])
+    ends = np.r_[starts[1:], n_genomes]
+    for boundary in starts[1:]:
+        for ax in (ax_stack, ax_heat):
+            ax.axvline(boundary - 0.5, color = 'white' if ax is ax_heat else 'black', lw = 1)
+    ax_heat.set_xticks((starts + ends - 1) / 2, labels = species[starts], rotation = 45, horizontalalignment = 'right')
+    ax_heat.set_xlim(-0.5, n_genomes - 0.5)
+    fig.suptitle(f"Number of Predicted Phage Regions > 1000 bp ({n_genomes} genomes)", y = 1.02)
+    return fig
 
 #plot histogram of counts per species
-def specs(x, **kwargs):
-    ax = sns.histplot(
+def plot_species_histogram(data):
+    count_phage_predictions = data["count_phage_predictions"]
+    def specs(x, **kwargs):
+        ax = sns.histplot(
+            data = count_phage_predictions,
+            x = x,
+            hue = "closest_match",
+            binwidth = 1,
+            kde = True,
+            stat='probability'
+            )
+        ax.axvline(
+            x.median(),
+            color='k',
+            ls='--',
+            lw=2
+            )
+    g = sns.FacetGrid(
         data = count_phage_predictions,
-        x = x,
-        hue = "closest_match",
-        binwidth = 1,
-        kde = True,
-        stat='probability'
+        col = 'closest_match',
+        height = 4,
+        aspect = 0.75,
+        col_wrap = 4
         )
-    ax.axvline(
-        x.median(), 
-        color='k', 
-        ls='--', 
-        lw=2
+    g.map(specs,'count_phage_predictions')
+    g.fig.suptitle(
+        "Distributions of number of predicted prophage regions by species (bin = 1)",
+        y = 1.05)
+    g.set_titles("{col_name}")
+    g.set_axis_labels(
+        'Length of Predicted Prophage\nRegions >1000 bp',
+        "Proportion"
         )
-plt.rcParams['figure.dpi'] = 600
-plt.rcParams['savefig.dpi'] = 600
-g = sns.FacetGrid(
-    data = count_phage_predictions, 
-    col = 'closest_match',
-    height = 4,
-    aspect = 0.75,
-    col_wrap = 4
-    )
-g.map(specs,'count_phage_predictions')
-g.fig.suptitle(
-    "Distributions of number of predicted prophage regions by species (bin = 1)", 
-    y = 1.05)
-g.set_titles("{col_name}") 
-g.set_axis_labels(
-    'Length of Predicted Prophage\nRegions >1000 bp', 
-    "Proportion"
-    )
-plt.show()
-sns.reset_defaults()
-
-#plot swarmplot of counts per species
-plt.figure(figsize=(16,8))
-g3 = sns.violinplot(
-    data = count_phage_predictions,
-    x = "closest_match",
-    y = "count_phage_predictions",
-    color = "white",
-    linewidth = 2,
-    cut = 0,
-    scale='width',
-    order = count_phage_predictions\
-        .groupby("closest_match")\
-        .median("count_phage_predictions")\
-        .sort_values(
-            "count_phage_predictions", 
-            ascending = False
-            )\
-        .reset_index()["closest_match"]
-    )
-sns.pointplot(
-    ax = g3,
-    data = count_phage_predictions,
-    x = "closest_match",
-    y = "count_phage_predictions",
-    linestyle = "none",
-    errorbar = None,
-    marker = "+",
-    color = 'black',
-    zorder = 10
-    )
-g3.tick_params(labelsize=10)
-g3.set_xticklabels(
-    g3.get_xticklabels(),
-    rotation = 45,
-    horizontalalignment = 'right'
-    )
-g3.set_title(
-    'Distributions of number of prophage regions by species',
-    fontsize = 10
-    )
-g3.set_ylabel(
-    'Number of Predicted Prophage Regions >1000 bp', 
-    fontsize = 10
-    )
-g3.set_xlabel(
-    'Species', 
-    fontsize = 10
-    )
-plt.show()
-sns.reset_defaults()
+    return g.fig
 
-phage_predictions["log_len"] = phage_predictions["length"].apply(lambda x: np.log(x))
-mean_log_len = phage_predictions["log_len"].mean()
-two_sig_len = 2 * phage_predictions["log_len"].std()
-upper_bound = mean_log_len + two_sig_len
-lower_bound = mean_log_len - two_sig_len
+#plot violinplot of counts per species
+def plot_species_count_violinplot(data):
+    count_phage_predictions = data["count_phage_predictions"]
+    plt.figure(figsize=(16,8))
+    g3 = sns.violinplot(
+        data = count_phage_predictions,
+        x = "closest_match",
+        y = "count_phage_predictions",
+        color = "white",
+        linewidth = 2,
+        cut = 0,
+        scale='width',
+        order = count_phage_predictions\
+            .groupby("closest_match", observed = True)\
+            .median("count_phage_predictions")\
+            .sort_values(
+                "count_phage_predictions",
+                ascending = False
+                )\
+            .reset_index()["closest_match"]
+        )
+    sns.pointplot(
+        ax = g3,
+        data = count_phage_predictions,
+        x = "closest_match",
+        y = "count_phage_predictions",
+        linestyle = "none",
+        errorbar = None,
+        marker = "+",
+        color = 'black',
+        zorder = 10
+        )
+    g3.tick_params(labelsize=10)
+    g3.set_xticklabels(
+        g3.get_xticklabels(),
+        rotation = 45,
+        horizontalalignment = 'right'
+        )
+    g3.set_title(
+        'Distributions of number of prophage regions by species',
+        fontsize = 10
+        )
+    g3.set_ylabel(
+        'Number of Predicted Prophage Regions >1000 bp',
+        fontsize = 10
+        )
+    g3.set_xlabel(
+        'Species',
+        fontsize = 10
+        )
+    return g3.figure
 
-phage_predictions_2sigma = phage_predictions[
-    (phage_predictions['log_len'] >= lower_bound) & (phage_predictions['log_len'] <= upper_bound)]\
-    .merge(refseq_predictions, on="genome")\
-    .sort_values(
-        'prediction_tool', 
-        ascending = True,
-        key=lambda col: col.str.lower()
-        )\
-    .reset_index()
+#plot violinplot of lengths per species
+def plot_species_length_violinplot(data):
+    phage_predictions_2sigma = data["phage_predictions_2sigma"]
+    plt.figure(figsize=(16,8))
+    g3 = sns.violinplot(
+        data = phage_predictions_2sigma,
+        x = "closest_match",
+        y = "length",
+        color = "white",
+        linewidth = 2,
+        cut = 0,
+        scale='width',
+        order = phage_predictions_2sigma\
+            .groupby("closest_match", observed = True)\
+            .median("length")\
+            .sort_values(
+                "length",
+                ascending = False
+                )\
+            .reset_index()["closest_match"]
+        )
+    sns.pointplot(
+        ax = g3,
+        data = phage_predictions_2sigma,
+        x = "closest_match",
+        y = "length",
+        linestyle = "none",
+        errorbar = None,
+        marker = "+",
+        color = 'black',
+        zorder = 10
+        )
+    g3.tick_params(labelsize=10)
+    g3.set_xticklabels(
+        g3.get_xticklabels(),
+        rotation = 45,
+        horizontalalignment = 'right'
+        )
+    g3.set_title(
+        f"Distribution of lengths of predicted prophage regions ({bounds_label(data['length_bounds'])}) by species",
+        fontsize = 10
+        )
+    g3.set_ylabel(
+        'Length of Predicted Prophage Regions >1000 bp',
+        fontsize = 10
+        )
+    g3.set_xlabel(
+        'Species',
+        fontsize = 10
+        )
+    return g3.figure
 
+figures = {
+    "genome_swarmplot": plot_genome_swarmplot,
+    "species_histogram": plot_species_histogram,
+    "species_count_violinplot": plot_species_count_violinplot,
+    "species_length_violinplot": plot_species_length_violinplot
+    }
 
-#plot swarmplot of lengths per species
-plt.figure(figsize=(16,8))
-g3 = sns.violinplot(
-    data = phage_predictions_2sigma,
-    x = "closest_match",
-    y = "length",
-    color = "white",
-    linewidth = 2,
-    cut = 0,
-    scale='width',
-    order = phage_predictions_2sigma\
-        .groupby("closest_match")\
-        .median("length")\
-        .sort_values(
-            "length", 
-            ascending = False
-            )\
-        .reset_index()["closest_match"]
-    )
-sns.pointplot(
-    ax = g3,
-    data = phage_predictions_2sigma,
-    x = "closest_match",
-    y = "length",
-    linestyle = "none",
-    errorbar = None,
-    marker = "+",
-    color = 'black',
-    zorder = 10
-    )
-g3.tick_params(labelsize=10)
-g3.set_xticklabels(
-    g3.get_xticklabels(),
-    rotation = 45,
-    horizontalalignment = 'right'
-    )
-g3.set_title(
-    'Distribution of lengths of predicted prophage regions (μ ± 2σ [4513, 118530]) by species',
-    fontsize = 10
-    )
-g3.set_ylabel(
-    'Length of Predicted Prophage Regions >1000 bp', 
-    fontsize = 10
-    )
-g3.set_xlabel(
-    'Species', 
-    fontsize = 10
-    )
-plt.show()
-sns.reset_defaults()
+if __name__ == "__main__":
+    data = prepare_data(project_path)
+    for plot in figures.values():
+        plot(data)
+        plt.show()
+        sns.reset_defaults()
@@ -3,293 +3,243 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-#load files
-project_path = "~/whitchurch_group/PRO_Foodborne_Pseudomonas_Prophages/"
-phage_predictions = pd.read_csv(project_path+"prophage_regions/concatenated_predictions_summary.csv")
-refseq_predictions = pd.read_csv(
-    project_path+"refseq_masher/refseq_concatenated.tsv",
-    sep = "\t",
-    header = 0
-    )
-#remove _contigs suffix from genome names
-phage_predictions['genome'] = phage_predictions['genome'].str.replace(r'_contigs', '')
-refseq_predictions['genome'] = refseq_predictions['genome'].str.replace(r'_contigs', '')
-
-#create new dataframe containing all permutations of genome and prediction tool
-genome_array = phage_predictions["genome"]\
-    .unique()\
-    .repeat(5)
-
-tool_array = np.tile(
-    ["GeNomad","PHASTEST","PhageBoost","VIBRANT","VirSorter"], 
-    194
-    )
-
-phage_predictions_filled = pd.DataFrame(
-    np.vstack([genome_array, tool_array])
-    )\
-    .transpose()\
-    .rename(columns = {0 : "genome", 1 : "prediction_tool"})
-
-#outer join dataframes to provide a value for n = 0 predictions
-phage_predictions_filled = phage_predictions\
-    .merge(
-        phage_predictions_filled,
-        how = "outer",
-        on = ["genome", "prediction_tool"])\
-    .fillna(0)
-
-count_phage_predictions_non_zero = phage_predictions_filled[phage_predictions_filled["length"] > 0]\
-    .groupby(["genome", "prediction_tool"])\
-    .count()\
-    .rename(columns = {"contig": "count_phage_predictions"})\
-    .drop(columns = ["prophage_start", "prophage_end", "length"])\
-    .reset_index()
-    
-count_phage_predictions_eq_zero = phage_predictions_filled[phage_predictions_filled["length"] == 0]\
-    .rename(columns = {"length": "count_phage_predictions"})\
-    .drop(columns = ["prophage_start", "prophage_end", "contig"])\
-    .reset_index() 
+from load_predictions import load_predictions
+from count_predictions import count_predictions
+from prediction_stats import log_length_bounds, within_length_bounds, bounds_label
+from genome_metadata import load_genome_metadata, join_genome_metadata, count_genomes
 
-count_phage_predictions = count_phage_predictions_non_zero._append(count_phage_predictions_eq_zero)
-    
-count_phage_predictions["mean_count"] = count_phage_predictions\
-    .groupby("genome")["count_phage_predictions"]\
-    .transform(lambda x: x.mean())
-    
-count_phage_predictions = count_phage_predictions\
-    .merge(refseq_predictions, on="genome")\
-    .sort_values(
-        ['closest_match', 'mean_count', 'prediction_tool'], 
-        ascending = [True, False, True],
-        key = lambda x: x if np.issubdtype(x.dtype, np.number) else x.str.lower()
-        )\
-    .reset_index()
-
-#create source columns
-isolate_sources = {
-    'CH' : 'Chicken',
-    'PK' : 'Pork',
-    'SM' : 'Salmon',
-    'PR' : 'Prawns',
-    'LG' : 'Leafy Greens',
-    'LB' : 'Lamb',
-    'BF' : 'Beef',
-    'PA' : 'Reference',
-    'SBW' : 'Reference'
-    }
-
-count_phage_predictions['source'] = count_phage_predictions['genome']
-for key, value in isolate_sources.items():
-    count_phage_predictions.loc[count_phage_predictions['source'].str.contains(key), 'source'] = value
+project_path = "~/whitchurch_group/PRO_Foodborne_Pseudomonas_Prophages/"
 
-#plot histogram of counts per species
-def specs(x, **kwargs):
-    ax = sns.histplot(
-        data = count_phage_predictions,
-        x = x,
-        hue = "source",
-        binwidth = 1,
-        kde = True,
-        stat='probability'
-        )
-    ax.axvline(
-        x.median(), 
-        color='k', 
-        ls='--', 
-        lw=2
-        )
-plt.rcParams['figure.dpi'] = 600
-plt.rcParams['savefig.dpi'] = 600
-g = sns.FacetGrid(
-    data = count_phage_predictions, 
-    col = 'source',
-    height = 4,
-    aspect = 0.75,
-    )
-g.map(specs,'count_phage_predictions')
-g.fig.suptitle(
-    "Distributions of number of predicted prophage regions by source (bin = 1)", 
-    y = 1.05)
-g.set_titles("{col_name}") 
-g.set_axis_labels(
-    'Length of Predicted Prophage\nRegions >1000 bp', 
-    "Proportion"
-    )
-plt.show()
-sns.reset_defaults()
+def prepare_data(project_path):
+    #load files
+    phage_predictions = load_predictions(project_path)
+    genome_metadata = load_genome_metadata(project_path)
 
-#plot swarmplot of counts per species
-plt.figure(figsize=(16,8))
-g3 = sns.violinplot(
-    data = count_phage_predictions,
-    x = "source",
-    y = "count_phage_predictions",
-    hue = "source",
-    linewidth = 2,
-    cut = 0,
-    order = count_phage_predictions\
-        .groupby("source")\
-        .median("count_phage_predictions")\
+    #count predictions per genome and tool, providing a value for n = 0 predictions
+    count_phage_predictions = join_genome_metadata(count_predictions(phage_predictions), genome_metadata)\
         .sort_values(
-            "count_phage_predictions", 
-            ascending = False
+            ['closest_match', 'mean_count', 'prediction_tool'],
+            ascending = [True, False, True],
+            key = lambda x: x if pd.api.types.is_numeric_dtype(x) else x.str.lower()
             )\
-        .reset_index()["source"]
-    )
-sns.pointplot(
-    ax = g3,
-    data = count_phage_predictions,
-    x = "source",
-    y = "count_phage_predictions",
-    linestyle = "none",
-    errorbar = None,
-    marker = "+",
-    color = 'black',
-    zorder = 10
-    )
-g3.tick_params(labelsize=10)
-g3.set_xticklabels(
-    g3.get_xticklabels(),
-    rotation = 45,
-    horizontalalignment = 'right'
-    )
-g3.set_title(
-    'Distributions of number of prophage regions by source',
-    fontsize = 10
-    )
-g3.set_ylabel(
-    'Number of Predicted Prophage Regions >1000 bp', 
-    fontsize = 10
-    )
-g3.set_xlabel(
-    'Source', 
-    fontsize = 10
-    )
-plt.show()
-sns.reset_defaults()
+        .reset_index()
 
-phage_predictions["log_len"] = phage_predictions["length"].apply(lambda x: np.log(x))
-mean_log_len = phage_predictions["log_len"].mean()
-two_sig_len = 2 * phage_predictions["log_len"].std()
-upper_bound = mean_log_len + two_sig_len
-lower_bound = mean_log_len - two_sig_len
+    length_bounds = log_length_bounds(phage_predictions["length"])
 
-phage_predictions_2sigma = phage_predictions[
-    (phage_predictions['log_len'] >= lower_bound) & (phage_predictions['log_len'] <= upper_bound)]\
-    .merge(refseq_predictions, on="genome")\
-    .sort_values(
-        'prediction_tool', 
-        ascending = True,
-        key=lambda col: col.str.lower()
+    phage_predictions_2sigma = join_genome_metadata(
+        within_length_bounds(phage_predictions, length_bounds),
+        genome_metadata
         )\
-    .reset_index()
-
-phage_predictions_2sigma['source'] = phage_predictions_2sigma['genome']
-for key, value in isolate_sources.items():
-    phage_predictions_2sigma.loc[phage_predictions_2sigma['source'].str.contains(key), 'source'] = value
-
-#plot swarmplot of lengths by source
-plt.figure(figsize=(16,8))
-g3 = sns.violinplot(
-    data = phage_predictions_2sigma,
-    x = "source",
-    y = "length",
-    hue = "source",
-    linewidth = 2,
-    cut = 0,
-    order = phage_predictions_2sigma\
-        .groupby("source")\
-        .median("length")\
         .sort_values(
-            "length", 
-            ascending = False
+            'prediction_tool',
+            ascending = True,
+            key=lambda col: col.str.lower()
             )\
-        .reset_index()["source"]
-    )
-sns.pointplot(
-    ax = g3,
-    data = phage_predictions_2sigma,
-    x = "source",
-    y = "length",
-    linestyle = "none",
-    errorbar = None,
-    marker = "+",
-    color = 'black',
-    zorder = 10
-    )
-g3.tick_params(labelsize=10)
-g3.set_xticklabels(
-    g3.get_xticklabels(),
-    rotation = 45,
-    horizontalalignment = 'right'
-    )
-g3.set_title(
-    'Distribution of lengths of predicted prophage regions (μ ± 2σ [4513, 118530]) by species',
-    fontsize = 10
-    )
-g3.set_ylabel(
-    'Length of Predicted Prophage Regions >1000 bp', 
-    fontsize = 10
-    )
-g3.set_xlabel(
-    'Source', 
-    fontsize = 10
-    )
-plt.show()
-sns.reset_defaults()
-
-#plot pie chart of species 
-count_species = count_phage_predictions[["genome","closest_match"]]
-
-species_freq = (count_species['closest_match'].value_counts())/count_species.shape[0]
-less_freq_species = species_freq[species_freq<=0.02]    
-count_species.loc[count_species["closest_match"].isin(less_freq_species.index.tolist())] = "Other"
-
-count_species = count_species[["genome","closest_match"]]\
-    .groupby(["closest_match"])\
-    .count()\
-    .sort_values(
-        'genome', 
-        ascending = False)\
-    .reset_index()
-
-def func(pct, allvals):
-    absolute = int(np.round(pct/100.*np.sum(allvals)))
-    return f"{pct:.1f}%\n({absolute/5})"
+        .reset_index()
+
+    #count genomes by species, with species at <= 2% grouped into "Other", and by source
+    count_species = count_genomes(genome_metadata, "species_group")\
+        .rename(columns = {"species_group": "closest_match"})
+    count_source = count_genomes(genome_metadata, "source")
+
+    return {
+        "count_phage_predictions": count_phage_predictions,
+        "phage_predictions_2sigma": phage_predictions_2sigma,
+        "length_bounds": length_bounds,
+        "count_species": count_species,
+        "count_source": count_source
+        }
+
+#plot histogram of counts per source
+def plot_source_histogram(data):
+    count_phage_predictions = data["count_phage_predictions"]
+    def specs(x, **kwargs):
+        ax = sns.histplot(
+            data = count_phage_predictions,
+            x = x,
+            hue = "source",
+            binwidth = 1,
+            kde = True,
+            stat='probability'
+            )
+        ax.axvline(
+            x.median(),
+            color='k',
+            ls='--',
+            lw=2
+            )
+    g = sns.FacetGrid(
+        data = count_phage_predictions,
+        col = 'source',
+        height = 4,
+        aspect = 0.75,
+        )
+    g.map(specs,'count_phage_predictions')
+    g.fig.suptitle(
+        "Distributions of number of predicted prophage regions by source (bin = 1)",
+        y = 1.05)
+    g.set_titles("{col_name}")
+    g.set_axis_labels(
+        'Length of Predicted Prophage\nRegions >1000 bp',
+        "Proportion"
+        )
+    return g.fig
 
-plt.pie(
-    data = count_species, 
-    x = "genome",
-    labels = "closest_match",
-    autopct = lambda pct: func(pct, count_species['genome']),
-    pctdistance = 0.75,
-    )
-centre_circle = plt.Circle((0, 0), 0.50, fc='white')
-fig = plt.gcf()
-fig.gca().add_artist(centre_circle)
-plt.title('Foodborne Pseudomonas Collection by Species')
-plt.show()
+#plot violinplot of counts per source
+def plot_source_count_violinplot(data):
+    count_phage_predictions = data["count_phage_predictions"]
+    plt.figure(figsize=(16,8))
+    g3 = sns.violinplot(
+        data = count_phage_predictions,
+        x = "source",
+        y = "count_phage_predictions",
+        hue = "source",
+        linewidth = 2,
+        cut = 0,
+        order = count_phage_predictions\
+            .groupby("source", observed = True)\
+            .median("count_phage_predictions")\
+            .sort_values(
+                "count_phage_predictions",
+                ascending = False
+                )\
+            .reset_index()["source"]
+        )
+    sns.pointplot(
+        ax = g3,
+        data = count_phage_predictions,
+        x = "source",
+        y = "count_phage_predictions",
+        linestyle = "none",
+        errorbar = None,
+        marker = "+",
+        color = 'black',
+        zorder = 10
+        )
+    g3.tick_params(labelsize=10)
+    g3.set_xticklabels(
+        g3.get_xticklabels(),
+        rotation = 45,
+        horizontalalignment = 'right'
+        )
+    g3.set_title(
+        'Distributions of number of prophage regions by source',
+        fontsize = 10
+        )
+    g3.set_ylabel(
+        'Number of Predicted Prophage Regions >1000 bp',
+        fontsize = 10
+        )
+    g3.set_xlabel(
+        'Source',
+        fontsize = 10
+        )
+    return g3.figure
+
+#plot violinplot of lengths by source
+def plot_source_length_violinplot(data):
+    phage_predictions_2sigma = data["phage_predictions_2sigma"]
+    plt.figure(figsize=(16,8))
+    g3 = sns.violinplot(
+        data = phage_predictions_2sigma,
+        x = "source",
+        y = "length",
+        hue = "source",
+        linewidth = 2,
+        cut = 0,
+        order = phage_predictions_2sigma\
+            .groupby("source", observed = True)\
+            .median("length")\
+            .sort_values(
+                "length",
+                ascending = False
+                )\
+            .reset_index()["source"]
+        )
+    sns.pointplot(
+        ax = g3,
+        data = phage_predictions_2sigma,
+        x = "source",
+        y = "length",
+        linestyle = "none",
+        errorbar = None,
+        marker = "+",
+        color = 'black',
+        zorder = 10
+        )
+    g3.tick_params(labelsize=10)
+    g3.set_xticklabels(
+        g3.get_xticklabels(),
+        rotation = 45,
+        horizontalalignment = 'right'
+        )
+    g3.set_title(
+        f"Distribution of lengths of predicted prophage regions ({bounds_label(data['length_bounds'])}) by source",
+        fontsize = 10
+        )
+    g3.set_ylabel(
+        'Length of Predicted Prophage Regions >1000 bp',
+        fontsize = 10
+        )
+    g3.set_xlabel(
+        'Source',
+        fontsize = 10
+        )
+    return g3.figure
+
+#plot pie chart of species
+def plot_species_pie(data):
+    count_species = data["count_species"]
+    plt.figure()
+    def func(pct, allvals):
+        absolute = int(np.round(pct/100.*np.sum(allvals)))
+        return f"{pct:.1f}%\n({absolute})"
+
+    plt.pie(
+        data = count_species,
+        x = "genome",
+        labels = "closest_match",
+        autopct = lambda pct: func(pct, count_species['genome']),
+        pctdistance = 0.75,
+        )
+    centre_circle = plt.Circle((0, 0), 0.50, fc='white')
+    fig = plt.gcf()
+    fig.gca().add_artist(centre_circle)
+    plt.title('Foodborne Pseudomonas Collection by Species')
+    return fig
 
 #plot pie chart of source
-count_source = count_phage_predictions[["genome","source"]]\
-    .groupby(["source"])\
-    .count()\
-    .reset_index()
-    
-def func(pct, allvals):
-    absolute = int(np.round(pct/100.*np.sum(allvals)))
-    return f"{pct:.1f}%\n({absolute/5})"
+def plot_source_pie(data):
+    count_source = data["count_source"]
+    plt.figure()
+    def func(pct, allvals):
+        absolute = int(np.round(pct/100.*np.sum(allvals)))
+        return f"{pct:.1f}%\n({absolute})"
+
+    plt.pie(
+        data = count_source,
+        x = "genome",
+        labels = "source",
+        autopct = lambda pct: func(pct, count_source['genome']),
+        pctdistance = 0.75,
+        )
+    centre_circle = plt.Circle((0, 0), 0.50, fc='white')
+    fig = plt.gcf()
+    fig.gca().add_artist(centre_circle)
+    plt.title('Foodborne Pseudomonas Collection by Source')
+    return fig
+
+figures = {
+    "source_histogram": plot_source_histogram,
+    "source_count_violinplot": plot_source_count_violinplot,
+    "source_length_violinplot": plot_source_length_violinplot,
+    "species_pie": plot_species_pie,
+    "source_pie": plot_source_pie
+    }
 
-plt.pie(
-    data = count_source, 
-    x = "genome",
-    labels = "source",
-    autopct = lambda pct: func(pct, count_source['genome']),
-    pctdistance = 0.75,
-    )
-centre_circle = plt.Circle((0, 0), 0.50, fc='white')
-fig = plt.gcf()
-fig.gca().add_artist(centre_circle)
-plt.title('Foodborne Pseudomonas Collection by Source')
-plt.show()
\ No newline at end of file
+if __name__ == "__main__":
+    data = prepare_data(project_path)
+    for plot in figures.values():
+        plot(data)
+        plt.show()
+        sns.reset_defaults()
@@ -0,0 +1,114 @@
+import glob
+import os
+import re
+
+from fasta_index import contig_lengths, open_fasta, record_name, record_spans
+
+#contig headers of a batch are <genome><separator><contig>
+separator = "__"
+
+#outputs of each tool that are split back per genome, relative to the tool's output directory
+#{genome} is the input file name, the batch name in the batch output and the genome name once split
+batch_outputs = {
+    "VIBRANT": [
+        "VIBRANT_{genome}/VIBRANT_results_{genome}/VIBRANT_integrated_prophage_coordinates_{genome}.tsv",
+        "VIBRANT_{genome}/VIBRANT_results_{genome}/VIBRANT_summary_results_{genome}.tsv",
+        "VIBRANT_{genome}/VIBRANT_phages_{genome}/{genome}.phages_combined.fna"
+        ],
+    "VirSorter": ["final-viral-boundary.tsv", "final-viral-score.tsv", "final-viral-combined.fa"],
+    "GeNomad": [
+        "{genome}_summary/{genome}_virus_genes.tsv",
+        "{genome}_summary/{genome}_virus_summary.tsv",
+        "{genome}_summary/{genome}_virus.fna"
+        ],
+    "PhageBoost": ["phages_{genome}.gff", "*.fasta"]
+    }
+
+fasta_extensions = (".fna", ".fa", ".fasta", ".faa", ".ffn")
+
+#consecutive groups of assemblies with at most max_bases of sequence each, a larger assembly forms a batch alone
+def build_batches(assemblies, max_bases):
+    batches = []
+    batch, total = {}, 0
+    for genome, fasta in assemblies.items():
+        length = sum(contig_lengths(fasta).values())
+        if batch and total + length > max_bases:
+            batches.append(batch)
+            batch, total = {}, 0
+        batch[genome] = fasta
+        total += length
+    if batch:
+        batches.append(batch)
+    return batches
+
+#one fasta of all contigs of a batch with genome prefixed headers
+def write_batch_fasta(path, batch):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path + ".temp", "wb") as handle:
+        for genome, fasta in batch.items():
+            data = open_fasta(fasta)
+            if data is None:
+                continue
+            try:
+                for header, start, end in record_spans(data):
+                    sequence = data[start:end]
+                    handle.write(f">{genome}{separator}{record_name(data, header, start)}\n".encode())
+                    handle.write(sequence if sequence.endswith(b"\n") else sequence + b"\n")
+            finally:
+                data.close()
+    os.replace(path + ".temp", path)
+
+#genome prefix at the start of a contig name, wherever the tool has put it in a line
+def genome_pattern(genomes):
+    names = sorted(genomes, key = len, reverse = True)
+    return re.compile(r"(?<![\w.-])(" + "|".join(map(re.escape, names)) + ")" + re.escape(separator))
+
+#split one output file of a batch per genome, removing the genome prefixes
+#table lines go to the genome they name and lines naming none (headers, comments) to every genome,
+#fasta sequence lines follow their header; genomes are given an empty file if nothing of theirs is in it
+def split_file(source, destinations, pattern):
+    is_fasta = source.endswith(fasta_extensions)
+    handles = {}
+    try:
+        for genome, path in destinations.items():
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            handles[genome] = open(path + ".temp", "w")
+        current = None
+        with open(source) as handle:
+            for line in handle:
+                match = pattern.search(line)
+                if is_fasta and not line.startswith(">"):
+                    targets = [current] if current else []
+                elif match:
+                    targets = [match.group(1)]
+                else:
+                    targets = [] if is_fasta else list(handles)
+                if is_fasta and line.startswith(">"):
+                    current = match.group(1) if match else None
+                line = pattern.sub("", line)
+                for genome in targets:
+                    handles[genome].write(line)
+    finally:
+        for handle in handles.values():
+            handle.close()
+    for path in destinations.values():
+        os.replace(path + ".temp", path)
+
+#split the outputs of a batch run into output_<tool>/<genome>/ as if each genome had been run alone
+def demultiplex(tool, batch_name, batch_outdir, genome_outdirs):
+    pattern = genome_pattern(genome_outdirs)
+    for outdir in genome_outdirs.values():
+        os.makedirs(outdir, exist_ok = True)
+    for template in batch_outputs[tool]:
+        if "*" in template:
+            sources = glob.glob(os.path.join(batch_outdir, template.format(genome = batch_name)))
+        else:
+            sources = [os.path.join(batch_outdir, template.format(genome = batch_name))]
+        for source in sources:
+            if not os.path.exists(source):
+                continue
+            relative = os.path.relpath(source, batch_outdir)
+            split_file(source, {
+                genome: os.path.join(outdir, relative.replace(batch_name, genome))
+                for genome, outdir in genome_outdirs.items()
+                }, pattern)
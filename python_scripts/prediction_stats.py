@@ -0,0 +1,80 @@
+import json
+import os
+import numpy as np
+
+from count_predictions import count_predictions
+from genome_metadata import join_genome_metadata
+
+quantile_levels = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+#mean ± n_sigma standard deviations of log length, with the bounds also given in bp
+def log_length_bounds(lengths, n_sigma = 2):
+    log_length = np.log(np.asarray(lengths, dtype = np.float64))
+    mean = float(log_length.mean())
+    sd = float(log_length.std(ddof = 1))
+    return {
+        "n": int(len(log_length)),
+        "n_sigma": n_sigma,
+        "mean_log_length": mean,
+        "sd_log_length": sd,
+        "lower_log_length": mean - n_sigma * sd,
+        "upper_log_length": mean + n_sigma * sd,
+        "lower": float(np.exp(mean - n_sigma * sd)),
+        "upper": float(np.exp(mean + n_sigma * sd))
+        }
+
+#bounds computed separately for each prediction tool
+def log_length_bounds_by_tool(phage_predictions, n_sigma = 2):
+    lengths = phage_predictions\
+        .groupby("prediction_tool", observed = True)["length"]
+    return {
+        str(tool): log_length_bounds(length, n_sigma)
+        for tool, length in lengths
+        }
+
+#predictions whose log length is within the bounds
+def within_length_bounds(phage_predictions, bounds):
+    log_length = np.log(phage_predictions["length"].to_numpy(dtype = np.float64))
+    return phage_predictions[
+        (log_length >= bounds["lower_log_length"]) & (log_length <= bounds["upper_log_length"])
+        ]
+
+#bounds for figure titles, e.g. μ ± 2σ [4513, 118530]
+def bounds_label(bounds):
+    return f"μ ± {bounds['n_sigma']:g}σ [{bounds['lower']:.0f}, {bounds['upper']:.0f}]"
+
+#count, mean and quantiles of a value for each group
+def grouped_quantiles(frame, by, value, levels = quantile_levels):
+    grouped = frame.groupby(by, observed = True)[value]
+    summary = grouped.quantile(levels).unstack()
+    summary.columns = ["median" if level == 0.5 else f"q{level * 100:g}" for level in levels]
+    summary.insert(0, "n", grouped.size())
+    summary.insert(1, "mean", grouped.mean())
+    return summary.reset_index()
+
+#summary tables of prediction counts and lengths, without anything being plotted
+#per species and per source tables are added when genome metadata is given
+def prediction_stats(phage_predictions, genome_metadata = None):
+    counts = count_predictions(phage_predictions)
+    stats = {
+        "counts": counts,
+        "count_quantiles_by_tool": grouped_quantiles(counts, "prediction_tool", "count_phage_predictions"),
+        "length_quantiles_by_tool": grouped_quantiles(phage_predictions, "prediction_tool", "length")
+        }
+    if genome_metadata is not None:
+        counts = join_genome_metadata(counts, genome_metadata, ["source", "closest_match"])
+        lengths = join_genome_metadata(
+            phage_predictions[["genome", "length"]], genome_metadata, ["source", "closest_match"]
+            )
+        for column, name in [("closest_match", "species"), ("source", "source")]:
+            stats[f"count_quantiles_by_{name}"] = grouped_quantiles(counts, column, "count_phage_predictions")
+            stats[f"length_quantiles_by_{name}"] = grouped_quantiles(lengths, column, "length")
+    return stats
+
+#write each table as tsv and the length bounds as json to outdir
+def write_stats(stats, bounds, outdir):
+    os.makedirs(outdir, exist_ok = True)
+    for name, table in stats.items():
+        table.to_csv(os.path.join(outdir, f"{name}.tsv"), sep = "\t", index = False, float_format = "%.6g")
+    with open(os.path.join(outdir, "length_bounds.json"), "w") as handle:
+        json.dump(bounds, handle, indent = 1)
@@ -0,0 +1,172 @@
+import argparse
+import importlib
+import os
+import sys
+
+from run_report import quote, recorded_stage, report_path
+
+#plotting script behind each figure subcommand
+#the plotting scripts, matplotlib, seaborn and scipy are only imported by the subcommands that draw figures
+figure_commands = {
+    "counts": "plot_num_phages",
+    "lengths": "plot_length_phages",
+    "by-genome": "plot_predictions_by_genome",
+    "by-source": "plot_predictions_by_source"
+    }
+
+#per tool summary of the predictions, needing only pandas
+def summarize(args):
+    from load_predictions import load_predictions
+    from count_predictions import tool_summary
+    summary = tool_summary(load_predictions(args.project_path))
+    summary.to_csv(args.output or sys.stdout, sep = "\t", index = False, float_format = "%.6g")
+
+#summary tables and log length bounds written as tsv and json, without plotting
+def stats(args):
+    from load_predictions import load_predictions
+    from genome_metadata import load_genome_metadata
+    from prediction_stats import prediction_stats, log_length_bounds, log_length_bounds_by_tool, write_stats
+    phage_predictions = load_predictions(args.project_path)
+    try:
+        genome_metadata = load_genome_metadata(args.project_path)
+    except FileNotFoundError:
+        print("WARNING: no refseq_masher matches found, skipping per species and per source tables")
+        genome_metadata = None
+    bounds = {"collection": log_length_bounds(phage_predictions["length"], args.n_sigma)}
+    if args.per_tool:
+        bounds["prediction_tool"] = log_length_bounds_by_tool(phage_predictions, args.n_sigma)
+    outdir = args.outdir or os.path.join(os.path.expanduser(args.project_path), "prophage_regions", "stats")
+    write_stats(prediction_stats(phage_predictions, genome_metadata), bounds, outdir)
+    print(f"stats written to {outdir}")
+
+#tool x tool correlation matrices and pairwise tables of counts and mean lengths, without plotting
+def correlations(args):
+    from load_predictions import load_predictions
+    from tool_correlation import count_matrix, mean_length_matrix, tool_correlations, correlation_matrix
+    phage_predictions = load_predictions(args.project_path)
+    outdir = args.outdir or os.path.join(os.path.expanduser(args.project_path), "prophage_regions", "stats")
+    os.makedirs(outdir, exist_ok = True)
+    for name, wide in [("count", count_matrix(phage_predictions)), ("length", mean_length_matrix(phage_predictions))]:
+        pairs, bands = tool_correlations(wide, args.method, args.n_boot, args.ci, args.seed)
+        pairs.to_csv(os.path.join(outdir, f"{name}_{args.method}_correlations.tsv"), sep = "\t", index = False)
+        correlation_matrix(pairs)\
+            .to_csv(os.path.join(outdir, f"{name}_{args.method}_correlation_matrix.tsv"), sep = "\t")
+    print(f"correlations written to {outdir}")
+
+#swarmplot size threshold, set on the module before its data is prepared
+def set_max_swarm_points(args):
+    if getattr(args, "max_swarm_points", None) is not None:
+        importlib.import_module("plot_predictions_by_genome").max_swarm_points = args.max_swarm_points
+
+#figures of one plotting script, written to outdir or shown interactively
+def plot(args):
+    script = figure_commands[args.command]
+    if args.outdir:
+        render(args, [script])
+        return
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    set_max_swarm_points(args)
+    module = importlib.import_module(script)
+    data = module.prepare_data(args.project_path)
+    for name in args.figures or module.figures:
+        module.figures[name](data)
+        plt.show()
+        sns.reset_defaults()
+
+def render(args, scripts = None):
+    from render_figures import render_figures, figure_scripts
+    set_max_swarm_points(args)
+    cache_dir = None if args.no_cache else (args.cache_dir or os.path.join(args.outdir, ".figure_cache"))
+    render_figures(
+        args.project_path, args.outdir, args.format, args.dpi, args.workers, scripts or figure_scripts,
+        cache_dir, int(args.cache_size * 1024 ** 2)
+        )
+
+def add_render_arguments(parser):
+    parser.add_argument("-f", "--format", default = "png", help = "figure file format, e.g. png, pdf, svg (default png)")
+    parser.add_argument("-d", "--dpi", type = int, default = 600, help = "figure resolution (default 600)")
+    parser.add_argument("-w", "--workers", type = int, default = None, help = "number of rendering processes")
+    parser.add_argument("-c", "--cache-dir", default = None, help = "figure cache directory (default <outdir>/.figure_cache)")
+    parser.add_argument("--no-cache", action = "store_true", help = "render every figure without the cache")
+    parser.add_argument("--cache-size", type = float, default = 2048, help = "maximum cache size in MB (default 2048)")
+
+def add_swarm_argument(parser):
+    parser.add_argument(
+        "--max-swarm-points", type = int, default = None,
+        help = "genome x tool points above which the genome swarmplot is drawn as a heatmap (default 200)"
+        )
+
+def build_parser():
+    parser = argparse.ArgumentParser(description = "Summarise and plot prophage predictions for a project")
+    parser.add_argument(
+        "-R", "--report", default = None,
+        help = "json lines run report to record the command's time, CPU, peak memory and exit status in "
+            "(default $PROPHAGE_RUN_REPORT, else not recorded)"
+        )
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+
+    summary_parser = subparsers.add_parser("summarize", help = "per tool prediction summary table")
+    summary_parser.add_argument("project_path", help = "project directory containing prophage_regions/")
+    summary_parser.add_argument("-o", "--output", default = None, help = "tsv to write to (default stdout)")
+    summary_parser.set_defaults(function = summarize)
+
+    stats_parser = subparsers.add_parser("stats", help = "summary tables and length bounds as tsv and json")
+    stats_parser.add_argument("project_path", help = "project directory containing prophage_regions/ and refseq_masher/")
+    stats_parser.add_argument(
+        "-o", "--outdir", default = None,
+        help = "directory to write tables to (default <project_path>/prophage_regions/stats)"
+        )
+    stats_parser.add_argument(
+        "-s", "--n-sigma", type = float, default = 2,
+        help = "standard deviations of log length for the length bounds (default 2)"
+        )
+    stats_parser.add_argument("-t", "--per-tool", action = "store_true", help = "also compute length bounds per tool")
+    stats_parser.set_defaults(function = stats)
+
+    correlation_parser = subparsers.add_parser(
+        "correlations", help = "tool x tool correlations of counts and mean lengths with bootstrap intervals"
+        )
+    correlation_parser.add_argument("project_path", help = "project directory containing prophage_regions/")
+    correlation_parser.add_argument(
+        "-o", "--outdir", default = None,
+        help = "directory to write tables to (default <project_path>/prophage_regions/stats)"
+        )
+    correlation_parser.add_argument("-m", "--method", choices = ["pearson", "spearman"], default = "pearson")
+    correlation_parser.add_argument("-b", "--n-boot", type = int, default = 1000, help = "bootstrap resamples (default 1000)")
+    correlation_parser.add_argument("--ci", type = float, default = 95, help = "confidence interval width (default 95)")
+    correlation_parser.add_argument("--seed", type = int, default = 0, help = "bootstrap random seed (default 0)")
+    correlation_parser.set_defaults(function = correlations)
+
+    for command, script in figure_commands.items():
+        figure_parser = subparsers.add_parser(command, help = f"figures from {script}.py")
+        figure_parser.add_argument("project_path", help = "project directory containing prophage_regions/ and refseq_masher/")
+        figure_parser.add_argument(
+            "-o", "--outdir", default = None,
+            help = "render figures to this directory instead of showing them"
+            )
+        figure_parser.add_argument(
+            "-n", "--figures", nargs = "+", default = None,
+            help = "names of the figures to show (default all)"
+            )
+        add_render_arguments(figure_parser)
+        if script == "plot_predictions_by_genome":
+            add_swarm_argument(figure_parser)
+        figure_parser.set_defaults(function = plot)
+
+    render_parser = subparsers.add_parser("render", help = "render all figures to files without a display")
+    render_parser.add_argument("project_path", help = "project directory containing prophage_regions/ and refseq_masher/")
+    render_parser.add_argument("-o", "--outdir", default = "figures", help = "directory to write figures to (default figures/)")
+    add_render_arguments(render_parser)
+    add_swarm_argument(render_parser)
+    render_parser.set_defaults(function = render)
+    return parser
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    #the predictions table is the input whose size the analysis time scales with
+    inputs = [os.path.join(os.path.expanduser(args.project_path), "prophage_regions", "concatenated_predictions_summary.csv")]
+    with recorded_stage(
+            report_path(args.report), "analysis", tool = args.command, inputs = inputs, command = quote(sys.argv)
+            ):
+        args.function(args)
@@ -0,0 +1,131 @@
+import argparse
+import importlib
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use("Agg")
+
+from figure_cache import FigureCache, TrackedData, figure_key
+
+#plotting scripts rendered in batch mode, each providing prepare_data(project_path) and a figures dict
+figure_scripts = [
+    "plot_num_phages",
+    "plot_length_phages",
+    "plot_predictions_by_genome",
+    "plot_predictions_by_source"
+    ]
+
+#prepared dataframes per script, set in each worker by the pool initializer
+#with the default fork start method workers inherit them from the parent without pickling
+script_data = {}
+
+#the parent's warning filters are applied too, so that warnings ignored by the caller are not printed by workers
+def set_script_data(data, warning_filters = ()):
+    matplotlib.use("Agg")
+    script_data.update(data)
+    warnings.resetwarnings()
+    for action, message, category, module, lineno in warning_filters:
+        #patterns are stored compiled by filterwarnings and as None by simplefilter
+        warnings.filterwarnings(
+            action, getattr(message, "pattern", message) or "", category, getattr(module, "pattern", module) or "",
+            lineno, append = True
+            )
+
+def figure_path(outdir, script, name, fmt):
+    return os.path.join(outdir, f"{script.removeprefix('plot_')}_{name}.{fmt}")
+
+#render one figure from the prepared data and write it to outdir
+#returns the names of the prepared data entries the figure read, used for its cache key
+def render_figure(script, name, outdir, fmt, dpi):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    module = importlib.import_module(script)
+    data = TrackedData(script_data[script])
+    try:
+        fig = module.figures[name](data)
+        path = figure_path(outdir, script, name, fmt)
+        #unlink first, the old file may be hardlinked to a cached copy that must not be overwritten
+        if os.path.exists(path):
+            os.remove(path)
+        fig.savefig(path, format = fmt, dpi = dpi, bbox_inches = "tight")
+    finally:
+        plt.close("all")
+        sns.reset_defaults()
+    return path, sorted(data.accessed)
+
+#prepare each script's data once, reuse cached figures whose inputs are unchanged and render the rest concurrently
+def render_figures(
+    project_path, outdir, fmt = "png", dpi = 600, workers = None, scripts = figure_scripts,
+    cache_dir = None, cache_size = 2 * 1024 ** 3
+    ):
+    os.makedirs(outdir, exist_ok = True)
+    cache = FigureCache(cache_dir, cache_size) if cache_dir else None
+    data = {}
+    tasks = []
+    paths = []
+    for script in scripts:
+        module = importlib.import_module(script)
+        data[script] = module.prepare_data(project_path)
+        for name, function in module.figures.items():
+            path = figure_path(outdir, script, name, fmt)
+            key = cache.lookup_key(f"{script}/{name}", function, data[script], fmt, dpi) if cache else None
+            if key and cache.fetch(key, path):
+                paths.append(path)
+                print(f"unchanged {path}")
+            else:
+                tasks.append((script, name))
+
+    with ProcessPoolExecutor(
+        max_workers = workers,
+        initializer = set_script_data,
+        initargs = (data, list(warnings.filters))
+        ) as executor:
+        futures = {
+            executor.submit(render_figure, script, name, outdir, fmt, dpi): (script, name)
+            for script, name in tasks
+            }
+        for future in as_completed(futures):
+            script, name = futures[future]
+            try:
+                path, data_keys = future.result()
+            except Exception as error:
+                print(f"ERROR: failed to render {script} {name}: {error!r}")
+                continue
+            paths.append(path)
+            print(f"rendered {path}")
+            if cache:
+                function = importlib.import_module(script).figures[name]
+                key = figure_key(function, data[script], data_keys, fmt, dpi)
+                cache.store(key, f"{script}/{name}", data_keys, path)
+    if cache:
+        cache.save()
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Render all prophage analysis figures to files without a display")
+    parser.add_argument("project_path", help = "project directory containing prophage_regions/ and refseq_masher/")
+    parser.add_argument("-o", "--outdir", default = "figures", help = "directory to write figures to (default figures/)")
+    parser.add_argument("-f", "--format", default = "png", help = "figure file format, e.g. png, pdf, svg (default png)")
+    parser.add_argument("-d", "--dpi", type = int, default = 600, help = "figure resolution (default 600)")
+    parser.add_argument("-w", "--workers", type = int, default = None, help = "number of rendering processes")
+    parser.add_argument(
+        "-s", "--scripts", nargs = "+", default = figure_scripts, choices = figure_scripts,
+        help = "plotting scripts to render (default all)"
+        )
+    parser.add_argument(
+        "-c", "--cache-dir", default = None,
+        help = "directory to cache rendered figures in, unchanged figures are reused (default <outdir>/.figure_cache)"
+        )
+    parser.add_argument("--no-cache", action = "store_true", help = "render every figure without the cache")
+    parser.add_argument(
+        "--cache-size", type = float, default = 2048,
+        help = "maximum cache size in MB, least recently used figures are evicted first (default 2048)"
+        )
+    args = parser.parse_args()
+    cache_dir = None if args.no_cache else (args.cache_dir or os.path.join(args.outdir, ".figure_cache"))
+    render_figures(
+        args.project_path, args.outdir, args.format, args.dpi, args.workers, args.scripts,
+        cache_dir, int(args.cache_size * 1024 ** 2)
+        )
@@ -0,0 +1,126 @@
+import argparse
+import fnmatch
+import os
+import shlex
+import sys
+
+#paths the pipeline used to locate with `sudo find ~ -maxdepth <depth>`, by config key
+#(name pattern, case insensitive, directories only, maximum depth below home)
+path_specs = {
+    "conda_sh": ("conda.sh", False, False, 4),
+    "envs": ("envs", False, False, 3),
+    "prophage_databases": ("prophage_databases", False, False, 5),
+    "vibrant_db": ("vibrant_db", True, True, 6),
+    "virsorter_db": ("virsorter_db", True, True, 6),
+    "genomad_db": ("genomad_db", True, True, 6),
+    "checkv_db": ("checkv-db*", True, True, 6),
+    "bakta_db": ("bakta.db", False, False, 6)
+    }
+
+default_config = os.path.join("~", ".config", "prophageAnalysis", "paths.sh")
+
+#config file path, overridable with $PROPHAGE_PATHS so that shell stages and python share one file
+def config_path(path = None):
+    return os.path.expanduser(path or os.environ.get("PROPHAGE_PATHS", default_config))
+
+def matches(name, is_dir, spec):
+    pattern, ignore_case, dirs_only, _ = spec
+    if dirs_only and not is_dir:
+        return False
+    if ignore_case:
+        return fnmatch.fnmatchcase(name.lower(), pattern.lower())
+    return fnmatch.fnmatchcase(name, pattern)
+
+#one breadth-first walk of home for all keys at once, keeping the shallowest match of each
+#the walk stops at the deepest maxdepth still needed, or once every key has been found
+def discover(keys, root = "~"):
+    root = os.path.expanduser(root)
+    pending = {key: path_specs[key] for key in keys}
+    found = {}
+    level = [root]
+    depth = 0
+    while level and pending:
+        depth += 1
+        if depth > max(spec[3] for spec in pending.values()):
+            break
+        next_level = []
+        for directory in level:
+            try:
+                entries = sorted(os.scandir(directory), key = lambda entry: entry.name)
+            except OSError:
+                continue
+            for entry in entries:
+                is_dir = entry.is_dir(follow_symlinks = False)
+                for key, spec in list(pending.items()):
+                    if depth <= spec[3] and matches(entry.name, is_dir, spec):
+                        found[key] = entry.path
+                        del pending[key]
+                if is_dir:
+                    next_level.append(entry.path)
+        level = next_level
+    return {key: found.get(key, "") for key in keys}
+
+def read_config(path):
+    paths = {}
+    if not os.path.exists(path):
+        return paths
+    with open(path) as handle:
+        for line in handle:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            paths[key] = shlex.split(value)[0] if value else ""
+    return paths
+
+#config written as shell variable assignments so that stages can source it directly
+def write_config(path, paths):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    temp = path + ".temp"
+    with open(temp, "w") as handle:
+        handle.write("#paths found by python_scripts/resolve_paths.py, run it with --refresh to rediscover\n")
+        for key, value in paths.items():
+            handle.write(f"{key}={shlex.quote(value)}\n")
+    os.replace(temp, path)
+
+#cached paths, rediscovering only keys that are missing from the config or no longer exist
+#keys found to be absent are cached as empty and only searched for again with refresh
+def resolve_paths(path = None, refresh = False, root = "~"):
+    path = config_path(path)
+    paths = {} if refresh else read_config(path)
+    stale = [
+        key for key in path_specs
+        if key not in paths or (paths[key] and not os.path.exists(paths[key]))
+        ]
+    if stale:
+        print(f"searching {root} for {', '.join(stale)}", file = sys.stderr)
+        paths.update(discover(stale, root))
+        write_config(path, {key: paths.get(key, "") for key in {**path_specs, **paths}})
+    return paths
+
+#record a path, e.g. a database that a stage has just downloaded
+def set_paths(path, updates):
+    path = config_path(path)
+    paths = resolve_paths(path)
+    paths.update({key: os.path.abspath(os.path.expanduser(value)) for key, value in updates.items()})
+    write_config(path, paths)
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description = "Find conda and database paths once and cache them in a config file shared by all stages"
+        )
+    parser.add_argument("-c", "--config", default = None, help = f"config file (default $PROPHAGE_PATHS or {default_config})")
+    parser.add_argument("-r", "--refresh", action = "store_true", help = "search for every path again")
+    parser.add_argument("-g", "--get", default = None, choices = list(path_specs), help = "print one path")
+    parser.add_argument("-s", "--set", nargs = "+", default = [], metavar = "KEY=PATH", help = "record paths")
+    parser.add_argument("--root", default = "~", help = "directory to search (default ~)")
+    args = parser.parse_args()
+
+    paths = resolve_paths(args.config, args.refresh, args.root)
+    if args.set:
+        paths = set_paths(args.config, dict(entry.split("=", 1) for entry in args.set))
+    if args.get:
+        print(paths.get(args.get, ""))
+    else:
+        print(config_path(args.config))
@@ -0,0 +1,212 @@
+import argparse
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+
+from fasta_index import open_fasta, record_name, record_spans
+
+default_cache = os.path.join("~", ".cache", "prophageAnalysis", "results")
+
+#ioctl cloning a whole file as copy on write extents, on filesystems that support it (btrfs, xfs)
+FICLONE = 0x40049409
+
+#cache directory, overridable with $PROPHAGE_RESULT_CACHE so that every project and stage shares one cache
+def cache_dir(path = None):
+    return os.path.expanduser(path or os.environ.get("PROPHAGE_RESULT_CACHE", default_cache))
+
+#sha256 of the contig names and sequences of an assembly, independent of its file name and line wrapping
+def sequence_hash(path):
+    digest = hashlib.sha256()
+    data = open_fasta(path)
+    if data is None:
+        return digest.hexdigest()
+    try:
+        for header, start, end in record_spans(data):
+            digest.update(record_name(data, header, start).encode() + b"\n")
+            digest.update(data[start:end].translate(None, b"\r\n") + b"\n")
+    finally:
+        data.close()
+    return digest.hexdigest()
+
+#key of a result from the assembly sequence hash, tool, tool version and parameters
+#the genome name is only part of the key for tools that write it into their outputs
+def result_key(sequence, tool, version, parameters, genome = None):
+    key = json.dumps([sequence, tool, version, parameters, genome])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def clone_file(source, destination):
+    with open(source, "rb") as source_handle, open(destination, "wb") as destination_handle:
+        fcntl.ioctl(destination_handle.fileno(), FICLONE, source_handle.fileno())
+
+#reflink where the filesystem supports it, else a hardlink if allowed, else a copy
+def link_file(source, destination, hardlink = True):
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        clone_file(source, destination)
+        return
+    except OSError:
+        os.remove(destination)
+    if hardlink:
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass
+    shutil.copy2(source, destination)
+
+#output files of a tool run, relative to its output directory
+def list_files(outdir):
+    return sorted(
+        os.path.relpath(os.path.join(root, name), outdir)
+        for root, dirs, names in os.walk(outdir)
+        for name in names
+        )
+
+#path of a cached file for another genome, renaming the stored genome only where it is not part of a longer name
+def rename_genome(relative, stored, genome):
+    return re.sub(rf"(?<![A-Za-z0-9]){re.escape(stored)}(?![A-Za-z0-9])", lambda match: genome, relative)
+
+#tool outputs stored by key, shared by all projects and evicted least recently used first once over max_bytes
+#each entry is a directory holding the files and an entry.json, whose mtime records when it was last used,
+#so that concurrent runs in different projects need no shared index
+class ResultCache:
+    def __init__(self, cache_dir, max_bytes = 50 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(cache_dir, "entries"), exist_ok = True)
+        os.makedirs(os.path.join(cache_dir, "tmp"), exist_ok = True)
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, "entries", key[:2], key)
+
+    def read_entry(self, key):
+        try:
+            with open(os.path.join(self.entry_dir(key), "entry.json")) as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    #link the files of an entry into outdir, with the genome they were stored under renamed in their paths
+    #returns False on a miss, including an entry evicted while it was being linked
+    def fetch(self, key, outdir, genome):
+        entry = self.read_entry(key)
+        if entry is None:
+            return False
+        files_dir = os.path.join(self.entry_dir(key), "files")
+        try:
+            for relative in entry["files"]:
+                destination = os.path.join(outdir, rename_genome(relative, entry["genome"], genome))
+                os.makedirs(os.path.dirname(destination), exist_ok = True)
+                link_file(os.path.join(files_dir, relative), destination)
+            os.utime(os.path.join(self.entry_dir(key), "entry.json"))
+        except FileNotFoundError:
+            return False
+        return True
+
+    #copy files of outdir (default all) into a new entry that replaces any older one in a single rename
+    #files are reflinked or copied rather than hardlinked so that later edits in a project do not reach the cache
+    def store(self, key, outdir, genome, files = None, metadata = None):
+        files = list_files(outdir) if files is None else sorted(files)
+        temp = os.path.join(self.cache_dir, "tmp", f"{key}.{os.getpid()}")
+        if os.path.exists(temp):
+            shutil.rmtree(temp)
+        size = 0
+        for relative in files:
+            destination = os.path.join(temp, "files", relative)
+            os.makedirs(os.path.dirname(destination), exist_ok = True)
+            link_file(os.path.join(outdir, relative), destination, hardlink = False)
+            size += os.path.getsize(destination)
+        with open(os.path.join(temp, "entry.json"), "w") as handle:
+            json.dump({
+                "genome": genome,
+                "files": files,
+                "size": size,
+                "stored": time.time(),
+                **(metadata or {})
+                }, handle, indent = 1)
+        entry_dir = self.entry_dir(key)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok = True)
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir, ignore_errors = True)
+        try:
+            os.rename(temp, entry_dir)
+        except OSError:
+            #stored meanwhile by a run in another project
+            shutil.rmtree(temp)
+
+    #remove least recently used entries until the cache is within max_bytes, returning the bytes left
+    #space of an evicted entry is only freed once no project still holds hardlinks to its files
+    def evict(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, "entries", "*", "*", "entry.json")):
+            try:
+                with open(path) as handle:
+                    entries.append((os.path.getmtime(path), json.load(handle)["size"], os.path.dirname(path)))
+            except (OSError, ValueError, KeyError):
+                continue
+        total = sum(size for last_used, size, path in entries)
+        for last_used, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors = True)
+            total -= size
+        return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description = "Fetch and store tool outputs in a cache shared across projects, keyed by assembly sequence, "
+            "tool, version and parameters"
+        )
+    parser.add_argument(
+        "-C", "--cache", default = None,
+        help = f"cache directory (default $PROPHAGE_RESULT_CACHE or {default_cache})"
+        )
+    parser.add_argument("-s", "--size", type = float, default = 50, help = "cache size cap in GB (default 50)")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+    for command, command_help in [
+            ("fetch", "link a cached result into the output directory, exiting 1 on a miss"),
+            ("store", "store files of the output directory as the result")
+            ]:
+        command_parser = subparsers.add_parser(command, help = command_help)
+        command_parser.add_argument("fasta", help = "assembly the tool was run on")
+        command_parser.add_argument("-o", "--outdir", required = True, help = "output directory of the tool")
+        command_parser.add_argument("-t", "--tool", required = True, help = "tool name")
+        command_parser.add_argument("-V", "--tool-version", required = True, help = "tool version")
+        command_parser.add_argument("-p", "--parameters", default = "", help = "tool parameters")
+        command_parser.add_argument(
+            "-g", "--genome", default = None,
+            help = "genome name in the output file names (default the fasta name up to the first '.')"
+            )
+        command_parser.add_argument(
+            "--by-name", action = "store_true",
+            help = "also key on the genome name, for tools that write it into their outputs"
+            )
+        if command == "store":
+            command_parser.add_argument(
+                "-f", "--files", nargs = "+", default = None,
+                help = "files to store, relative to the output directory (default all)"
+                )
+    subparsers.add_parser("evict", help = "remove least recently used results until within the size cap")
+    args = parser.parse_args()
+
+    cache = ResultCache(cache_dir(args.cache), args.size * 1024 ** 3)
+    if args.command == "evict":
+        print(f"{cache.evict() / 1024 ** 3:.2f} GB cached in {cache.cache_dir}")
+    else:
+        genome = args.genome or os.path.basename(args.fasta).split(".")[0]
+        key = result_key(
+            sequence_hash(args.fasta), args.tool, args.tool_version, args.parameters, genome if args.by_name else None
+            )
+        if args.command == "fetch":
+            if not cache.fetch(key, args.outdir, genome):
+                raise SystemExit(1)
+            print(f"{args.tool} result for {genome} linked from {cache.entry_dir(key)}")
+        else:
+            cache.store(key, args.outdir, genome, args.files, {"tool": args.tool, "version": args.tool_version})
+            cache.evict()
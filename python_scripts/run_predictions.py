@@ -0,0 +1,426 @@
+import argparse
+import json
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import time
+
+from fasta_index import find_assemblies
+from prediction_batches import build_batches, demultiplex, write_batch_fasta
+from resolve_paths import resolve_paths
+from result_cache import ResultCache, cache_dir, result_key, sequence_hash
+from run_report import append_record, exit_status, make_record, process_record, report_path
+
+#command, version command, conda env, database path key in resolve_paths.py and resources of each prediction tool
+#per genome, threads are allocated per job between min_threads and max_threads from a fair share of the core budget
+tool_specs = {
+    "VIBRANT": {
+        "env": "vibrant",
+        "command": "VIBRANT_run.py -i {fasta} -folder {outdir} -d {db}/databases/ -m {db}/files/ -t {threads}",
+        "version": "VIBRANT_run.py --version",
+        "database": "vibrant_db",
+        "min_threads": 1,
+        "max_threads": 8,
+        "memory_gb": 4
+        },
+    "VirSorter": {
+        "env": "virsorter",
+        "command": "virsorter run -w {outdir} -i {fasta} --min-length 1500 --rm-tmpdir -j {threads}",
+        "version": "virsorter --version",
+        "database": None,
+        "min_threads": 1,
+        "max_threads": 8,
+        "memory_gb": 8
+        },
+    "GeNomad": {
+        "env": "genomad",
+        "command": "genomad end-to-end --cleanup --splits 4 --threads {threads} {fasta} {outdir} {db}",
+        "version": "genomad --version",
+        "database": "genomad_db",
+        "min_threads": 1,
+        "max_threads": 16,
+        "memory_gb": 16
+        },
+    "PhageBoost": {
+        "env": "PhageBoost-env",
+        "command": "PhageBoost -f {fasta} -o {outdir} -c 1000 --threads {threads}",
+        "version": "python -c \"import pkg_resources; print(pkg_resources.get_distribution('PhageBoost').version)\"",
+        "database": None,
+        "min_threads": 1,
+        "max_threads": 15,
+        "memory_gb": 4
+        }
+    }
+
+def job_outdir(output_dir, tool, genome):
+    return os.path.join(output_dir, f"output_{tool}", genome)
+
+#markers are kept outside output_<tool>/ so that they survive --analyse moving the outputs
+def marker_path(output_dir, tool, genome):
+    return os.path.join(output_dir, "prediction_jobs", tool, f"{genome}.done")
+
+def log_path(output_dir, tool, genome):
+    return os.path.join(output_dir, "prediction_jobs", tool, f"{genome}.log")
+
+#one job per genome x tool, skipping those with a done marker unless forced
+def build_jobs(assemblies, tools, output_dir, databases, force = False):
+    jobs = []
+    for tool in tools:
+        for genome, fasta in assemblies.items():
+            if not force and os.path.exists(marker_path(output_dir, tool, genome)):
+                continue
+            jobs.append({
+                "tool": tool,
+                "genome": genome,
+                "fasta": fasta,
+                "outdir": job_outdir(output_dir, tool, genome),
+                "db": databases.get(tool),
+                "attempts": 0
+                })
+    return jobs
+
+#one job per batch of genomes x tool, each batch holding up to max_bases of sequence from genomes without a
+#done marker, so that each tool loads its databases once per batch rather than once per genome
+def build_batch_jobs(assemblies, tools, output_dir, databases, max_bases, force = False):
+    jobs = []
+    for tool in tools:
+        pending = {
+            genome: fasta for genome, fasta in assemblies.items()
+            if force or not os.path.exists(marker_path(output_dir, tool, genome))
+            }
+        for i, batch in enumerate(build_batches(pending, max_bases), 1):
+            name = f"batch_{i}"
+            batch_dir = os.path.join(output_dir, "prediction_jobs", "batches", tool)
+            jobs.append({
+                "tool": tool,
+                "genome": name,
+                "fasta": os.path.join(batch_dir, f"{name}.fna"),
+                "outdir": os.path.join(batch_dir, name),
+                "db": databases.get(tool),
+                "attempts": 0,
+                "batch": batch
+                })
+    return jobs
+
+#fair share of the cores over the remaining jobs, within the tool's thread range and the budget
+def allocate_threads(spec, cores, n_jobs):
+    share = cores // max(1, min(n_jobs, cores))
+    return min(max(spec["min_threads"], min(spec["max_threads"], share)), cores)
+
+def conda_command(spec, command, conda = False):
+    if conda:
+        return ["conda", "run", "--no-capture-output", "-n", spec["env"]] + command
+    return command
+
+def job_command(job, threads, conda = False):
+    spec = tool_specs[job["tool"]]
+    return conda_command(spec, shlex.split(spec["command"].format(**{**job, "threads": threads})), conda)
+
+#first line of each tool's version output, None where it cannot be run so that its results are not cached
+def tool_versions(tools, conda = False):
+    versions = {}
+    for tool in tools:
+        command = conda_command(tool_specs[tool], shlex.split(tool_specs[tool]["version"]), conda)
+        try:
+            result = subprocess.run(command, capture_output = True, text = True, timeout = 300)
+            lines = (result.stdout + result.stderr).strip().splitlines() if result.returncode == 0 else []
+        except (OSError, subprocess.TimeoutExpired):
+            lines = []
+        versions[tool] = lines[0].strip() if lines else None
+        if versions[tool] is None:
+            print(f"WARNING: could not get the {tool} version with {shlex.join(command)}, its results will not be cached")
+    return versions
+
+#cache key of each pending genome x tool from the assembly sequence, tool version, the command template that fixes
+#the tool's parameters and its database
+def cache_keys(assemblies, tools, output_dir, databases, versions, force = False):
+    hashes = {}
+    keys = {}
+    for tool in tools:
+        if versions.get(tool) is None:
+            continue
+        parameters = [tool_specs[tool]["command"], os.path.realpath(databases[tool]) if tool in databases else None]
+        for genome, fasta in assemblies.items():
+            if not force and os.path.exists(marker_path(output_dir, tool, genome)):
+                continue
+            if genome not in hashes:
+                hashes[genome] = sequence_hash(fasta)
+            keys[(tool, genome)] = result_key(hashes[genome], tool, versions[tool], parameters)
+    return keys
+
+#link cached results into output_<tool>/<genome>/ and mark them done, returning how many were found
+def fetch_cached(cache, keys, assemblies, output_dir):
+    n = 0
+    for (tool, genome), key in keys.items():
+        outdir = job_outdir(output_dir, tool, genome)
+        if os.path.exists(outdir):
+            shutil.rmtree(outdir)
+        if cache.fetch(key, outdir, genome):
+            marker = marker_path(output_dir, tool, genome)
+            os.makedirs(os.path.dirname(marker), exist_ok = True)
+            with open(marker + ".temp", "w") as handle:
+                json.dump({"fasta": assemblies[genome], "cached": key}, handle)
+            os.replace(marker + ".temp", marker)
+            n += 1
+    return n
+
+#start a job from an empty output directory, logging its stdout and stderr
+#raises OSError, noted in the log, when the tool cannot be run, e.g. when it is not on PATH without --conda
+def start_job(job, threads, output_dir, conda = False):
+    if os.path.exists(job["outdir"]):
+        shutil.rmtree(job["outdir"])
+    if "batch" in job:
+        write_batch_fasta(job["fasta"], job["batch"])
+    os.makedirs(job["outdir"])
+    log = log_path(output_dir, job["tool"], job["genome"])
+    os.makedirs(os.path.dirname(log), exist_ok = True)
+    job["attempts"] += 1
+    job["threads"] = threads
+    job["started"] = time.time()
+    with open(log, "a") as handle:
+        handle.write(f"#attempt {job['attempts']}: {shlex.join(job_command(job, threads, conda))}\n")
+        handle.flush()
+        try:
+            return subprocess.Popen(
+                job_command(job, threads, conda),
+                stdout = handle,
+                stderr = subprocess.STDOUT,
+                start_new_session = True
+                )
+        except OSError as error:
+            handle.write(f"#could not run {job_command(job, threads, conda)[0]}: {error.strerror}\n")
+            raise
+
+#record an attempt of a job in the run report, a job that could not be started has no usage
+def record_job(report, job, threads, returncode, usage, conda = False):
+    fields = {
+        "tool": job["tool"],
+        "genome": job["genome"],
+        "genomes": len(job.get("batch", [job["genome"]])),
+        "threads": threads,
+        "attempt": job["attempts"],
+        "inputs": [job["fasta"]],
+        "command": shlex.join(job_command(job, threads, conda))
+        }
+    if usage is None:
+        record = make_record("prediction", job["started"], time.time() - job["started"], 0, 0, returncode, **fields)
+    else:
+        record = process_record("prediction", job["started"], returncode, usage, **fields)
+    append_record(report, record)
+
+def write_marker(job, output_dir, genome = None):
+    marker = marker_path(output_dir, job["tool"], genome or job["genome"])
+    os.makedirs(os.path.dirname(marker), exist_ok = True)
+    with open(marker + ".temp", "w") as handle:
+        json.dump({
+            "fasta": job["batch"][genome] if genome else job["fasta"],
+            "batch": job["genome"] if genome else None,
+            "threads": job["threads"],
+            "attempts": job["attempts"],
+            "seconds": round(time.time() - job["started"], 1)
+            }, handle)
+    os.replace(marker + ".temp", marker)
+
+#mark a finished job done, first splitting a batch's outputs per genome and removing the batch files,
+#then store each genome's outputs in the result cache
+def finish_job(job, output_dir, cache = None):
+    if "batch" not in job:
+        write_marker(job, output_dir)
+    else:
+        demultiplex(job["tool"], job["genome"], job["outdir"], {
+            genome: job_outdir(output_dir, job["tool"], genome) for genome in job["batch"]
+            })
+        for genome in job["batch"]:
+            write_marker(job, output_dir, genome)
+        shutil.rmtree(job["outdir"])
+        os.remove(job["fasta"])
+    if cache is not None:
+        for genome, key in job.get("cache_keys", {}).items():
+            cache.store(key, job_outdir(output_dir, job["tool"], genome), genome, metadata = {"tool": job["tool"]})
+
+def total_memory_gb():
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3
+
+def interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+#run jobs concurrently within the core and memory budget, retrying failures up to retries times
+#returns the jobs that failed on every attempt
+#each attempt is recorded in the run report if one is given
+def run_jobs(
+        jobs, output_dir, cores, memory_gb, retries = 2, conda = False, poll_interval = 1, cache = None, report = None
+        ):
+    waiting = list(jobs)
+    running = {}
+    failed = []
+    free_cores, free_memory = cores, memory_gb
+    signal.signal(signal.SIGTERM, interrupt)
+    try:
+        while waiting or running:
+            #start every waiting job that fits, smaller jobs may start ahead of larger ones
+            index = 0
+            while index < len(waiting):
+                job = waiting[index]
+                spec = tool_specs[job["tool"]]
+                threads = allocate_threads(spec, cores, len(waiting) + len(running))
+                memory = min(spec["memory_gb"], memory_gb)
+                if threads > free_cores or memory > free_memory:
+                    index += 1
+                    continue
+                waiting.pop(index)
+                print(f"starting {job['tool']} on {job['genome']} with {threads} threads (attempt {job['attempts'] + 1})")
+                try:
+                    process = start_job(job, threads, output_dir, conda)
+                except OSError as error:
+                    #a tool that cannot be run fails the same way on every retry
+                    print(f"ERROR: {job['tool']} on {job['genome']} could not be started: {error.strerror}, see "
+                        f"{log_path(output_dir, job['tool'], job['genome'])}")
+                    if report:
+                        record_job(report, job, threads, 127, None, conda)
+                    failed.append(job)
+                    continue
+                running[process] = (job, threads, memory)
+                free_cores -= threads
+                free_memory -= memory
+
+            time.sleep(poll_interval)
+            for process in list(running):
+                #waited for here rather than polled, for the CPU time and peak memory of the job
+                pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+                if pid == 0:
+                    continue
+                returncode = process.returncode = exit_status(status)
+                job, threads, memory = running.pop(process)
+                if report:
+                    record_job(report, job, threads, returncode, usage, conda)
+                free_cores += threads
+                free_memory += memory
+                if returncode == 0:
+                    finish_job(job, output_dir, cache)
+                    print(f"finished {job['tool']} on {job['genome']} in {time.time() - job['started']:.0f} s")
+                elif job["attempts"] <= retries:
+                    print(f"WARNING: {job['tool']} on {job['genome']} exited with {returncode}, retrying")
+                    waiting.append(job)
+                else:
+                    print(f"ERROR: {job['tool']} on {job['genome']} failed after {job['attempts']} attempts, see "
+                        f"{log_path(output_dir, job['tool'], job['genome'])}")
+                    failed.append(job)
+    except BaseException as error:
+        #running jobs are in their own sessions, so they are stopped here on any error, not only on an interrupt
+        if isinstance(error, KeyboardInterrupt):
+            print(f"interrupted, stopping {len(running)} running jobs, rerun to resume")
+        else:
+            print(f"ERROR: stopping {len(running)} running jobs, rerun to resume")
+        for process in running:
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for process, (job, threads, memory) in running.items():
+            pid, status, usage = os.wait4(process.pid, 0)
+            process.returncode = exit_status(status)
+            if report:
+                record_job(report, job, threads, process.returncode, usage, conda)
+        raise
+    return failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description = "Run prophage prediction tools on every genome concurrently within a core and memory budget"
+        )
+    parser.add_argument("assembly_dir", help = "directory containing assembled contigs")
+    parser.add_argument("-o", "--outdir", default = ".", help = "directory to write output_<tool>/ to (default .)")
+    parser.add_argument(
+        "-t", "--tools", nargs = "+", choices = list(tool_specs), default = list(tool_specs),
+        help = "prediction tools to run (default all)"
+        )
+    parser.add_argument("-c", "--cores", type = int, default = os.cpu_count(), help = "total cores to use (default all)")
+    parser.add_argument(
+        "-m", "--memory", type = float, default = None, help = "total memory to use in GB (default all physical memory)"
+        )
+    parser.add_argument("-r", "--retries", type = int, default = 2, help = "retries per failed job (default 2)")
+    parser.add_argument(
+        "-d", "--db", nargs = "+", default = [], metavar = "TOOL=PATH",
+        help = "database directory for each tool that needs one (default the cached paths from resolve_paths.py)"
+        )
+    parser.add_argument(
+        "-b", "--batch-size", type = float, default = None,
+        help = "run each tool on batches of genomes of up to this many Mbp of sequence (default one genome per run)"
+        )
+    parser.add_argument(
+        "-C", "--cache", nargs = "?", const = "", default = os.environ.get("PROPHAGE_RESULT_CACHE"), metavar = "DIR",
+        help = "reuse and store results in a cache shared across projects, keyed by assembly sequence, tool version "
+            "and parameters (default on in $PROPHAGE_RESULT_CACHE if set, without DIR ~/.cache/prophageAnalysis/results)"
+        )
+    parser.add_argument("--cache-size", type = float, default = 50, help = "result cache size cap in GB (default 50)")
+    parser.add_argument(
+        "-V", "--tool-version", nargs = "+", default = [], metavar = "TOOL=VERSION",
+        help = "version of each tool for the result cache (default the first line of its version command)"
+        )
+    parser.add_argument(
+        "-R", "--report", default = None,
+        help = "json lines run report to record each job's time, CPU, peak memory and exit status in "
+            "(default $PROPHAGE_RUN_REPORT, else <outdir>/run_report.jsonl)"
+        )
+    parser.add_argument("--conda", action = "store_true", help = "run each tool in its conda env with conda run")
+    parser.add_argument("-f", "--force", action = "store_true", help = "rerun jobs that have a done marker")
+    parser.add_argument("-n", "--dry-run", action = "store_true", help = "print the commands that would be run")
+    args = parser.parse_args()
+
+    paths = resolve_paths()
+    databases = {
+        tool: paths[spec["database"]]
+        for tool, spec in tool_specs.items()
+        if spec["database"] and paths.get(spec["database"])
+        }
+    databases.update(dict(entry.split("=", 1) for entry in args.db))
+    databases = {tool: os.path.expanduser(path) for tool, path in databases.items()}
+    missing = [tool for tool in args.tools if tool_specs[tool]["database"] and tool not in databases]
+    if missing:
+        parser.error(f"no database given for {', '.join(missing)}, use --db TOOL=PATH")
+
+    assemblies = find_assemblies(args.assembly_dir)
+    if not assemblies:
+        parser.error(f"no fasta files detected in {args.assembly_dir}")
+    cache, keys = None, {}
+    if args.cache is not None:
+        cache = ResultCache(cache_dir(args.cache), args.cache_size * 1024 ** 3)
+        versions = dict(entry.split("=", 1) for entry in args.tool_version)
+        versions.update(tool_versions([tool for tool in args.tools if tool not in versions], args.conda))
+        keys = cache_keys(assemblies, args.tools, args.outdir, databases, versions, args.force)
+        if args.dry_run:
+            print(f"{sum(cache.read_entry(key) is not None for key in keys.values())} genome x tool runs are cached")
+        elif not args.force:
+            print(f"{fetch_cached(cache, keys, assemblies, args.outdir)} genome x tool runs linked from {cache.cache_dir}")
+    if args.batch_size:
+        jobs = build_batch_jobs(assemblies, args.tools, args.outdir, databases, args.batch_size * 1e6, args.force)
+        n_pending = sum(len(job["batch"]) for job in jobs)
+    else:
+        jobs = build_jobs(assemblies, args.tools, args.outdir, databases, args.force)
+        n_pending = len(jobs)
+    print(f"{n_pending} of {len(assemblies) * len(args.tools)} genome x tool runs to do in {len(jobs)} jobs, the rest are done")
+    for job in jobs:
+        job["cache_keys"] = {
+            genome: keys[(job["tool"], genome)]
+            for genome in job.get("batch", [job["genome"]])
+            if (job["tool"], genome) in keys
+            }
+    if args.dry_run:
+        for job in jobs:
+            threads = allocate_threads(tool_specs[job["tool"]], args.cores, len(jobs))
+            print(shlex.join(job_command(job, threads, args.conda)))
+    else:
+        try:
+            failed = run_jobs(
+                jobs, args.outdir, args.cores, args.memory or total_memory_gb(), args.retries, args.conda, cache = cache,
+                report = report_path(args.report) or os.path.join(args.outdir, "run_report.jsonl")
+                )
+        except KeyboardInterrupt:
+            raise SystemExit(130)
+        finally:
+            if cache is not None:
+                cache.evict()
+        if failed:
+            raise SystemExit(f"ERROR: {len(failed)} jobs failed")
@@ -0,0 +1,306 @@
+import argparse
+import contextlib
+import csv
+import fcntl
+import json
+import os
+import resource
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+#only the standard library is used, as commands are also recorded from within the tools' conda envs
+
+#run id shared by every step of a pipeline run, set by the shell scripts so that nested python steps inherit it
+run_id = os.environ.setdefault("PROPHAGE_RUN_ID", time.strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}")
+
+record_columns = [
+    "run", "stage", "tool", "genome", "genomes", "threads", "attempt", "input_bytes", "started", "wall_seconds",
+    "cpu_seconds", "max_rss_mb", "exit_status", "host", "command"
+    ]
+
+#report path given on the command line, else $PROPHAGE_RUN_REPORT, else None when nothing is to be recorded
+def report_path(path = None):
+    path = path or os.environ.get("PROPHAGE_RUN_REPORT")
+    return os.path.expanduser(path) if path else None
+
+#peak resident memory in MB, ru_maxrss is in KB on Linux and in bytes on macOS
+def rusage_mb(maxrss):
+    return maxrss / 1024 ** 2 if sys.platform == "darwin" else maxrss / 1024
+
+def max_rss_mb(who):
+    return rusage_mb(resource.getrusage(who).ru_maxrss)
+
+#peak resident memory of this process since the last reset_peak_rss, from VmHWM where /proc provides it
+#ru_maxrss is kept across exec, so in a spawned process it would also cover the parent's peak
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as handle:
+            for line in handle:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return max_rss_mb(resource.RUSAGE_SELF)
+
+#set the peak back to the resident memory now, so that a step's peak is measured apart from its setup
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as handle:
+            handle.write("5")
+    except OSError:
+        pass
+
+#CPU time of this process and its waited for workers
+def cpu_time():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+#exit code of a wait status as subprocess reports it, negative for a signal
+def exit_status(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+#total size of the input files, directories counted with everything in them
+def input_bytes(paths):
+    total = 0
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                total += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+        elif os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+def make_record(stage, started, wall_seconds, cpu_seconds, max_rss, status = 0, tool = None, genome = None,
+        command = None, inputs = (), threads = None, attempt = None, genomes = 1):
+    return {
+        "run": run_id,
+        "stage": stage,
+        "tool": tool,
+        "genome": genome,
+        "genomes": genomes,
+        "threads": threads,
+        "attempt": attempt,
+        "input_bytes": input_bytes(inputs),
+        "started": round(started, 3),
+        "wall_seconds": round(wall_seconds, 3),
+        "cpu_seconds": round(cpu_seconds, 3),
+        "max_rss_mb": round(max_rss, 1),
+        "exit_status": status,
+        "host": socket.gethostname(),
+        "command": command
+        }
+
+#append a record as one json line, locked so that concurrent steps of a run can share the report
+def append_record(path, record):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+    with open(path, "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        handle.write(json.dumps(record) + "\n")
+
+#record of a finished child process from the rusage os.wait4 returns for it
+#the rusage covers the child and the processes it waited for, its peak is that of the largest of them
+def process_record(stage, started, status, usage, **fields):
+    return make_record(
+        stage, started, time.time() - started, usage.ru_utime + usage.ru_stime, rusage_mb(usage.ru_maxrss), status,
+        **fields
+        )
+
+#shell quoted command line, as shlex.join which the python of older tool envs lacks
+def quote(command):
+    return " ".join(shlex.quote(argument) for argument in command)
+
+#run a command as a recorded step, returning its exit code
+#interrupts reach the command through the terminal and are recorded as its exit status
+def run_command(path, stage, command, **fields):
+    started = time.time()
+    try:
+        process = subprocess.Popen(command)
+    except OSError as error:
+        print(f"ERROR: {command[0]}: {error.strerror}", file = sys.stderr)
+        status = 127
+        if path:
+            append_record(path, make_record(stage, started, 0, 0, 0, status, command = quote(command), **fields))
+        return status
+    handlers = {signum: signal.signal(signum, signal.SIG_IGN) for signum in [signal.SIGINT, signal.SIGQUIT]}
+    try:
+        pid, status, usage = os.wait4(process.pid, 0)
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    process.returncode = exit_status(status)
+    if path:
+        append_record(path, process_record(
+            stage, started, process.returncode, usage, command = quote(command), **fields
+            ))
+    return process.returncode
+
+#record a step run in this process, with the CPU time and peak memory of its workers included
+@contextlib.contextmanager
+def recorded_stage(path, stage, **fields):
+    if not path:
+        yield
+        return
+    started, start_cpu = time.time(), cpu_time()
+    reset_peak_rss()
+    status = 0
+    try:
+        yield
+    except SystemExit as error:
+        status = error.code if isinstance(error.code, int) else int(error.code is not None)
+        raise
+    except BaseException:
+        status = 1
+        raise
+    finally:
+        append_record(path, make_record(
+            stage, started, time.time() - started, cpu_time() - start_cpu,
+            max(peak_rss_mb(), max_rss_mb(resource.RUSAGE_CHILDREN)), status, **fields
+            ))
+
+#records of a report, optionally of some runs only, skipping a line cut short by an interrupted write
+def read_records(path, runs = None):
+    records = []
+    with open(path) as handle:
+        for line in handle:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not runs or record["run"] in runs:
+                records.append(record)
+    return records
+
+def write_tsv(records, path):
+    with open(path + ".temp", "w", newline = "") as handle:
+        writer = csv.DictWriter(handle, record_columns, delimiter = "\t", extrasaction = "ignore")
+        writer.writeheader()
+        writer.writerows(records)
+    os.replace(path + ".temp", path)
+
+#totals of groups of records: runs, failures, wall and CPU time, effective cores and the largest peak
+#span is from the first start to the last finish, shorter than the wall time when steps ran concurrently
+def group_totals(records, key):
+    groups = {}
+    for record in records:
+        groups.setdefault(key(record), []).append(record)
+    totals = []
+    for name, group in groups.items():
+        wall = sum(record["wall_seconds"] for record in group)
+        cpu = sum(record["cpu_seconds"] for record in group)
+        totals.append({
+            "name": name,
+            "runs": len(group),
+            "failed": sum(record["exit_status"] != 0 for record in group),
+            "wall_seconds": wall,
+            "span_seconds": max(record["started"] + record["wall_seconds"] for record in group)
+                - min(record["started"] for record in group),
+            "cpu_seconds": cpu,
+            "cores_used": cpu / wall if wall else 0,
+            "max_rss_mb": max(record["max_rss_mb"] for record in group)
+            })
+    return sorted(totals, key = lambda total: -total["wall_seconds"])
+
+def format_seconds(seconds):
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f} h"
+    if seconds >= 60:
+        return f"{seconds / 60:.1f} min"
+    return f"{seconds:.1f} s"
+
+def print_table(title, header, rows):
+    print(f"\n{title}")
+    widths = [max(len(str(value)) for value in column) for column in zip(header, *rows)]
+    for row in [header] + rows:
+        print("  ".join(str(value).ljust(width) for value, width in zip(row, widths)).rstrip())
+
+#slowest stages (by tool), genomes and single steps of the records
+#cores used is CPU over wall time, well under the threads given when a tool does not use them
+def print_summary(records, n_top = 10):
+    runs = sorted(set(record["run"] for record in records))
+    failed = [record for record in records if record["exit_status"] != 0]
+    print(f"{len(records)} steps in {len(runs)} runs, {len(failed)} failed")
+    header = ["", "runs", "failed", "wall", "span", "cpu", "cores used", "peak MB"]
+    print_table("slowest stages", ["stage / tool"] + header[1:], [
+        [
+            total["name"], total["runs"], total["failed"], format_seconds(total["wall_seconds"]),
+            format_seconds(total["span_seconds"]), format_seconds(total["cpu_seconds"]), f"{total['cores_used']:.1f}",
+            f"{total['max_rss_mb']:.0f}"
+            ]
+        for total in group_totals(records, lambda record: f"{record['stage']} / {record['tool'] or '-'}")[:n_top]
+        ])
+    #batched runs are listed under their batch name
+    genome_records = [record for record in records if record["genome"]]
+    print_table("slowest genomes", ["genome", "steps", "failed", "wall", "cpu", "peak MB", "slowest step"], [
+        [
+            total["name"], total["runs"], total["failed"], format_seconds(total["wall_seconds"]),
+            format_seconds(total["cpu_seconds"]), f"{total['max_rss_mb']:.0f}",
+            max(
+                (record for record in genome_records if record["genome"] == total["name"]),
+                key = lambda record: record["wall_seconds"]
+                )["tool"]
+            ]
+        for total in group_totals(genome_records, lambda record: record["genome"])[:n_top]
+        ])
+    slowest = sorted(records, key = lambda record: -record["wall_seconds"])[:n_top]
+    print_table("slowest steps", ["stage", "tool", "genome", "threads", "input MB", "wall", "cpu", "peak MB", "exit"], [
+        [
+            record["stage"], record["tool"] or "-", record["genome"] or "-", record["threads"] or "-",
+            f"{record['input_bytes'] / 1024 ** 2:.1f}", format_seconds(record["wall_seconds"]),
+            format_seconds(record["cpu_seconds"]), f"{record['max_rss_mb']:.0f}", record["exit_status"]
+            ]
+        for record in slowest
+        ])
+    if failed:
+        print_table("failed steps", ["stage", "tool", "genome", "exit", "command"], [
+            [record["stage"], record["tool"] or "-", record["genome"] or "-", record["exit_status"], record["command"]]
+            for record in failed[-n_top:]
+            ])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description = "Record the wall time, CPU time, peak memory, input size and exit status of pipeline steps "
+            "in a run report and summarise it"
+        )
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+    record_parser = subparsers.add_parser(
+        "record", help = "run a command after -- and record it, exiting with its exit status"
+        )
+    record_parser.add_argument(
+        "-r", "--report", default = None,
+        help = "json lines report to append to (default $PROPHAGE_RUN_REPORT, without either nothing is recorded)"
+        )
+    record_parser.add_argument("-s", "--stage", required = True, help = "pipeline stage")
+    record_parser.add_argument("-t", "--tool", default = None, help = "tool or step within the stage")
+    record_parser.add_argument("-g", "--genome", default = None, help = "genome the command runs on")
+    record_parser.add_argument("-n", "--threads", type = int, default = None, help = "threads given to the command")
+    record_parser.add_argument("-i", "--input", nargs = "+", default = [], help = "input files or directories")
+    record_parser.add_argument("run_command", nargs = argparse.REMAINDER, help = "command to run, after --")
+
+    summary_parser = subparsers.add_parser("summary", help = "rank the slowest stages, genomes and steps of a report")
+    summary_parser.add_argument("report", help = "json lines run report")
+    summary_parser.add_argument("-r", "--runs", nargs = "+", default = None, help = "runs to include (default all)")
+    summary_parser.add_argument("-n", "--top", type = int, default = 10, help = "rows of each ranking (default 10)")
+    summary_parser.add_argument("-o", "--tsv", default = None, help = "also write the records as a tsv")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        command = args.run_command[1:] if args.run_command[:1] == ["--"] else args.run_command
+        if not command:
+            parser.error("no command given after --")
+        status = run_command(
+            report_path(args.report), args.stage, command, tool = args.tool, genome = args.genome,
+            threads = args.threads, inputs = args.input
+            )
+        raise SystemExit(128 - status if status < 0 else status)
+    records = read_records(args.report, args.runs)
+    if not records:
+        raise SystemExit(f"ERROR: no records found in {args.report}")
+    if args.tsv:
+        write_tsv(records, args.tsv)
+    print_summary(records, args.top)
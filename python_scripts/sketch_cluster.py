@@ -0,0 +1,180 @@
+import argparse
+import os
+
+import numpy as np
+
+from fasta_index import open_fasta, record_name, record_spans
+
+#2 bit code of each base, 4 for anything that is not A, C, G or T
+base_codes = np.full(256, 4, dtype = np.uint8)
+for code, bases in enumerate([b"Aa", b"Cc", b"Gg", b"Tt"]):
+    base_codes[list(bases)] = code
+
+cluster_columns = ["representative", "member", "distance", "shared_hashes"]
+
+#splitmix64 finalizer, mixing canonical k-mer values into uniformly distributed 64 bit hashes
+def mix64(values):
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xbf58476d1ce4e5b9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
+
+#hashes of every canonical k-mer of a sequence without ambiguous bases, built k shifts at a time over the whole sequence
+def kmer_hashes(sequence, k = 21):
+    codes = base_codes[np.frombuffer(sequence, dtype = np.uint8)]
+    n = len(codes) - k + 1
+    if n < 1:
+        return np.empty(0, dtype = np.uint64)
+    invalid = np.concatenate([[0], np.cumsum(codes == 4)])
+    valid = invalid[k:] - invalid[:n] == 0
+    codes = np.where(codes == 4, 0, codes).astype(np.uint64)
+    forward = np.zeros(n, dtype = np.uint64)
+    reverse = np.zeros(n, dtype = np.uint64)
+    for j in range(k):
+        forward = (forward << np.uint64(2)) | codes[j:j + n]
+        reverse = reverse | ((np.uint64(3) - codes[j:j + n]) << np.uint64(2 * j))
+    return mix64(np.minimum(forward, reverse)[valid])
+
+#bottom sketch: the sketch_size smallest distinct hashes
+def sketch(sequence, k = 21, sketch_size = 1000):
+    hashes = np.unique(kmer_hashes(sequence, k))
+    return hashes[:sketch_size]
+
+#name, length and sketch of every record of a set of fasta files, read through memory maps
+def sketch_fasta(paths, k = 21, sketch_size = 1000):
+    names, lengths, sketches = [], [], []
+    for path in paths:
+        data = open_fasta(path)
+        if data is None:
+            continue
+        try:
+            for header, start, end in record_spans(data):
+                sequence = data[start:end].translate(None, b"\r\n")
+                names.append(record_name(data, header, start))
+                lengths.append(len(sequence))
+                sketches.append(sketch(sequence, k, sketch_size))
+        finally:
+            data.close()
+    return names, np.asarray(lengths, dtype = np.int64), sketches
+
+#shared hash counts between all pairs of sketches as one sparse product of a sketch x hash incidence matrix
+#only pairs sharing at least one hash are stored, so cost grows with the redundancy rather than the square of the count
+def shared_hashes(sketches):
+    import scipy.sparse as sp
+    sizes = np.asarray([len(hashes) for hashes in sketches], dtype = np.int64)
+    rows = np.repeat(np.arange(len(sketches)), sizes)
+    hashes = np.concatenate(sketches) if len(sketches) else np.empty(0, dtype = np.uint64)
+    _, columns = np.unique(hashes, return_inverse = True)
+    incidence = sp.csr_matrix(
+        (np.ones(len(rows), dtype = np.int32), (rows, columns)),
+        shape = (len(sketches), columns.max() + 1 if len(columns) else 0)
+        )
+    return (incidence @ incidence.T).tocoo(), sizes
+
+#Mash distance from a Jaccard index, 1 where nothing is shared
+def mash_distance(jaccard, k):
+    with np.errstate(divide = "ignore"):
+        distance = -np.log(2 * jaccard / (1 + jaccard)) / k
+    return np.where(jaccard > 0, np.minimum(distance, 1), 1.0)
+
+#pairs of sketches within max_distance, with Jaccard estimated from the hashes the two sketches share
+#this underestimates the Jaccard index of sequences of different lengths, so grouping is conservative
+def sketch_distances(sketches, k = 21, max_distance = 0.05):
+    shared, sizes = shared_hashes(sketches)
+    upper = shared.row < shared.col
+    a, b, n_shared = shared.row[upper], shared.col[upper], shared.data[upper]
+    jaccard = n_shared / (sizes[a] + sizes[b] - n_shared)
+    distance = mash_distance(jaccard, k)
+    close = distance <= max_distance
+    return a[close], b[close], distance[close], n_shared[close]
+
+#greedy grouping as in cd-hit: the longest ungrouped sequence becomes a representative and takes every ungrouped
+#sequence within max_distance of it; returns the representative index and distance to it of every sequence
+def greedy_clusters(lengths, a, b, distance):
+    import scipy.sparse as sp
+    n = len(lengths)
+    neighbours = sp.csr_matrix(
+        (np.concatenate([distance, distance]), (np.concatenate([a, b]), np.concatenate([b, a]))),
+        shape = (n, n)
+        )
+    representative = np.full(n, -1, dtype = np.int64)
+    member_distance = np.zeros(n)
+    for i in np.argsort(-lengths, kind = "stable"):
+        if representative[i] != -1:
+            continue
+        representative[i] = i
+        row = slice(neighbours.indptr[i], neighbours.indptr[i + 1])
+        members = neighbours.indices[row]
+        free = representative[members] == -1
+        representative[members[free]] = i
+        member_distance[members[free]] = neighbours.data[row][free]
+    return representative, member_distance
+
+def write_clusters(path, names, representative, member_distance, shared_counts):
+    order = np.lexsort((np.arange(len(names)) != representative, representative))
+    with open(path + ".temp", "w") as handle:
+        handle.write("\t".join(cluster_columns) + "\n")
+        for i in order:
+            handle.write(
+                f"{names[representative[i]]}\t{names[i]}\t{member_distance[i]:.6g}\t{shared_counts.get(i, '')}\n"
+                )
+    os.replace(path + ".temp", path)
+
+#copy the records of the representatives, in input order, to one fasta
+def write_representatives(paths, keep, output):
+    with open(output + ".temp", "wb") as handle:
+        for path in paths:
+            data = open_fasta(path)
+            if data is None:
+                continue
+            try:
+                for header, start, end in record_spans(data):
+                    if record_name(data, header, start) in keep:
+                        record = data[header:end]
+                        handle.write(record if record.endswith(b"\n") else record + b"\n")
+            finally:
+                data.close()
+    os.replace(output + ".temp", output)
+
+#sketch, group and write representatives and the representative to member table, returning the number of groups
+def sketch_cluster(paths, output, clusters_path, k = 21, sketch_size = 1000, max_distance = 0.05):
+    names, lengths, sketches = sketch_fasta(paths, k, sketch_size)
+    if len(set(names)) != len(names):
+        raise SystemExit("ERROR: sequence names are not unique, rename them first, e.g. with fasta_index.py merge")
+    a, b, distance, n_shared = sketch_distances(sketches, k, max_distance)
+    representative, member_distance = greedy_clusters(lengths, a, b, distance)
+    #shared hashes with the representative, for members only
+    shared_counts = {
+        int(j if representative[j] == i else i): int(count)
+        for i, j, count in zip(a, b, n_shared)
+        if representative[j] == i or representative[i] == j
+        }
+    write_clusters(clusters_path, names, representative, member_distance, shared_counts)
+    keep = {names[i] for i in np.unique(representative)}
+    write_representatives(paths, keep, output)
+    return len(keep), len(names)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description = "Group near identical sequences by MinHash sketch distance and keep one representative of each"
+        )
+    parser.add_argument("fasta", nargs = "+", help = "fasta files of prophage regions")
+    parser.add_argument("-o", "--output", default = "representatives.fa", help = "representative sequences to write (default representatives.fa)")
+    parser.add_argument(
+        "-c", "--clusters", default = None,
+        help = "representative to member table to write (default <output>_clusters.tsv)"
+        )
+    parser.add_argument("-k", "--kmer", type = int, default = 21, help = "k-mer size, at most 32 (default 21)")
+    parser.add_argument("-s", "--sketch-size", type = int, default = 1000, help = "hashes kept per sequence (default 1000)")
+    parser.add_argument(
+        "-d", "--max-distance", type = float, default = 0.05,
+        help = "maximum Mash distance of a member from its representative (default 0.05)"
+        )
+    args = parser.parse_args()
+    if not 0 < args.kmer <= 32:
+        parser.error("--kmer must be between 1 and 32")
+
+    clusters_path = args.clusters or os.path.splitext(args.output)[0] + "_clusters.tsv"
+    n_groups, n = sketch_cluster(args.fasta, args.output, clusters_path, args.kmer, args.sketch_size, args.max_distance)
+    print(f"{n} sequences grouped into {n_groups} representatives, written to {args.output} and {clusters_path}")
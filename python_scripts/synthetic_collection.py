@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+
+from parse_predictions import min_length, summary_header, tool_files
+
+#share of isolates from each source, by the genome name prefixes of genome_metadata.py
+source_shares = {"CH": 0.2, "PK": 0.2, "SM": 0.15, "PR": 0.15, "LG": 0.1, "LB": 0.1, "BF": 0.1}
+reference_genomes = ["PA14", "PAO1", "PAK", "PA7", "SBW25"]
+
+#closest refseq_masher matches and their share, the rest spread over rare species grouped as "Other" in the figures
+species_shares = {
+    "Pseudomonas fluorescens": 0.3,
+    "Pseudomonas aeruginosa": 0.2,
+    "Pseudomonas fragi": 0.12,
+    "Pseudomonas putida": 0.1,
+    "Pseudomonas lundensis": 0.07,
+    "Pseudomonas syringae": 0.05,
+    "Pseudomonas taetrolens": 0.04
+    }
+n_rare_species = 60
+
+#predictions per genome of each tool relative to the genome's prophage load and the sd of their log length
+#the shared load makes tool counts correlate as in real collections
+tool_profiles = {
+    "GeNomad": (1.0, 0.8),
+    "PHASTEST": (1.1, 0.7),
+    "PhageBoost": (1.8, 1.1),
+    "VIBRANT": (0.8, 0.9),
+    "VirSorter": (1.3, 1.0)
+    }
+mean_log_length = np.log(30000)
+mean_load = 3.0
+mean_contigs = 40
+
+#genomes generated and written at a time, which bounds memory for collections of millions of genomes
+block_size = 50000
+
+#genome names as in the collection, references first, then isolates numbered within each source prefix
+def genome_names(n_genomes, rng):
+    references = reference_genomes if n_genomes > len(reference_genomes) else []
+    prefixes = rng.choice(list(source_shares), size = n_genomes - len(references), p = list(source_shares.values()))
+    width = len(str(n_genomes))
+    numbers = pd.Series(prefixes).groupby(prefixes).cumcount() + 1
+    isolates = [f"{prefix}{number:0{width}d}" for prefix, number in zip(prefixes, numbers)]
+    return [f"{name}_contigs" for name in references + isolates]
+
+def species_names():
+    rare_share = (1 - sum(species_shares.values())) / n_rare_species
+    names = list(species_shares) + [f"Pseudomonas sp. {i + 1}" for i in range(n_rare_species)]
+    return names, np.array(list(species_shares.values()) + [rare_share] * n_rare_species)
+
+#splitmix64 finalizer, mixing sequential values into uniformly distributed 64 bit integers
+def mix64(values):
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xbf58476d1ce4e5b9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
+
+#deterministic integers per genome and contig so that a contig has the same name in every row it appears in
+def contig_values(genome_codes, contig_numbers, seed, low, high):
+    values = mix64((genome_codes.astype(np.uint64) << np.uint64(20)) + contig_numbers.astype(np.uint64) + np.uint64(seed))
+    return low + (values % np.uint64(high - low)).astype(np.int64)
+
+#predictions of every tool on n genomes from genome first on, as in the concatenated summary of parse_predictions.py
+def synthetic_predictions(genomes, tools, seed = 0, first = 0, n = None):
+    rng = np.random.default_rng([seed, first])
+    n_genomes = min(len(genomes) - first, len(genomes) if n is None else n)
+    load = rng.gamma(2.0, mean_load / 2, size = n_genomes)
+    n_contigs = 1 + rng.poisson(mean_contigs, size = n_genomes)
+    frames = []
+    for tool in tools:
+        rate, sd_log_length = tool_profiles[tool]
+        counts = rng.poisson(load * rate)
+        genome_codes = np.repeat(np.arange(n_genomes), counts)
+        contig_numbers = 1 + (rng.random(len(genome_codes)) * n_contigs[genome_codes]).astype(np.int64)
+        genome_codes += first
+        contig_length = contig_values(genome_codes, contig_numbers, seed, 20000, 600000)
+        length = np.exp(rng.normal(mean_log_length, sd_log_length, size = len(genome_codes))).astype(np.int64)
+        length = np.clip(length, min_length + 1, contig_length - 1)
+        start = 1 + (rng.random(len(genome_codes)) * (contig_length - length)).astype(np.int64)
+        coverage = contig_values(genome_codes, contig_numbers, seed + 1, 500, 20000) / 100
+        contig = [
+            f"NODE_{number}_length_{contig_length}_cov_{cov:.6f}"
+            for number, contig_length, cov in zip(contig_numbers, contig_length, coverage)
+            ]
+        frames.append(pd.DataFrame({
+            "contig": contig,
+            "prophage_start": start.astype(np.int32),
+            "prophage_end": (start + length - 1).astype(np.int32),
+            "genome": pd.Categorical.from_codes(genome_codes, categories = genomes),
+            "prediction_tool": tool,
+            "length": length.astype(np.int32)
+            }))
+    return pd.concat(frames, ignore_index = True)\
+        .sort_values(["genome", "prediction_tool"], kind = "stable")\
+        .reset_index(drop = True)[summary_header]
+
+#refseq_masher closest match of every genome, references matching their own species
+def synthetic_refseq(genomes, seed = 0):
+    rng = np.random.default_rng(seed + 1)
+    names, shares = species_names()
+    species = rng.choice(names, size = len(genomes), p = shares / shares.sum())
+    for i, genome in enumerate(genomes):
+        if genome.split("_")[0] in reference_genomes:
+            species[i] = "Pseudomonas fluorescens" if genome.startswith("SBW") else "Pseudomonas aeruginosa"
+    return pd.DataFrame({"genome": genomes, "closest_match": species})
+
+#a table written unquoted by pyarrow one block of rows at a time, several times faster than pandas for millions of rows
+def write_table(frames, path, delimiter = ","):
+    options = pv.WriteOptions(include_header = False, delimiter = delimiter, quoting_style = "none")
+    with open(path + ".temp", "wb") as handle:
+        for i, frame in enumerate(frames):
+            if i == 0:
+                handle.write((delimiter.join(frame.columns) + "\n").encode())
+            pv.write_csv(pa.Table.from_pandas(frame.astype({"genome": str}), preserve_index = False), handle, options)
+    os.replace(path + ".temp", path)
+
+phastest_columns = [
+    "REGION", "REGION_LENGTH", "COMPLETENESS(score)", "SPECIFIC_KEYWORD", "REGION_POSITION",
+    "MOST_COMMON_PHAGE_NAME(hit_genes_count)", "GC_PERCENTAGE"
+    ]
+
+#region positions are given as comma separated fields, of which parse_phastest reads the first and the seventh
+def phastest_summary(rows):
+    lines = ["Criteria for scoring prophage regions", "", "  ".join(phastest_columns), "-" * 160]
+    for i, (contig, start, end) in enumerate(rows, 1):
+        lines.append(
+            f"{i}  {(end - start + 1) / 1000:.1f}Kb  intact(150)  integrase,terminase  {contig},,,,,,{contig}:{start}-{end}  "
+            f"PHAGE_Pseudo_phi297_NC_016762(23)  58.92%"
+            )
+    return ["\n".join(lines) + "\n"]
+
+#one tool's output files for one genome in the tool's own format, only the parts that parse_predictions.py reads
+def tool_outputs(tool, rows):
+    if tool == "GeNomad":
+        return ["gene\tstart\tend\tlength\tstrand\n" + "".join(
+            f"{contig}|provirus_{start}_{end}_{gene}\t{start}\t{end}\t{end - start + 1}\t1\n"
+            for contig, start, end in rows for gene in range(1, 4)
+            )]
+    if tool == "PHASTEST":
+        return phastest_summary(rows)
+    if tool == "VIBRANT":
+        return [
+            "scaffold\tfragment\tprotein start\tprotein stop\tprotein length\tnucleotide start\tnucleotide stop\t"
+            "nucleotide length\n" + "".join(
+                f"{contig}\t{contig}_fragment_{i}\t{contig}_{i}_1\t{contig}_{i}_40\t40\t{start}\t{end}\t{end - start + 1}\n"
+                for i, (contig, start, end) in enumerate(rows, 1)
+                ),
+            "scaffold\ttotal genes\tall KEGG\tKEGG v-score\tall Pfam\tPfam v-score\n"
+            ]
+    if tool == "VirSorter":
+        return ["seqname\ttrim_orf_index_start\ttrim_orf_index_end\ttrim_bp_start\ttrim_bp_end\ttrim_pr\n" + "".join(
+            f"{contig}\t1\t40\t{start}\t{end}\t0.95\n" for contig, start, end in rows
+            )]
+    return ["##gff-version 3\nseqid\tsource\ttype\tstart\tend\tscore\tstrand\tphase\tattributes\n" + "".join(
+        f"{contig}\tPhageBoost\tprophage\t{start}\t{end}\t0.9\t.\t.\tID=phage{i}\n"
+        for i, (contig, start, end) in enumerate(rows, 1)
+        )]
+
+#raw outputs of every tool for every genome under prophage_predictions/output_<tool>/<genome>/, as parsed by
+#parse_predictions.py; genomes without predictions from a tool still get its (empty) output files
+def write_raw_outputs(predictions, genomes, predictions_dir):
+    for tool, tool_rows in predictions.groupby("prediction_tool", observed = True):
+        by_genome = {
+            genome: list(rows.itertuples(index = False, name = None))
+            for genome, rows in tool_rows[["genome", "contig", "prophage_start", "prophage_end"]]\
+                .set_index("genome").groupby(level = 0, observed = True)
+            }
+        for genome in genomes:
+            for template, content in zip(tool_files[tool], tool_outputs(tool, by_genome.get(genome, []))):
+                path = os.path.join(predictions_dir, f"output_{tool}", genome, template.format(genome = genome))
+                os.makedirs(os.path.dirname(path), exist_ok = True)
+                with open(path, "w") as handle:
+                    handle.write(content)
+
+#blocks of predictions, also writing their raw outputs to predictions_dir if given
+def prediction_blocks(genomes, tools, seed = 0, predictions_dir = None):
+    for first in range(0, len(genomes), block_size):
+        predictions = synthetic_predictions(genomes, tools, seed, first, block_size)
+        if predictions_dir:
+            write_raw_outputs(predictions, genomes[first:first + block_size], predictions_dir)
+        yield predictions
+
+#a project directory with the tables the analysis stages read, and optionally raw tool outputs
+#the parameters are recorded so that an unchanged collection is not generated again
+def generate_collection(project_path, n_genomes, tools = list(tool_profiles), seed = 0, raw = False):
+    parameters = {"n_genomes": n_genomes, "tools": list(tools), "seed": seed, "raw": raw}
+    parameters_path = os.path.join(project_path, "collection.json")
+    if os.path.exists(parameters_path):
+        with open(parameters_path) as handle:
+            if json.load(handle) == parameters:
+                return parameters
+    shutil.rmtree(os.path.join(project_path, "prophage_predictions"), ignore_errors = True)
+    genomes = genome_names(n_genomes, np.random.default_rng(seed))
+    for directory in ["prophage_regions", "refseq_masher"]:
+        os.makedirs(os.path.join(project_path, directory), exist_ok = True)
+    write_table(
+        prediction_blocks(genomes, tools, seed, os.path.join(project_path, "prophage_predictions") if raw else None),
+        os.path.join(project_path, "prophage_regions", "concatenated_predictions_summary.csv")
+        )
+    write_table(
+        [synthetic_refseq(genomes, seed)], os.path.join(project_path, "refseq_masher", "refseq_concatenated.tsv"), "\t"
+        )
+    with open(parameters_path, "w") as handle:
+        json.dump(parameters, handle)
+    return parameters
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description = "Generate a synthetic collection of prophage predictions and refseq_masher matches"
+        )
+    parser.add_argument("project_path", help = "project directory to write prophage_regions/ and refseq_masher/ to")
+    parser.add_argument("-n", "--genomes", type = int, default = 1000, help = "number of genomes (default 1000)")
+    parser.add_argument(
+        "-t", "--tools", nargs = "+", choices = list(tool_profiles), default = list(tool_profiles),
+        help = "prediction tools (default all)"
+        )
+    parser.add_argument("-s", "--seed", type = int, default = 0, help = "random seed (default 0)")
+    parser.add_argument(
+        "-r", "--raw", action = "store_true",
+        help = "also write raw per tool outputs to prophage_predictions/output_<tool>/<genome>/"
+        )
+    args = parser.parse_args()
+    generate_collection(args.project_path, args.genomes, args.tools, args.seed, args.raw)
+    print(f"collection of {args.genomes} genomes x {len(args.tools)} tools in {args.project_path}")
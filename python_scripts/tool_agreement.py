@@ -0,0 +1,155 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+from load_predictions import load_predictions
+from consensus_predictions import assign_clusters
+
+agreement_columns = [
+    "genome", "prediction_tool", "reference_tool",
+    "predicted_size", "reference_size", "overlap_size", "bp_jaccard",
+    "n_predictions", "n_recalled", "recall"
+    ]
+
+#integer arrays for the predictions table: genome code, genome x contig key, genome of each key, tool code,
+#start and end; keys are dense codes of the genome x contig pairs present, ordered by genome, so that they stay
+#below the number of predictions and packing them with coordinates in recalled_by cannot overflow
+def coordinate_arrays(phage_predictions):
+    genome = phage_predictions["genome"].astype("category")
+    contig = phage_predictions["contig"].astype("category")
+    tool = phage_predictions["prediction_tool"].astype("category")
+    genome_codes = genome.cat.codes.to_numpy().astype(np.int64)
+    n_contigs = len(contig.cat.categories)
+    pairs, keys = np.unique(
+        genome_codes * n_contigs + contig.cat.codes.to_numpy().astype(np.int64), return_inverse = True
+        )
+    return (
+        genome.cat.categories, tool.cat.categories,
+        genome_codes, keys.astype(np.int64), pairs // max(n_contigs, 1), tool.cat.codes.to_numpy().astype(np.int64),
+        phage_predictions["prophage_start"].to_numpy(dtype = np.int64),
+        phage_predictions["prophage_end"].to_numpy(dtype = np.int64)
+        )
+
+#union of each tool's intervals per contig, so that base pairs are only counted once per tool
+def merge_tool_intervals(keys, tools, starts, ends, n_tools):
+    order = np.lexsort((starts, keys * n_tools + tools))
+    tool_keys = (keys * n_tools + tools)[order]
+    starts, ends = starts[order], ends[order]
+    clusters = assign_clusters(tool_keys, starts, ends, min_overlap = 0)
+    first = np.flatnonzero(np.diff(clusters, prepend = -1))
+    return keys[order][first], tools[order][first], starts[first], np.maximum.reduceat(ends, first)
+
+#per-segment tool coverage bitmask from a sweep over interval start and end + 1 events
+#each tool's merged intervals are disjoint, so every event toggles that tool's bit
+def coverage_segments(keys, tools, starts, ends):
+    event_keys = np.concatenate([keys, keys])
+    positions = np.concatenate([starts, ends + 1])
+    toggles = np.left_shift(1, np.concatenate([tools, tools]))
+    order = np.lexsort((positions, event_keys))
+    event_keys, positions = event_keys[order], positions[order]
+    masks = np.bitwise_xor.accumulate(toggles[order])
+    segment_length = np.zeros(len(positions), dtype = np.int64)
+    same_contig = event_keys[1:] == event_keys[:-1]
+    segment_length[:-1] = np.where(same_contig, positions[1:] - positions[:-1], 0)
+    return event_keys, masks, segment_length
+
+#flag predictions of one tool that have a prediction of another tool with reciprocal overlap >= min_overlap
+#candidates are found with searchsorted on a contig-offset coordinate and expanded without python loops
+def recalled_by(a_keys, a_starts, a_ends, b_keys, b_starts, b_ends, min_overlap):
+    recalled = np.zeros(len(a_starts), dtype = bool)
+    if len(a_starts) == 0 or len(b_starts) == 0:
+        return recalled
+    offset = int(max(a_ends.max(), b_ends.max())) + 2
+    order = np.lexsort((b_starts, b_keys))
+    b_keys, b_starts, b_ends = b_keys[order], b_starts[order], b_ends[order]
+    b_positions = b_keys * offset + b_starts
+    a_lengths = a_ends - a_starts + 1
+    reach = int((b_ends - b_starts + 1).max())
+    if min_overlap > 0:
+        reach = np.minimum(reach, np.ceil(a_lengths / min_overlap).astype(np.int64))
+    lower = np.searchsorted(b_positions, a_keys * offset + np.maximum(a_starts - reach, 0), "left")
+    upper = np.searchsorted(b_positions, a_keys * offset + a_ends, "right")
+    counts = upper - lower
+    a_index = np.repeat(np.arange(len(a_starts)), counts)
+    b_index = np.repeat(lower - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    overlap = np.minimum(a_ends[a_index], b_ends[b_index]) - np.maximum(a_starts[a_index], b_starts[b_index]) + 1
+    longest = np.maximum(a_lengths[a_index], b_ends[b_index] - b_starts[b_index] + 1)
+    matched = (overlap > 0) & (overlap >= min_overlap * longest)
+    recalled[a_index[matched]] = True
+    return recalled
+
+#bp jaccard and reciprocal-overlap recall for every ordered pair of tools, per genome
+def tool_agreement(phage_predictions, min_overlap = 0.5):
+    genomes, tools, genome_codes, keys, key_genomes, tool_codes, starts, ends = coordinate_arrays(phage_predictions)
+    n_genomes, n_tools = len(genomes), len(tools)
+
+    segment_keys, masks, segment_length = coverage_segments(
+        *merge_tool_intervals(keys, tool_codes, starts, ends, n_tools)
+        )
+    segment_genome = key_genomes[segment_keys]
+    covered = [((masks >> tool) & 1).astype(bool) for tool in range(n_tools)]
+    tool_size = [
+        np.bincount(segment_genome, weights = segment_length * covered[tool], minlength = n_genomes)
+        for tool in range(n_tools)
+        ]
+    tool_rows = [np.flatnonzero(tool_codes == tool) for tool in range(n_tools)]
+    tool_counts = [np.bincount(genome_codes[rows], minlength = n_genomes) for rows in tool_rows]
+
+    agreement = []
+    for a in range(n_tools):
+        for b in range(n_tools):
+            overlap_size = np.bincount(
+                segment_genome, weights = segment_length * (covered[a] & covered[b]), minlength = n_genomes
+                )
+            a_rows, b_rows = tool_rows[a], tool_rows[b]
+            recalled = recalled_by(
+                keys[a_rows], starts[a_rows], ends[a_rows],
+                keys[b_rows], starts[b_rows], ends[b_rows],
+                min_overlap
+                )
+            agreement.append(pd.DataFrame({
+                "genome": genomes,
+                "prediction_tool": tools[a],
+                "reference_tool": tools[b],
+                "predicted_size": tool_size[a].astype(np.int64),
+                "reference_size": tool_size[b].astype(np.int64),
+                "overlap_size": overlap_size.astype(np.int64),
+                "n_predictions": tool_counts[a],
+                "n_recalled": np.bincount(genome_codes[a_rows][recalled], minlength = n_genomes)
+                }))
+    agreement = pd.concat(agreement, ignore_index = True)
+    return add_agreement_metrics(agreement)[agreement_columns]
+
+def add_agreement_metrics(agreement):
+    union_size = agreement["predicted_size"] + agreement["reference_size"] - agreement["overlap_size"]
+    agreement["bp_jaccard"] = agreement["overlap_size"] / union_size.where(union_size > 0)
+    agreement["recall"] = agreement["n_recalled"] / agreement["n_predictions"].where(agreement["n_predictions"] > 0)
+    return agreement
+
+#collection-wide agreement from summed per-genome base pairs and prediction counts
+def collection_agreement(agreement):
+    summed = agreement\
+        .groupby(["prediction_tool", "reference_tool"], observed = True)\
+        [["predicted_size", "reference_size", "overlap_size", "n_predictions", "n_recalled"]]\
+        .sum()\
+        .reset_index()
+    summed.insert(0, "genome", "all")
+    return add_agreement_metrics(summed)[agreement_columns]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description = "Compute pairwise agreement between prophage prediction tools from predicted coordinates"
+        )
+    parser.add_argument("project_path", help = "project directory containing prophage_regions/")
+    parser.add_argument(
+        "-m", "--min-overlap", type = float, default = 0.5,
+        help = "minimum reciprocal overlap for a prediction to be recalled by another tool (default 0.5)"
+        )
+    args = parser.parse_args()
+    agreement = tool_agreement(load_predictions(args.project_path), args.min_overlap)
+    validation_path = os.path.join(os.path.expanduser(args.project_path), "validation")
+    os.makedirs(validation_path, exist_ok = True)
+    agreement.to_csv(os.path.join(validation_path, "tool_agreement.csv"), index = False)
+    collection_agreement(agreement).to_csv(os.path.join(validation_path, "tool_agreement_summary.csv"), index = False)
+    print(f"tool agreement for {agreement['genome'].nunique()} genomes written to {validation_path}")
@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+
+from count_predictions import count_predictions
+
+correlation_columns = [
+    "tool_x", "tool_y", "method", "n", "r", "r_lower", "r_upper", "slope", "intercept"
+    ]
+
+#genome x tool matrix of prediction counts
+def count_matrix(phage_predictions):
+    return count_predictions(phage_predictions)\
+        .pivot_table(
+            index = "genome",
+            columns = "prediction_tool",
+            values = "count_phage_predictions",
+            observed = True
+            )\
+        .fillna(0)
+
+#genome x tool matrix of mean prediction length, 0 where a tool made no predictions
+def mean_length_matrix(phage_predictions):
+    return phage_predictions\
+        .pivot_table(
+            index = "genome",
+            columns = "prediction_tool",
+            values = "length",
+            observed = True
+            )\
+        .fillna(0)
+
+#covariance between all columns of a stack of samples, shape (batch, n, k) -> (batch, k, k)
+def batched_covariance(samples):
+    centered = samples - samples.mean(axis = 1, keepdims = True)
+    return np.einsum("bni,bnj->bij", centered, centered) / (samples.shape[1] - 1)
+
+#correlation, regression slope of column j on column i and its intercept for every column pair in each sample
+def batched_statistics(samples, method):
+    covariance = batched_covariance(samples)
+    variance = np.diagonal(covariance, axis1 = 1, axis2 = 2)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        slope = covariance / variance[:, :, None]
+        intercept = samples.mean(axis = 1)[:, None, :] - slope * samples.mean(axis = 1)[:, :, None]
+        if method == "spearman":
+            import scipy.stats as st
+            covariance = batched_covariance(st.rankdata(samples, axis = 1))
+            variance = np.diagonal(covariance, axis1 = 1, axis2 = 2)
+        r = covariance / np.sqrt(variance[:, :, None] * variance[:, None, :])
+    return r, slope, intercept
+
+#arrays of the size of one resample held at once while its statistics are computed: the sample, its centered
+#copy and for spearman its ranks and their centered copy
+batch_copies = 4
+
+#correlations and regression lines between all tools of a wide genome x tool matrix
+#confidence intervals come from bootstrap resampling indices drawn batch by batch from one seeded stream, which
+#gives the same resamples as drawing them all at once; batches are sized to keep within batch_bytes
+#returns one row per ordered tool pair and the regression confidence bands over each x tool's range
+def tool_correlations(
+        wide, method = "pearson", n_boot = 1000, ci = 95, seed = 0, n_points = 100, batch_bytes = 512 * 1024 ** 2
+        ):
+    values = wide.to_numpy(dtype = np.float64)
+    n, k = values.shape
+    r, slope, intercept = (statistic[0] for statistic in batched_statistics(values[None], method))
+
+    alpha = (100 - ci) / 2
+    r_lower = r_upper = np.full((k, k), np.nan)
+    band_lower = band_upper = np.full((k, k, n_points), np.nan)
+    grid = np.linspace(values.min(axis = 0), values.max(axis = 0), n_points).T
+    if n_boot > 0 and n > 1:
+        rng = np.random.default_rng(seed)
+        batch_size = int(max(1, min(n_boot, batch_bytes // (batch_copies * values.nbytes))))
+        boot_r = np.empty((n_boot, k, k))
+        boot_lines = np.empty((n_boot, k, k, n_points))
+        for start in range(0, n_boot, batch_size):
+            batch = slice(start, min(start + batch_size, n_boot))
+            index = rng.integers(0, n, size = (batch.stop - batch.start, n))
+            batch_r, batch_slope, batch_intercept = batched_statistics(values[index], method)
+            boot_r[batch] = batch_r
+            boot_lines[batch] = batch_intercept[..., None] + batch_slope[..., None] * grid[None, :, None, :]
+        r_lower, r_upper = np.nanpercentile(boot_r, [alpha, 100 - alpha], axis = 0)
+        band_lower, band_upper = np.nanpercentile(boot_lines, [alpha, 100 - alpha], axis = 0)
+
+    tools = wide.columns.astype(str)
+    tool_x, tool_y = np.nonzero(~np.eye(k, dtype = bool))
+    correlations = pd.DataFrame({
+        "tool_x": tools[tool_x],
+        "tool_y": tools[tool_y],
+        "method": method,
+        "n": n,
+        "r": r[tool_x, tool_y],
+        "r_lower": r_lower[tool_x, tool_y],
+        "r_upper": r_upper[tool_x, tool_y],
+        "slope": slope[tool_x, tool_y],
+        "intercept": intercept[tool_x, tool_y]
+        })[correlation_columns]
+    bands = pd.DataFrame({
+        "tool_x": np.repeat(tools[tool_x], n_points),
+        "tool_y": np.repeat(tools[tool_y], n_points),
+        "x": grid[tool_x].ravel(),
+        "lower": band_lower[tool_x, tool_y].ravel(),
+        "upper": band_upper[tool_x, tool_y].ravel()
+        })
+    return correlations, bands
+
+#tool x tool correlation matrix from the pairwise table
+def correlation_matrix(correlations):
+    matrix = correlations.pivot(index = "tool_y", columns = "tool_x", values = "r")
+    for tool in matrix.index.intersection(matrix.columns):
+        matrix.loc[tool, tool] = 1.0
+    return matrix.rename_axis(index = None, columns = None)
+
+#corner pairplot of a wide matrix drawing precomputed regression lines, bands and correlations
+def plot_correlation_pairplot(wide, correlations, bands, binwidth, limits, title, title_y):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    correlations = correlations.set_index(["tool_x", "tool_y"])
+    bands = bands.groupby(["tool_x", "tool_y"])
+
+    def draw(x, y, ax = None, **kws):
+        ax = ax or plt.gca()
+        pair = (str(x.name), str(y.name))
+        line = correlations.loc[pair]
+        band = bands.get_group(pair)
+        ax.fill_between(band["x"], band["lower"], band["upper"], color = "black", alpha = 0.15, linewidth = 0)
+        ax.plot(band["x"], line["intercept"] + line["slope"] * band["x"], color = "black")
+        ax.text(.05, .8, 'r = {:.2f}'.format(line["r"]),
+            transform = ax.transAxes,
+            size = 20)
+        if not np.isnan(line["r_lower"]):
+            ax.text(.05, .7, '[{:.2f}, {:.2f}]'.format(line["r_lower"], line["r_upper"]),
+                transform = ax.transAxes,
+                size = 12)
+
+    g = sns.pairplot(
+        wide,
+        corner = True,
+        kind = "scatter",
+        plot_kws = {
+            'alpha': 0.3
+            },
+        diag_kws = {
+            'alpha' : 0.55,
+            'binwidth' : binwidth
+            }
+        )
+    g.set(
+        ylim = limits,
+        xlim = limits
+        )
+    g.map_lower(draw)
+    g.fig.suptitle(
+        title,
+        y = title_y,
+        x = 0.5,
+        size = 20
+        )
+    return g.fig
@@ -5,8 +5,10 @@
 #desc       :Script for running prophage prediction tools
 #usage		:bash core_alignment.sh <directory/with/multifastas>
 #===========================================================================================================
-source "$(sudo find ~ -maxdepth 4 -name conda.sh)" #find path to conda base environment
-envpath="$(sudo find ~ -maxdepth 3 -name envs)" #set path of conda envs dir
+script_dir="$(dirname "$(readlink -f "$0")")" #set path of shell_scripts dir
+source "$(python3 $script_dir/../python_scripts/resolve_paths.py)" #load cached conda and database paths
+source "$conda_sh" #conda base environment
+envpath="$envs" #set path of conda envs dir
 
 for k in {panaroo,prokka,fasttree}
 	do
@@ -6,12 +6,12 @@
 #usage		:bash genomad.sh <directory/containing/contigs>
 #===========================================================================================================
 
-#find path to conda base environment
-basepath="$(sudo find ~ -maxdepth 4 -name conda.sh)"
-source $basepath
+script_dir="$(dirname "$(readlink -f "$0")")" #set path of shell_scripts dir
+source "$(python3 $script_dir/../python_scripts/resolve_paths.py)" #load cached conda and database paths
+source "$conda_sh" #conda base environment
 
 #create conda environments if not already present
-envpath="$(sudo find ~ -maxdepth 3 -name envs)"
+envpath="$envs"
 for env in genomad
 	do
         if 
@@ -25,9 +25,8 @@ for env in genomad
     done
 
 #set up genomad database
-echo "checking for vibrant database up to 6 subdirectories deep from home"
-dbpath="$(sudo find ~ -maxdepth 4 -type d -name ${env}_db)"
-master_db_dir_path="$(sudo find ~ -maxdepth 5 -name prophage_databases)"
+dbpath="$genomad_db"
+master_db_dir_path="$prophage_databases"
 
 conda activate $env
 if [ -e "$dbpath" ]
@@ -38,11 +37,14 @@ else
     then   
         echo "Genomad database not detected, downloading to $master_db_dir_path directory"
         genomad download-database $master_db_dir_path
+        dbpath=$master_db_dir_path/genomad_db
     else
         echo "Genomad database not detected, downloading to prophage_databases/ in current directory"
         mkdir -p prophage_databases
         genomad download-database prophage_databases
+        dbpath=prophage_databases/genomad_db
     fi
+    python3 $script_dir/../python_scripts/resolve_paths.py --set genomad_db=$(readlink -f $dbpath) > /dev/null
 fi
 
 #run genomad
@@ -6,10 +6,12 @@
 #usage		:bash phageboost.sh <directory/with/contigs>
 #===========================================================================================================
 
-source "$(sudo find ~ -maxdepth 4 -name conda.sh)" #find path to conda base environment
+script_dir="$(dirname "$(readlink -f "$0")")" #set path of shell_scripts dir
+source "$(python3 $script_dir/../python_scripts/resolve_paths.py)" #load cached conda and database paths
+source "$conda_sh" #conda base environment
 
 #create function to obtain requirements from conda
-envpath="$(sudo find ~ -maxdepth 3 -name envs)" #set path of conda envs dir
+envpath="$envs" #set path of conda envs dir
 if [ -e $envpath/PhageBoost-env/ ] 
 then
 	echo "PhageBoost-env conda env present" 
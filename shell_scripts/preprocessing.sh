@@ -1,13 +1,15 @@
 #!/usr/bin/env bash
 #author:    :Gregory Wickham
 #date:      :20240221
-#version    :1.2.2
+#version    :1.4.0
 #desc       :Script to perform batch preprocessing of genomes from short-read sequencing, including read
 #			 trimming, QC, assembly, annotation and seeking closest reference genome match
 #usage		:bash preprocessing.sh --input  <directory/with/short/reads/or/contigs>  --trim --assemble
 #			 <short/hybrid> --annotate --refseq --help 
 #===========================================================================================================
-source "$(sudo find ~ -maxdepth 4 -name conda.sh)" #find path to conda base environment
+script_dir="$(dirname "$(readlink -f "$0")")" #set path of shell_scripts dir
+source "$(python3 $script_dir/../python_scripts/resolve_paths.py)" #load cached conda and database paths
+source "$conda_sh" #conda base environment
 
 alert_banner() {
 	echo ""
@@ -22,15 +24,21 @@ alert_banner() {
 alert="RUNNING GENOME PREPROCESSING PIPELINE WITH OPTIONS: $@"	
 alert_banner
 
+#run a command, recording its wall time, cpu time, peak memory, input size and exit status in the run report
+#usage: timed -s <stage> [-t <tool>] [-g <genome>] [-n <threads>] [-i <inputs>] -- <command>
+timed() {
+	python3 $script_dir/../python_scripts/run_report.py record "$@"
+}
+
 #create function to obtain requirements from conda
-envpath="$(sudo find ~ -maxdepth 3 -name envs)"
+envpath="$envs"
 download_reqs() {
 	if [ -f $envpath/$env/./bin/$env ] 
 	then
 		echo "$env conda env present" 
 	else
 		echo "creating conda env: $env" 
-		conda create -y $env -n $env -c bioconda -c conda-forge
+		timed -s setup -t "conda create $env" -- conda create -y $env -n $env -c bioconda -c conda-forge
 	fi
 }
 
@@ -111,6 +119,10 @@ then
 	fi
 fi
 
+#record every tool run of this run in run_report.jsonl in the input directory, unless a report is already set
+export PROPHAGE_RUN_REPORT="${PROPHAGE_RUN_REPORT:-$(readlink -f ${fasta:-.})/run_report.jsonl}"
+export PROPHAGE_RUN_ID="${PROPHAGE_RUN_ID:-$(date +%Y%m%dT%H%M%S)-$$}"
+
 if [ "$trim" == true ]
 then
 	#create conda env if not already present
@@ -127,6 +139,7 @@ then
 			base=$(basename $k _R1_001.fastq.gz)
 			alert="RUNNING TRIMMOMATIC ON $base"	
 			alert_banner
+			timed -s trim -t trimmomatic -g $base -i $k ${base}_R2_001.fastq.gz -- \
 			trimmomatic \
 				PE \
 				$k \
@@ -163,7 +176,7 @@ then
 		base=$(basename $k _R1_001.fastq.gz) 
 		alert="RUNNING FASTQC ON $base"		
 		alert_banner
-		fastqc $k -o fastqc_reports/
+		timed -s trim -t fastqc -g $base -i $k -- fastqc $k -o fastqc_reports/
 	done
 	conda deactivate
 
@@ -171,7 +184,7 @@ then
 	conda activate multiqc
 	alert="AGGREGATING FASTQC REPORTS WITH MULTIQC"
 	alert_banner
-	multiqc $fasta/fastqc_reports/ -o $fasta/fastqc_reports/
+	timed -s trim -t multiqc -- multiqc $fasta/fastqc_reports/ -o $fasta/fastqc_reports/
 	conda deactivate
 fi
 
@@ -195,6 +208,7 @@ then
 				alert="ASSEMBLING $base WITH SHOVILL" 
 				alert_banner
 				mkdir -p $fasta/assemblies/short_read_assembly_files/$base
+				timed -s assemble -t shovill -g $base -i $k $fasta/trimmed_paired/${base}_R2_001_trim.fastq.gz -- \
 				shovill \
 					--R1 $k \
 					--R2 $fasta/trimmed_paired/${base}_R2_001_trim.fastq.gz \
@@ -211,6 +225,7 @@ then
 				alert="ASSEMBLING $base WITH SHOVILL" 
 				alert_banner
 				mkdir assemblies/short_read_assembly_files/$base
+				timed -s assemble -t shovill -g $base -i $k $fasta/${base}_R2_001_trim.fastq.gz -- \
 				shovill \
 					--R1 $k \
 					--R2 $fasta/${base}_R2_001_trim.fastq.gz \
@@ -248,6 +263,8 @@ then
 					$fasta/${base}_R2_001_trim.fastq.gz
 					$long_read_dirpath/${base}.fastq.gz" 
 				alert_banner
+				timed -s assemble -t unicycler -g $base -n 16 \
+					-i $k $fasta/${base}_R2_001_trim.fastq.gz $long_read_dirpath/${base}.fastq.gz -- \
 				unicycler \
 					-1 $k \
 					-2 $fasta/${base}_R2_001_trim.fastq.gz \
@@ -267,6 +284,8 @@ then
 					$fasta/${base}_R2_001_trim.fastq.gz
 					$long_read_dirpath/${base}.fastq.gz" 
 				alert_banner
+				timed -s assemble -t unicycler -g $base -n 16 \
+					-i $k $fasta/${base}_R2_001_trim.fastq.gz $long_read_dirpath/${base}.fastq.gz -- \
 				unicycler \
 					-1 $k \
 					-2 $fasta/${base}_R2_001_trim.fastq.gz \
@@ -293,7 +312,7 @@ then
 		alert="ASSESSING ASSEMBLY QUALITY OF $base WITH QUAST"		
 		alert_banner
 		mv "${k}" "${k//\_R/}"
-		quast $k -o $fasta/quast_reports/$base;
+		timed -s assemble -t quast -g $base -i $k -- quast $k -o $fasta/quast_reports/$base;
 		done
 	conda deactivate
 fi
@@ -305,15 +324,16 @@ then
 	env=bakta
 	download_reqs
 	#download bakta db if not already present
-	echo "looking for bakta database up to 6 directories deep from home"
-	dbpath="$(sudo find ~ -maxdepth 6 -name bakta.db)"
-	if [ -e $dbpath ] 
+	dbpath="$bakta_db"
+	if [ -e "$dbpath" ] 
 	then
 		echo "Bakta database detected at $dbpath" 
 	else
 		echo "Bakta database downloading to $fasta" 
 		mkdir -p $1/annotated_genomes
-		bakta_db download --output $1/annotated_genomes/ --type full
+		timed -s setup -t "Bakta database" -- bakta_db download --output $1/annotated_genomes/ --type full
+		dbpath=$1/annotated_genomes/db/bakta.db
+		python3 $script_dir/../python_scripts/resolve_paths.py --set bakta_db=$(readlink -f $dbpath) > /dev/null
 	fi
 	#run bakta
 	conda activate bakta
@@ -325,6 +345,7 @@ then
 			alert="ANNOTATING $k WITH BAKTA"	
 			alert_banner
 			mkdir -p $fasta/annotated_genomes/$base/
+			timed -s annotate -t bakta -g $base -i $k -- \
 			bakta \
 				--db $dbpath/.. \
 				--verbose \
@@ -340,6 +361,7 @@ then
 				alert="ANNOTATING $k WITH BAKTA"	
 				alert_banner
 				mkdir -p $fasta/annotated_genomes/$base/
+				timed -s annotate -t bakta -g $base -i $k -- \
 				bakta \
 					--db $dbpath/.. \
 					--verbose \
@@ -362,6 +384,7 @@ then
 	download_reqs
 	conda activate refseq_masher
 	mkdir -p $fasta/refseq_masher
+	refseq_version=$(refseq_masher --version 2>&1 | head -n 1)
 	#create master list
 	echo -e "genome\tclosest_match" > $fasta/refseq_masher/refseq_concatenated.tsv
 	#define function to run refseq and concatenate most likely hit into master list
@@ -369,7 +392,16 @@ then
 		base=$(basename $k | cut -d. -f1)
 		alert="RUNNING REFSEQ MASHER ON $k"		
 		alert_banner
-		refseq_masher -vv matches $k > $fasta/refseq_masher/$base.tsv
+		#reuse matches for a sequence seen before in any project, refseq_masher writes the genome name into its table
+		if ! python3 $script_dir/../python_scripts/result_cache.py fetch $k -o $fasta/refseq_masher \
+			-t refseq_masher -V "$refseq_version" -p "matches" --by-name
+		then
+			rm -f $fasta/refseq_masher/$base.tsv #may be linked to an older cached result
+			timed -s refseq -t refseq_masher -g $base -i $k -- \
+				refseq_masher -vv matches $k > $fasta/refseq_masher/$base.tsv
+			python3 $script_dir/../python_scripts/result_cache.py store $k -o $fasta/refseq_masher \
+				-t refseq_masher -V "$refseq_version" -p "matches" --by-name -f $base.tsv
+		fi
 		sed -n '/sp./p' $fasta/refseq_masher/$base.tsv |
 			sed '1d' |
 				cut -f 1,2 > $fasta/refseq_masher/${base}.sp_temp
@@ -402,4 +434,12 @@ then
 		exit 1
 	fi
 	conda deactivate
-fi
\ No newline at end of file
+fi
+
+#rank the slowest stages and genomes of this run and write its records as run_report.tsv beside the report
+if grep -qs "\"run\": \"$PROPHAGE_RUN_ID\"" $PROPHAGE_RUN_REPORT
+then
+	python3 $script_dir/../python_scripts/run_report.py summary $PROPHAGE_RUN_REPORT \
+		--runs $PROPHAGE_RUN_ID \
+		--tsv ${PROPHAGE_RUN_REPORT%.jsonl}.tsv
+fi
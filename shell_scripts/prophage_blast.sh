@@ -1,12 +1,14 @@
 #!/usr/bin/env bash
 #author:    :Gregory Wickham
 #date:      :18052024
-#version    :1.0.0
+#version    :1.2.0
 #desc       :Script for generate blast database and running local alignment
-#usage		:bash prophage_blast_search.sh
+#usage		:bash prophage_blast_search.sh [project/directory]
 #===========================================================================================================
-source "$(sudo find ~ -maxdepth 4 -name conda.sh)" #find path to conda base environment
-envpath="$(sudo find ~ -maxdepth 3 -name envs)" #set path of conda envs dir
+script_dir="$(dirname "$(readlink -f "$0")")" #set path of shell_scripts dir
+source "$(python3 $script_dir/../python_scripts/resolve_paths.py)" #load cached conda and database paths
+source "$conda_sh" #conda base environment
+envpath="$envs" #set path of conda envs dir
 
 if [ -e $envpath/blast/ ] 
 then
@@ -27,18 +29,42 @@ for k in *.fna
         -hash_index
     done
 
-for k in *.fa 
-    do 
-    blastn \
-        -query $k \
-        -task blastn \
-        -db index/$(basename $k .fa) \
-        -outfmt "10 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore gaps" > $(basename $k .fa)_align.csv \
-        -evalue 1e-200
-    done
+#query the regions extracted once per distinct prediction by prophage_prediction.sh --analyse --input against
+#every reference when the project directory is given and has them, else each .fa against its reference
+regions=${1:-.}/prophage_regions/prophage_sequences.fna
+if [ -n "$1" ] && [ -s $regions ]
+then
+    for k in *.fna
+        do
+        blastn \
+            -query $regions \
+            -task blastn \
+            -db $(basename $k .fna) \
+            -outfmt "10 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore gaps" > prophage_sequences_$(basename $k .fna)_align.csv \
+            -evalue 1e-200
+        done
+    python3 $script_dir/../python_scripts/fasta_index.py lengths $regions > prophage_sequences_count.tsv
+else
+    for k in *.fa 
+        do 
+        blastn \
+            -query $k \
+            -task blastn \
+            -db index/$(basename $k .fa) \
+            -outfmt "10 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore gaps" > $(basename $k .fa)_align.csv \
+            -evalue 1e-200
+        done
+fi
 
-for k in *.fna
+#contig lengths of the references and queries from the .fai index of each fasta, built on first use
+for k in *.fna *.fa
     do 
-    awk '/^>/{if (l!="") print l; print; l=0; next}{l+=length($0)}END{print l}' $k | \
-        paste - - > $(basename $k .fna)_count.tsv
+    [ -e $k ] && python3 $script_dir/../python_scripts/fasta_index.py lengths $k > ${k%.*}_count.tsv
     done
+
+#query and reference coverage, length weighted identity and best reference of each query
+python3 $script_dir/../python_scripts/blast_hits.py \
+    *_align.csv \
+    --lengths *_count.tsv \
+    --output blast_pairs.tsv \
+    --best blast_best_hits.tsv
@@ -1,12 +1,14 @@
 #!/usr/bin/env bash
 #author:    :Gregory Wickham
 #date:      :20240519
-#version    :1.0.0
+#version    :1.2.0
 #desc       :Script for running prophage prediction tools
-#usage		:bash prophage_clustering.sh <directory/with/multifastas>
+#usage		:bash prophage_clustering.sh [project/directory]
 #===========================================================================================================
-source "$(sudo find ~ -maxdepth 4 -name conda.sh)" #find path to conda base environment
-envpath="$(sudo find ~ -maxdepth 3 -name envs)" #set path of conda envs dir
+script_dir="$(dirname "$(readlink -f "$0")")" #set path of shell_scripts dir
+source "$(python3 $script_dir/../python_scripts/resolve_paths.py)" #load cached conda and database paths
+source "$conda_sh" #conda base environment
+envpath="$envs" #set path of conda envs dir
 
 for k in {mmseqs2,raxml-ng,mafft}
 	do
@@ -19,12 +21,27 @@ for k in {mmseqs2,raxml-ng,mafft}
 	fi
 done
 
-cat predictions_fastas/* >> seq_database.fa
+#cluster the regions extracted once per distinct prediction by prophage_prediction.sh --analyse --input when
+#the project has them, which gives every region the same boundaries, else the per tool predicted sequences
+project_dir=${1:-.}
+if [ -s $project_dir/prophage_regions/prophage_sequences.fna ]
+then
+	seq_database=$project_dir/prophage_regions/prophage_sequences.fna
+else
+	cat predictions_fastas/* > seq_database.fa
+	seq_database=seq_database.fa
+fi
 
-mmseqs easy-cluster seq_database.fa clusterRes tmp
+#keep one representative of each group of near identical regions, members are listed in seq_clusters.tsv
+python3 $script_dir/../python_scripts/sketch_cluster.py \
+	$seq_database \
+	-o seq_representatives.fa \
+	-c seq_clusters.tsv
+
+mmseqs easy-cluster seq_representatives.fa clusterRes tmp
 
 conda activate mafft
-mafft --auto seq_database.fa > mse_aln.fa
+mafft --auto seq_representatives.fa > mse_aln.fa
 
 conda activate raxml
-raxml-ng --all --msa seq_database.fa --model LG+G8+F --tree pars{10} --bs-trees 200
\ No newline at end of file
+raxml-ng --all --msa seq_representatives.fa --model LG+G8+F --tree pars{10} --bs-trees 200
\ No newline at end of file
@@ -1,11 +1,13 @@
 #!/usr/bin/env bash
 #author:    :Gregory Wickham
 #date:      :20240328
-#version    :1.5.1
+#version    :1.12.1
 #desc       :Script for running prophage prediction tools
 #usage		:bash prophage_prediction.sh <directory/with/contigs>
 #===========================================================================================================
-source "$(sudo find ~ -maxdepth 4 -name conda.sh)" #find path to conda base environment
+script_dir="$(dirname "$(readlink -f "$0")")" #set path of shell_scripts dir
+source "$(python3 $script_dir/../python_scripts/resolve_paths.py)" #load cached conda and database paths
+source "$conda_sh" #conda base environment
 
 alert_banner() {
 	echo ""
@@ -20,8 +22,19 @@ alert_banner() {
 alert="RUNNING PROPHAGE PREDICTION PIPELINE WITH OPTIONS: $@"	
 alert_banner
 
-master_db_dir_path="$(sudo find ~ -maxdepth 5 -name prophage_databases)" #set path of prophage_databases dir
-envpath="$(sudo find ~ -maxdepth 3 -name envs)" #set path of conda envs dir
+master_db_dir_path="$prophage_databases" #set path of prophage_databases dir
+envpath="$envs" #set path of conda envs dir
+
+#cache the path of a newly downloaded database so later runs do not search for it
+record_path() {
+	python3 $script_dir/../python_scripts/resolve_paths.py --set "$1=$(readlink -f "$2")" > /dev/null
+}
+
+#run a command, recording its wall time, cpu time, peak memory, input size and exit status in the run report
+#usage: timed -s <stage> [-t <tool>] [-g <genome>] [-n <threads>] [-i <inputs>] -- <command>
+timed() {
+	python3 $script_dir/../python_scripts/run_report.py record "$@"
+}
 
 #create function to obtain requirements from conda
 download_reqs() {
@@ -30,7 +43,7 @@ download_reqs() {
 		echo "$env conda env present" 
 	else
 		echo "creating conda env: $env" 
-		conda create $env -n $env -c bioconda -c conda-forge -y
+		timed -s setup -t "conda create $env" -- conda create $env -n $env -c bioconda -c conda-forge -y
 	fi
 }
 
@@ -106,7 +119,15 @@ then
 	echo "-g --genomad      : run GeNomad for prophage prediction"
 	echo "-s  --virsorter   : run VirSorter for prophage prediction"
     echo "-b  --phageboost  : run PhageBoost for prophage prediction"
+    echo "-a  --analyse     : parse and aggregate predictions, with -i also extract regions from the assemblies"
 	echo "-h --help         : show options"
+	echo ""
+	echo "To run VIBRANT, VirSorter, GeNomad and PhageBoost concurrently across genomes within a core and memory"
+	echo "budget, resuming interrupted runs, use python_scripts/run_predictions.py, then --analyse"
+	echo "With --batch-size <Mbp> it runs each tool on batches of genomes, loading its databases once per batch"
+	echo ""
+	echo "Time, CPU, peak memory and exit status of every tool run are recorded in <outdir>/run_report.jsonl"
+	echo "(or \$PROPHAGE_RUN_REPORT), rank the slowest with python_scripts/run_report.py summary <report>"
 fi
 
 #define input location as $assembly variable
@@ -151,115 +172,33 @@ then
     output_dir="."
 fi
 
+#record every tool run and python step of this run in $output_dir/run_report.jsonl, unless a report is already set
+export PROPHAGE_RUN_REPORT="${PROPHAGE_RUN_REPORT:-$(readlink -f $output_dir)/run_report.jsonl}"
+export PROPHAGE_RUN_ID="${PROPHAGE_RUN_ID:-$(date +%Y%m%dT%H%M%S)-$$}"
+
 if [ "$phastest" == true ]
 then
-    #run PHASTEST submit script
+    #submit genomes to PHASTEST web service, job IDs are kept in $output_dir/phastest_submissions.json
     if [ "$4" == "submit" ] || [ "$4" == "Submit" ]
     then
-        #submit genomes to PHASTEST web service
-        echo "submitting genomes to PHASTEST web server in path $assembly"
-        for k in $assembly/*.f*
-            do
-                base=$(basename $k | cut -f 1 -d '.')
-                echo $base
-                if (( $(grep -o '>' $k | wc -l) == 1 ))
-                    then
-                        alert="RUNNING PHASTEST ON SINGLE CONTIG ASSEMBLY $k"
-                        alert_banner
-                        wget \
-                            --post-file="$k" \
-                            "https://phastest.ca/phastest_api" \
-                            -O $output_dir/$base.txt
-                    elif (( $(grep -o '>' $k | wc -l) > 1 ))
-                    then   
-                        alert="RUNNING PHASTEST ON MULTIFASTA ASSEMBLY $k"
-                        alert_banner
-                        wget \
-                            --post-file="$k" \
-                            "https://phastest.ca/phastest_api?contigs=1" \
-                            -O $output_dir/$base.txt
-                    else 
-                        echo "ERROR: No .fasta files found in $assembly"
-                fi
-        done    
-        #acquire submitted filenames and PHASTEST submission ID
-        > $output_dir/submitted_genome_names.temp
-        > $output_dir/submitted_genome_IDs.temp
-        > $output_dir/submitted_genomes.csv
-        for k in $output_dir/*.txt
-        do
-            echo $(basename $k .txt) >> $output_dir/submitted_genome_names.temp
-            cut -d'"' -f4 $k >> $output_dir/submitted_genome_IDs.temp
-        done
-        echo "genome,submission_ID" > $output_dir/submitted_genomes.temp
-        paste \
-            -d ',' \
-            $output_dir/submitted_genome_names.temp \
-            $output_dir/submitted_genome_IDs.temp \
-            >> $output_dir/submitted_genomes.temp
-        tr -d '\r' < submitted_genomes.temp > submitted_genomes.csv
-        rm  $output_dir/*.txt  $output_dir/*.temp
-    #run phastest retrieve script
+        alert="SUBMITTING GENOMES IN $assembly TO PHASTEST"
+        alert_banner
+        timed -s phastest -t submit -i $assembly -- \
+            python3 $script_dir/../python_scripts/phastest_client.py submit \
+            -i $assembly \
+            -o $output_dir
+    #check submitted jobs and download those reported complete to $output_dir/output_PHASTEST
     elif [ "$4" == "retrieve" ] || [ "$4" == "Retrieve" ]
     then
-        if [ -e $output_dir/submitted_genomes.csv ]
+        if [ -e $output_dir/phastest_submissions.json ] || [ -e $output_dir/submitted_genomes.csv ]
         then
-            echo "submitted_genomes.csv found in $output_dir"
+            echo "PHASTEST submissions found in $output_dir"
         else
-            echo "ERROR: Submitted_genomes.csv not found. Please use directory containing submitted_genomes.csv as --input"
+            echo "ERROR: phastest_submissions.json not found. Please use directory containing phastest_submissions.json as --outdir"
         fi
-        #get zip files from PHASTEST server based on list of IDs from submitted_genomes.csv
-        while IFS="," read field1 field2
-            do
-                curl "https://phastest.ca/submissions/${field2}.zip" --output $field1.zip
-            done < <(tail -n +2 $output_dir/submitted_genomes.csv)
-        #remove empty zip files, extract zip files to output directory, if not already present
-        for k in $output_dir/*.zip
-            do
-                base=$(basename $k .zip)
-                if (( $(du -k "$k" | cut -f 1) < 250))
-                then
-                    echo "$k empty, PHASTEST not yet complete"
-                elif [ -e "$output_dir/output_PHASTEST/$base/summary.txt" ]
-                then
-                    echo "$k already present"
-                else
-                    echo "$k PHASTEST complete"
-                    mkdir -p $output_dir/output_PHASTEST/$base 
-                    unzip $k -d $output_dir/output_PHASTEST/$base
-                fi
-                rm -r $k
-            done
-        #remove query files from previous runs
-        > $output_dir/finished_queries.temp
-        > $output_dir/unfinished_queries.temp
-        > $output_dir/finished_queries.csv
-        > $output_dir/unfinished_queries.csv
-        #populate query files if run has completed based on successful zip extraction, or if run has not
-        while IFS="," read field1 field2
-            do
-                if 
-                    [ -e $output_dir/output_PHASTEST/$field1/summary.txt ]
-                then
-                    echo "Completed $field1 predictions downloaded to $output_dir/output_PHASTEST/$field1"
-                    echo "$field1,http://phastest.ca/phastest?acc=$field2" >> $output_dir/finished_queries.temp
-                else
-                    echo "$field1,http://phastest.ca/phastest?acc=$field2" >> $output_dir/unfinished_queries.temp
-                fi
-            done < <(tail -n +2 $output_dir/submitted_genomes.csv)
-        for k in {finished,unfinished}
-            do
-                if 
-                    [ -e $output_dir/${k}_queries.temp ]
-                then
-                    echo "genome,submission_ID" > ${k}_queries.csv
-                    paste \
-                        -d ',' \
-                        ${k}_queries.temp \
-                        >> ${k}_queries.csv
-                    rm ${k}_queries.temp
-                fi
-            done
+        timed -s phastest -t retrieve -- \
+            python3 $script_dir/../python_scripts/phastest_client.py retrieve \
+            -o $output_dir
     else
         echo "ERROR: No valid input specified for option --phastest: please use 'submit' or 'retrieve'"
     fi
@@ -272,8 +211,7 @@ then
     env=vibrant
     download_reqs
     #set up VIBRANT database
-    echo "checking for VIBRANT database up to 6 subdirectories deep from home"
-    dbpath="$(sudo find ~ -maxdepth 6 -type d -iname vibrant_db)"
+    dbpath="$vibrant_db"
     conda activate $env
     if [ -e "$dbpath" ]
     then
@@ -283,23 +221,26 @@ then
         then   
             echo "VIBRANT database not detected, downloading to $master_db_dir_path directory"
             mkdir -p $master_db_dir_path/VIBRANT_db
-            download-db.sh $master_db_dir_path/VIBRANT_db/
+            timed -s setup -t "VIBRANT database" -- download-db.sh $master_db_dir_path/VIBRANT_db/
+            dbpath=$master_db_dir_path/VIBRANT_db
         else
             echo "VIBRANT database not detected, downloading to prophage_databases/ in $output_dir directory"
             mkdir -p $output_dir/prophage_databases/VIBRANT_db
-            download-db.sh $output_dir/prophage_databases/VIBRANT_db/
+            timed -s setup -t "VIBRANT database" -- download-db.sh $output_dir/prophage_databases/VIBRANT_db/
+            dbpath=$output_dir/prophage_databases/VIBRANT_db
         fi
+        record_path vibrant_db $dbpath
     fi
     #run VIBRANT
     if ( ls $assembly/*.f* >/dev/null 2>&1 )
     then
         for k in $assembly/*.f*
             do
-                dbpath="$(sudo find ~ -maxdepth 6 -type d -iname vibrant_db)"
                 base=$(basename $k | cut -d. -f1)
                 alert="RUNNING VIBRANT ON ASSEMBLY $k"
                 alert_banner
                 mkdir -p $output_dir/output_VIBRANT/$base/;
+                timed -s prediction -t VIBRANT -g $base -i $k -- \
                 VIBRANT_run.py \
                     -i $k \
                     -folder $output_dir/output_VIBRANT/$base \
@@ -328,8 +269,7 @@ then
     fi
     #set up VirSorter2 database
     conda activate virsorter
-    echo "checking for VirSorter2 database up to 6 subdirectories deep from home"
-    dbpath="$(sudo find ~ -maxdepth 6 -type d -iname VirSorter_db)"
+    dbpath="$virsorter_db"
     if [ -d "$dbpath" ]
     then
         echo "VirSorter2 database detected" 
@@ -337,12 +277,15 @@ then
         if [ -d "$master_db_dir_path" ]
         then
             echo "Virsorter2 database not detected, downloading to $master_db_dir_path directory"
-            virsorter setup -d $master_db_dir_path/VirSorter_db/ -j 4
+            timed -s setup -t "VirSorter database" -- virsorter setup -d $master_db_dir_path/VirSorter_db/ -j 4
+            dbpath=$master_db_dir_path/VirSorter_db
         else
             echo "Virsorter2 database not detected, downloading to prophage_databases/ in $output_dir directory"
             mkdir $output_dir/prophage_databases/
-            virsorter setup -d $output_dir/prophage_databases/VirSorter_db/ -j 4
+            timed -s setup -t "VirSorter database" -- virsorter setup -d $output_dir/prophage_databases/VirSorter_db/ -j 4
+            dbpath=$output_dir/prophage_databases/VirSorter_db
         fi
+        record_path virsorter_db $dbpath
     fi
     #run VirSorter
     if ( ls $assembly/*.f* >/dev/null 2>&1 )
@@ -353,6 +296,7 @@ then
                 alert="RUNNING VIRSORTER ON ASSEMBLY $k"
                 alert_banner
                 mkdir -p $output_dir/output_VirSorter/$base/;
+                timed -s prediction -t VirSorter -g $base -i $k -- \
                 virsorter \
                     run \
                     -w $output_dir/output_VirSorter/$base \
@@ -373,8 +317,7 @@ then
     env=genomad
     download_reqs
     #set up GeNomad database
-    echo "checking for GeNomad database up to 6 subdirectories deep from home"
-    dbpath="$(sudo find ~ -maxdepth 6 -type d -iname GeNomad_db)"
+    dbpath="$genomad_db"
     conda activate $env
     if [ -e "$dbpath" ]
     then
@@ -383,23 +326,26 @@ then
         if [ -d "$master_db_dir_path" ]
         then   
             echo "Genomad database not detected, downloading to $master_db_dir_path directory"
-            genomad download-database $master_db_dir_path
+            timed -s setup -t "GeNomad database" -- genomad download-database $master_db_dir_path
+            dbpath=$master_db_dir_path/genomad_db
         else
             echo "Genomad database not detected, downloading to prophage_databases/ in $output_dir directory"
             mkdir -p $output_dir/prophage_databases
-            genomad download-database $output_dir/prophage_databases
+            timed -s setup -t "GeNomad database" -- genomad download-database $output_dir/prophage_databases
+            dbpath=$output_dir/prophage_databases/genomad_db
         fi
+        record_path genomad_db $dbpath
     fi
     #run GeNomad
     if ( ls $assembly/*.f* >/dev/null 2>&1 )
     then
         for k in $assembly/*.f*
             do
-                dbpath="$(sudo find ~ -maxdepth 6 -type d -iname GeNomad_db)"
                 base=$(basename $k | cut -d. -f1)
                 alert="RUNNING GENOMAD ON ASSEMBLY $k"
                 alert_banner
                 mkdir -p $output_dir/output_GeNomad/$base/;
+                timed -s prediction -t GeNomad -g $base -i $k -- \
                 genomad \
                     end-to-end \
                     --cleanup \
@@ -421,7 +367,7 @@ then
         echo "PhageBoost-env conda env present" 
     else
         echo "creating conda env: PhageBoost-env" 
-        conda create -y -n PhageBoost-env python=3.7
+        timed -s setup -t "conda create PhageBoost-env" -- conda create -y -n PhageBoost-env python=3.7
         conda activate PhageBoost-env
         pip install typing_extensions pyrodigal==0.7.2 xgboost==1.0.2 git+https://github.com/ku-cbd/PhageBoost 
         conda deactivate
@@ -436,6 +382,7 @@ then
                 alert="RUNNING PHAGEBOOST ON GENOME $base"
                 alert_banner
                 mkdir -p $output_dir/output_PhageBoost/$base/;
+                timed -s prediction -t PhageBoost -g $base -i $k -n 15 -- \
                 PhageBoost \
                     -f $k \
                     -o $output_dir/output_PhageBoost/$base \
@@ -458,12 +405,20 @@ then
         echo "creating $output_dir/prophage_predictions/ directory"
     fi
 
-    if ( ls $output_dir/output* >/dev/null 2>&1 )
+    #merge new outputs genome by genome so that earlier runs are kept
+    if ( ls -d $output_dir/output_* >/dev/null 2>&1 )
     then
-        mv $output_dir/output* $output_dir/prophage_predictions
+        for k in $output_dir/output_*/*
+        do
+            tool_dir=$output_dir/prophage_predictions/$(basename $(dirname $k))
+            mkdir -p $tool_dir
+            rm -rf $tool_dir/$(basename $k)
+            mv $k $tool_dir/
+        done
+        rmdir $output_dir/output_*
     fi
 
-    ###get predicted prophage regions
+    ###get prediction tool outputs
     output_list=($(ls $output_dir/prophage_predictions))
     if [ -z $output_list ]
     then 
@@ -473,137 +428,76 @@ then
         tool_list=${output_list[@]//"output_"/}
     fi
 
-    for k in $output_dir/prophage_predictions/${output_list[0]}/*
-    do
-        base=$(basename $k)
-        outpath="$output_dir/prophage_regions/$base/${base}"
-        inpath="$output_dir/prophage_predictions/output"
-        mkdir -p $output_dir/prophage_regions/$base
-        echo "creating $(dirname $outpath) directory"
-        ###copy prophage stats
-        echo "aggregating $base predictions"
-        ##GeNomad
-        if [[ ${output_list[@]} == *"output_GeNomad"* ]]
-        then
-            cp ${inpath}_GeNomad/$base/${base}_summary/${base}_virus_genes.tsv \
-                ${outpath}_GeNomad_summary.tsv
-            cp ${inpath}_GeNomad/$base/${base}_summary/${base}_virus.fna \
-                ${outpath}_GeNomad_prophage_regions.fna
-            #remove locus tag suffixes
-            cut -f1 ${outpath}_GeNomad_summary.tsv |
-                sed 's/_[^_]*$//' |
-                    sed 's/\(.*\)_/\1,/'|
-                        sed 's/\(.*\)_/\1,/'|
-                                sed s/"|provirus"// |
-                                    sed '1d' |
-                                        awk '!seen[$0]++' > ${outpath}_GeNomad_summary.temp
-        fi
-        ##phastest
-        if [[ ${output_list[@]} == *"output_PHASTEST"* ]]
-        then
-            cp ${inpath}_PHASTEST/$base/summary.txt ${outpath}_PHASTEST_summary.tsv
-            cp ${inpath}_PHASTEST/$base/phage_regions.fna ${outpath}_PHASTEST_prophage_regions.fna
-            sed 's/^[ \t]*//' ${outpath}_PHASTEST_summary.tsv |
-                sed -e '1,/REGION*/d' |
-                    sed 's/ \+ /\t/g' |
-                        cut -f5 |
-                            cut -d "," -f1,7 |
-                                tr -s ':' ',' |
-                                    cut -d "," -f1,3 |
-                                        tr -s '-' ',' |
-                                            sed '1d' > ${outpath}_PHASTEST_summary.temp
-            if (( $(head -n1 ${outpath}_PHASTEST_summary.temp | grep -o "," | wc -l) == 1 ))
-            then
-                echo "filling blank col with "contig""
-                awk -v OFS=',' '{ print "contig", $0}' ${outpath}_PHASTEST_summary.temp > ${outpath}_PHASTEST_summary.temp2
-                cp ${outpath}_PHASTEST_summary.temp2 ${outpath}_PHASTEST_summary.temp
-            fi
-        fi
+    ###get predicted prophage regions
+    #parse new or changed tool outputs in place into per-genome and concatenated summary files
+    alert="PARSING PREDICTED PROPHAGE REGIONS"
+    alert_banner
+    timed -s analyse -t parse_predictions -i $output_dir/prophage_predictions -n $(nproc) -- \
+    python3 $script_dir/../python_scripts/parse_predictions.py \
+        $output_dir/prophage_predictions \
+        $output_dir/prophage_regions \
+        --threads $(nproc) \
+        --changed $output_dir/prophage_regions/changed_genomes.txt
 
-        ##vibrant
-        if [[ ${output_list[@]} == *"output_VIBRANT"* ]]
-        then
-            cp ${inpath}_VIBRANT/$base/VIBRANT_$base/VIBRANT_results_${base}/VIBRANT_integrated_prophage_coordinates_${base}.tsv \
-                ${outpath}_VIBRANT_summary_lysogenic.tsv
-            cp ${inpath}_VIBRANT/$base/VIBRANT_$base/VIBRANT_results_${base}/VIBRANT_summary_results_${base}.tsv \
-                ${outpath}_VIBRANT_summary_lytic.tsv
-            cp ${inpath}_VIBRANT/$base/VIBRANT_$base/VIBRANT_phages_${base}/${base}.phages_combined.fna \
-                ${outpath}_VIBRANT_prophage_regions.fna
-            tr -d ',' <${outpath}_VIBRANT_summary_lysogenic.tsv |
-                tr -s '\t' ',' |
-                    cut -f1,6,7 -d',' |
-                        sed '1d' | 
-                            awk 'BEGIN{FS=OFS=","} {sub(/ .*/,"",$1)} 1' > ${outpath}_VIBRANT_summary.temp
-            tr -d ',' <${outpath}_VIBRANT_summary_lytic.tsv |
-                tr -s ' ' ',' |
-                    sed '/fragment/d' |
-                        cut -f1,2 -d',' |
-                            sed 's/len=/1,/g' |
-                                sed '1d' >> ${outpath}_VIBRANT_summary.temp
-        fi
-        ##VirSorter 
-        if [[ ${output_list[@]} == *"output_VirSorter"* ]]
-        then
-            cp ${inpath}_VirSorter/$base/final-viral-boundary.tsv ${outpath}_VirSorter_summary.tsv
-            cp ${inpath}_VirSorter/$base/final-viral-combined.fa ${outpath}_VirSorter_prophage_regions.fna
-            cut -f1,4,5 ${outpath}_VirSorter_summary.tsv |
-                sed '1d' > ${outpath}_VirSorter_summary.temp
-        fi
-        ##PhageBoost
-        if [[ ${output_list[@]} == *"output_PhageBoost"* ]]
+    #with the assemblies given by --input, slice each distinct predicted region once from them into
+    #prophage_regions/prophage_sequences.fna, which CheckV, prophage_clustering.sh and prophage_blast.sh read,
+    #rather than copying every tool's predicted sequences per genome
+    if [ "$input" == true ]
+    then
+        alert="EXTRACTING PREDICTED PROPHAGE REGIONS FROM ASSEMBLIES IN $assembly"
+        alert_banner
+        timed -s analyse -t extract_regions -i $assembly -n $(nproc) -- \
+        python3 $script_dir/../python_scripts/extract_regions.py \
+            $output_dir/prophage_regions/concatenated_predictions_summary.csv \
+            $assembly \
+            -o $output_dir/prophage_regions/prophage_sequences.fna \
+            --threads $(nproc)
+    else
+        #aggregate predicted sequences of reparsed genomes only
+        genomes=$(cat $output_dir/prophage_regions/changed_genomes.txt)
+        #regions extracted by an earlier run with --input no longer match the predictions and were read instead of
+        #the aggregated sequences, which are then missing for unchanged genomes, so all genomes are aggregated
+        if [ -e $output_dir/prophage_regions/prophage_sequences.fna ]
         then
-            cp ${inpath}_PhageBoost/$base/phages_$base.gff ${outpath}_PhageBoost_summary.tsv
-            cat ${inpath}_PhageBoost/$base/*.fasta > ${outpath}_PhageBoost_prophage_regions.fna
-            tr -s '[:blank:]' ',' <${outpath}_PhageBoost_summary.tsv |
-                sed '2d' |
-                    cut -f1,4,5 -d',' > ${outpath}_PhageBoost_summary.temp
+            rm -f $output_dir/prophage_regions/prophage_sequences.fna*
+            genomes=$(ls $output_dir/prophage_predictions/output_* | grep -v ":$" | sort -u)
         fi
-        ##create master 
-        echo "contig,prophage_start,prophage_end,genome,prediction_tool,length" > ${outpath}_predictions_summary.csv
-        ##perform tool specific actions
-        >$output_dir/prophage_regions/$base/merged_${base}_prophage_regions.fna
-        for tool in $tool_list
+        for base in $genomes
         do
-            #replace fasta header with seq number
-            awk '/^>/{print ">" ++i; next}{print}' \
-                ${outpath}_${tool}_prophage_regions.fna \
-                > ${outpath}_${tool}_prophage_regions_temp.fna
-            mv ${outpath}_${tool}_prophage_regions_temp.fna \
-                ${outpath}_${tool}_prophage_regions.fna
-            sed -i "s/^>/>${base}_${tool}_prediction_/" \
-                ${outpath}_${tool}_prophage_regions.fna
-            cat ${outpath}_${tool}_prophage_regions.fna \
-                >> $output_dir/prophage_regions/$base/merged_${base}_prophage_regions.fna
-            #combine predictions into single file
-            tr -s '-' ',' <${outpath}_${tool}_summary.temp |
-                tr -s '[:blank:]' ',' |
-                    awk -v base="$base" -F"," 'BEGIN { OFS = "," } {$4=base; print}' |
-                        awk -v tool="$tool" -F"," 'BEGIN { OFS = "," } {$5=tool; print}' |
-                            awk -F, -v OFS="," '{$6=$3-$2+1}1' |
-                                awk -F',' '$6>1000' |
-                                    cat >> ${outpath}_predictions_summary.csv
+            outpath="$output_dir/prophage_regions/$base/${base}"
+            inpath="$output_dir/prophage_predictions/output"
+            mkdir -p $output_dir/prophage_regions/$base
+            echo "creating $(dirname $outpath) directory"
+            ###copy prophage sequences
+            #renumber each tool's sequences as <genome>_<tool>_prediction_<n> and merge them in one pass
+            echo "aggregating $base predicted sequences"
+            sources=()
+            for tool in $tool_list
+            do
+                case $tool in
+                    GeNomad) fastas="${inpath}_GeNomad/$base/${base}_summary/${base}_virus.fna" ;;
+                    PHASTEST) fastas="${inpath}_PHASTEST/$base/phage_regions.fna" ;;
+                    VIBRANT) fastas="${inpath}_VIBRANT/$base/VIBRANT_$base/VIBRANT_phages_${base}/${base}.phages_combined.fna" ;;
+                    VirSorter) fastas="${inpath}_VirSorter/$base/final-viral-combined.fa" ;;
+                    PhageBoost) fastas="$(ls ${inpath}_PhageBoost/$base/*.fasta 2> /dev/null)" ;;
+                esac
+                sources+=(--source ${base}_${tool}_prediction_ ${outpath}_${tool}_prophage_regions.fna $fastas)
+            done
+            timed -s analyse -t merge_regions -g $base -- \
+            python3 $script_dir/../python_scripts/fasta_index.py merge \
+                -o $output_dir/prophage_regions/$base/merged_${base}_prophage_regions.fna \
+                "${sources[@]}"
         done
-        rm $outpath*temp* $outpath*.tsv
-    done
-    #concatenate summary files together
-    echo "contig,prophage_start,prophage_end,genome,prediction_tool,length" \
-        > $output_dir/prophage_regions/concatenated_predictions_summary.csv
-    for k in $output_dir/prophage_regions/*/
-    do
-        base=$(basename $k)
-        echo "concatenating $k"
-        cat $k/${base}_predictions_summary.csv |
-            sed '1d' >> $output_dir/prophage_regions/concatenated_predictions_summary.csv
-    done
+    fi
 
     #run checkv on prophage regions
     env=checkv
     download_reqs
     conda activate checkv
-    pip install diamond
+    #diamond is installed into the checkv env once rather than on every run
+    command -v diamond > /dev/null || conda install -n checkv -c bioconda -c conda-forge diamond -y
     #set up checkV database
-    echo "checking for CheckV database up to 6 subdirectories deep from home"
-    dbpath="$(sudo find ~ -maxdepth 6 -type d -iname "checkv-db*")"
+    dbpath="$checkv_db"
     if [ -e "$dbpath" ]
     then
         echo "CheckV database detected at $dbpath" 
@@ -611,25 +505,35 @@ then
         if [ -d "$master_db_dir_path" ]
         then   
             echo "CheckV database not detected, downloading to $master_db_dir_path directory"
-            checkv download_database $master_db_dir_path
+            timed -s setup -t "CheckV database" -- checkv download_database $master_db_dir_path
+            dbpath="$(ls -d $master_db_dir_path/checkv-db* | head -n 1)"
         else
             echo "CheckV database not detected, downloading to prophage_databases/ in $output_dir directory"
             mkdir -p $output_dir/prophage_databases
-            checkv download_database $output_dir/prophage_databases
+            timed -s setup -t "CheckV database" -- checkv download_database $output_dir/prophage_databases
+            dbpath="$(ls -d $output_dir/prophage_databases/checkv-db* | head -n 1)"
         fi
+        record_path checkv_db $dbpath
     fi
+    conda deactivate
 
-    for k in $output_dir/prophage_regions/*/merged*.fna
-    do
-        base=$(basename $k _prophage_regions.fna)
-        alert="running checkv on $base"
-        alert_banner
-        mkdir -p $(dirname $k)/${base}_checkv
-        checkv \
-            end_to_end \
-            $k \
-            $(dirname $k)/${base}_checkv \
-            -t 8 \
-            -d "$(sudo find ~ -maxdepth 6 -type d -iname "checkv-db*")"
-    done
-fi
\ No newline at end of file
+    #pool regions of all genomes into balanced shards run concurrently, then split the quality summaries back
+    #per genome and join them onto the predictions in checkv_predictions_summary.csv
+    #shards are managed by the analysis python, which has pandas, and run in the checkv env with conda run
+    alert="RUNNING CHECKV ON PROPHAGE REGIONS"
+    alert_banner
+    timed -s analyse -t checkv -i $output_dir/prophage_regions -n $(nproc) -- \
+    python3 $script_dir/../python_scripts/checkv_shards.py \
+        $output_dir \
+        --db "$dbpath" \
+        --cores $(nproc) \
+        --conda
+fi
+
+#rank the slowest stages and genomes of this run and write its records as run_report.tsv beside the report
+if grep -qs "\"run\": \"$PROPHAGE_RUN_ID\"" $PROPHAGE_RUN_REPORT
+then
+    python3 $script_dir/../python_scripts/run_report.py summary $PROPHAGE_RUN_REPORT \
+        --runs $PROPHAGE_RUN_ID \
+        --tsv ${PROPHAGE_RUN_REPORT%.jsonl}.tsv
+fi
@@ -6,12 +6,12 @@
 #usage		:bash virsorter.sh <directory/containing/contigs/>
 #===========================================================================================================
 
-#find path to conda base environment
-basepath="$(sudo find ~ -maxdepth 4 -name conda.sh)"
-source $basepath
+script_dir="$(dirname "$(readlink -f "$0")")" #set path of shell_scripts dir
+source "$(python3 $script_dir/../python_scripts/resolve_paths.py)" #load cached conda and database paths
+source "$conda_sh" #conda base environment
 
 #create conda environments if not already present
-envpath="$(sudo find ~ -maxdepth 3 -name envs)"
+envpath="$envs"
 for env in virsorter
 	do
         if 
@@ -27,8 +27,8 @@ for env in virsorter
     done
 
 #set up virsorter2 database
-dbpath="$(sudo find ~ -maxdepth 4 -type d -name ${env}_db)"
-master_db_dir_path="$(sudo find ~ -maxdepth 5 -name prophage_databases)"
+dbpath="$virsorter_db"
+master_db_dir_path="$prophage_databases"
 
 conda activate $env
 if [ -d "$dbpath" ]
@@ -39,11 +39,14 @@ else
     then
         echo "Virsorter2 database not detected, downloading to $master_db_dir_path directory"
         $env setup -d $master_db_dir_path/virsorter_db/ -j 4
+        dbpath=$master_db_dir_path/virsorter_db
     else
         echo "Virsorter2 database not detected, downloading to prophage_databases/ in $1 directory"
         mkdir $1/prophage_databases/
         $env setup -d $1/prophage_databases/virsorter_db/ -j 4
+        dbpath=$1/prophage_databases/virsorter_db
     fi
+    python3 $script_dir/../python_scripts/resolve_paths.py --set virsorter_db=$(readlink -f $dbpath) > /dev/null
 fi
 
 #run virsorter